@@ -1,16 +1,32 @@
 import os
 import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
 import traceback
-import random
 from src import config
 from src import (
+    asset_cache,
+    bundle,
+    calibrate,
+    contact_sheet,
     data_fetcher,
+    dedup,
     icon_manager,
     image_generator,
+    metrics,
     name_parser,
+    prefetch,
+    profiler as profiling,
+    scheduler,
+    stage_manifest,
     translation,
     utils,
+    verify,
     video_generator,
+    work_queue,
 )
 
 def print_help():
@@ -20,7 +36,8 @@ def print_help():
     This script generates videos from audio files and images.
 
     Usage:
-    python main.py
+    python main.py [options]
+    python main.py prefetch
 
     Instructions:
     1. Place your audio folders (e.g., 'champion_vo_audio') in the same directory as this script.
@@ -32,8 +49,157 @@ def print_help():
 
     Arguments:
     -h, --help: Show this help message.
+    --language CODE: Language code to use instead of asking (e.g., EN, TR, ES).
+    --silence SECONDS: Silence between concatenated audio tracks instead of asking.
+    --renditions LIST: Comma-separated videos to write per event (default: 1080p).
+                       Available: 1080p (16:9), 720p (16:9), vertical (9:16 shorts).
+    --output-profile NAME: Container and codecs of the videos (default: mp4).
+                           mp4: H.264 with AAC audio.
+                           mkv: H.264, original audio copied without re-encoding when possible.
+                           webm: VP9, original Vorbis/Opus audio copied when possible.
+    --encoder-profile NAME: Encoder settings of the videos (default: balanced).
+                            balanced: 25 fps, x264 superfast CRF 25.
+                            fast: 25 fps, x264 ultrafast CRF 28.
+                            quality: 25 fps, x264 medium CRF 20.
+                            still: 2 fps with a keyframe every 10 s, much faster on still images.
+                            draft: 1 fps, x264 ultrafast CRF 32, for previews (see --draft).
+    --loudnorm: Normalize the loudness of every clip to EBU R128 (-16 LUFS) before joining them,
+                in the same ffmpeg pass as the encode. Each clip is measured once, ever.
+                Add --force to encode existing videos again with or without it.
+    --text-mode MODE: How the text of each event reaches its videos (default: image).
+                      image: drawn into a PNG rendered for each event.
+                      drawtext: one image without text per background and icon, the text is
+                                drawn by ffmpeg while encoding. No PNG is rendered per event.
+                      subtitles: one short video without text per background, icon and rendition,
+                                 encoded once and reused by stream copy; the text is a subtitle
+                                 track shown by players, not drawn into the video. Only the audio
+                                 is encoded per event.
+                      In both modes the background is picked per icon (always the same one for
+                      an icon, with or without --seed), and the text of each event is written
+                      next to the images as 'EVENT.txt'.
+    --cpu-budget N: Total threads shared by the ffmpeg encoders (default: all CPU cores).
+    --batch-size N: Encode up to N short events (up to 5 s of audio) in one ffmpeg process,
+                    saving the start-up cost of ffmpeg on packs of short clips (default: 1,
+                    no batching). If a batch fails, its events are encoded one by one.
+    --render-workers N: Render the images in N processes instead of one by one (default: 1).
+                       Backgrounds and icons are decoded once and shared between the processes,
+                       so memory does not grow with N.
+    --jobs N: Maximum number of ffmpeg processes running at the same time (default: automatic).
+    --seed VALUE: Pick backgrounds and category champions deterministically from VALUE
+                  instead of at random, so reruns produce the same images and videos.
+    --no-dedup: Encode every event, even when its clips, image and settings are identical
+                to another output (by default that output is hard linked or reflinked instead).
+    --plan-only: Show how many images and videos a run would create, then exit. Nothing is
+                 downloaded, rendered or encoded, and no questions are asked (pass --silence
+                 if the run will not use the default silence).
+    --force: Encode every video again, even when it is newer than its image and audio clips
+             and was made with the same settings (by default such up-to-date videos are
+             skipped; videos made with other settings are always encoded again).
+    --offline: Never use the network. Every icon and data lookup is served from the cache
+               (see 'bundle import'); anything missing from it is skipped.
+    --draft: Render quick previews for review instead of the final videos: half-resolution
+             images and 480p videos encoded with the fastest settings, written to
+             'output/draft/'. Use it with --seed, so the final render matches the previews.
+    --contact-sheet: With --draft, also write 'output/draft/contact_sheet.html', showing every
+                     event image with a checkbox to approve it and a button saving 'approved.txt'.
+    --approved [PATH]: Only process the events listed in PATH (default: 'output/draft/approved.txt'),
+                       one 'audio_folder/event' or 'event' per line.
+    --stage STAGE: Run only part of the pipeline (default: all).
+                   images: render the images and write the encodes they need to a manifest
+                           (default: 'output/stage_manifest.json') instead of encoding them.
+                   videos: encode the events of the manifest, with the settings of the images
+                           stage. Nothing is asked, parsed or downloaded. It can run later or
+                           on another machine mounting the same 'audios/', 'output/' and cache
+                           folders, since the manifest stores paths relative to this folder.
+    --manifest PATH: Stage manifest written by --stage images and read by --stage videos.
+    --profile: Profile each stage (scan, parse, icon resolve, render, encode orchestration)
+               with cProfile and tracemalloc. Reports are written to 'output/profile/'.
+               Not available with --distributed or 'serve'.
+    --distributed: Claim event jobs from a queue shared by several render nodes.
+    --queue-dir PATH: Queue directory for distributed mode (default: 'output/queue').
+    --queue-reset: With --distributed, clear the settings, jobs and done records of the queue
+                   first, so it runs again with the settings of this node. Refused while other
+                   nodes are still working on it.
+    --node-id ID: Name of this node in the queue (default: hostname and process id) and in the
+                  metrics (default: hostname).
+
+    Commands:
+    prefetch: Download every champion, item and monster icon missing from the cache,
+              in parallel, so the following renders start with a warm cache.
+    calibrate [N]: Encode N sample events (default: 5) under every encoder profile and
+                   report speed, file size and quality (SSIM), recommending the fastest
+                   profile with acceptable quality for this machine.
+    bundle export [PATH]: Pack every cached icon and data file into one archive
+                          (default: 'output/asset_bundle.zip').
+    bundle import PATH: Unpack an archive made by 'bundle export' into the cache.
+    serve: Start a local HTTP/JSON render service (default: http://127.0.0.1:8765) that keeps
+           translations, fonts and icon indexes in memory between requests. POST a JSON
+           object to /render, e.g. {"folder": "Attack_Ahri", "audio_folder": "champion_vo_audio_en"}
+           or {"name": "promo", "text": "Hello", "icon": {"type": "champion", "name": "Ahri"},
+           "clips": ["C:/clips/a.ogg"]}. Optional keys: renditions, language, force.
+           GET /status shows the busy workers. Use --port to change the port.
+    verify: Check every existing video for truncation or corruption and compare its length
+            with its audio (pass the --silence and --renditions of the render). The failed
+            events are written to 'output/verify_failures.txt', which every verify rewrites
+            (empty when every video passes); encode only them again with
+            'python main.py --approved output/verify_failures.txt --force'.
+
+    Distributed mode:
+    Every node mounting the same 'audios/' and 'output/' folders can run
+    'python main.py --distributed'. Nodes enqueue the events they find, then claim
+    them one by one through lease files, so each event is rendered only once.
+    The first node stores its settings in the queue; nodes started with other settings
+    stop with an error. Events whose clips changed since they were done are rendered again.
+    To run a finished queue with other settings, start the first node with --queue-reset.
+
+    Draft review:
+    1. python main.py --draft --contact-sheet --seed SEED
+    2. Open 'output/draft/contact_sheet.html', tick the correct events, save 'approved.txt'
+       into 'output/draft/'.
+    3. python main.py --approved --seed SEED renders only the approved events at full quality.
+
+    Metrics:
+    Every run writes its cache hits and misses, HTTP requests and bytes, ffmpeg and render
+    times and the seconds of audio encoded per wall second to 'output/metrics/': one JSON
+    summary per run, and 'videogenerator_NODE.prom' for the node_exporter textfile collector.
+    NODE is the hostname, or --node-id when given; every series has a matching "node" label.
     """)
 
+def parse_arguments(argv):
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-h", "--help", action="store_true")
+    parser.add_argument("command", nargs="?", default="render")
+    parser.add_argument("command_args", nargs="*")
+    parser.add_argument("--language")
+    parser.add_argument("--silence", type=float)
+    parser.add_argument("--renditions", default=",".join(config.DEFAULT_RENDITIONS))
+    parser.add_argument("--output-profile", default=config.DEFAULT_OUTPUT_PROFILE)
+    parser.add_argument("--encoder-profile", default=config.DEFAULT_ENCODER_PROFILE)
+    parser.add_argument("--loudnorm", action="store_true")
+    parser.add_argument("--cpu-budget", type=int)
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--batch-size", type=int, default=config.ENCODE_BATCH_SIZE)
+    parser.add_argument("--render-workers", type=int, default=config.RENDER_WORKERS)
+    parser.add_argument("--text-mode", default=config.TEXT_MODE)
+    parser.add_argument("--stage", default="all")
+    parser.add_argument("--manifest", default=config.STAGE_MANIFEST_PATH)
+    parser.add_argument("--seed")
+    parser.add_argument("--no-dedup", action="store_true")
+    parser.add_argument("--plan-only", action="store_true")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--draft", action="store_true")
+    parser.add_argument("--contact-sheet", action="store_true")
+    parser.add_argument("--approved", nargs="?", const=config.APPROVED_EVENTS_PATH)
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--distributed", action="store_true")
+    parser.add_argument("--queue-dir", default=config.QUEUE_DIR)
+    parser.add_argument("--queue-reset", action="store_true")
+    parser.add_argument("--node-id")
+    parser.add_argument("--port", type=int)
+    return parser.parse_args(argv)
+
 def select_language_interactively(translations):
     """Asks the user to select a language and returns the code."""
     print("Please select a language:")
@@ -87,17 +253,1055 @@ def select_silence_duration_interactively():
     print("-" * 20)
     return duration
 
+def list_event_folders(audio_dir, approved_events=None):
+    """
+    Returns the event folders of an audio directory, without the 'cast3D'/'cast2D' ones.
+    With an approved list (see --approved), only the approved events are returned.
+    """
+    folders = [d for d in os.listdir(audio_dir) if os.path.isdir(os.path.join(audio_dir, d))]
+
+    # Filter out folders containing "cast3D" or "cast2D"
+    filtered_folders = [f for f in folders if "cast3D" not in f and "cast2D" not in f]
+    skipped_folder_count = len(folders) - len(filtered_folders)
+
+    print(f"Found {len(folders)} event folders in '{os.path.basename(audio_dir)}'")
+    if skipped_folder_count > 0:
+        print(f"  (Skipped {skipped_folder_count} folders containing 'cast3D' or 'cast2D')")
+    if approved_events is not None:
+        audio_folder_name = os.path.basename(audio_dir)
+        filtered_folders = [f for f in filtered_folders if contact_sheet.is_approved(approved_events, audio_folder_name, f)]
+        print(f"  ({len(filtered_folders)} of them approved)")
+    return filtered_folders
+
+def get_output_dirs(audio_folder_name):
+    """Returns (and creates) the image and video output folders of an audio directory."""
+    specific_image_output_dir = os.path.join(config.OUTPUT_IMAGES_DIR, audio_folder_name)
+    os.makedirs(specific_image_output_dir, exist_ok=True)
+    specific_video_output_dir = os.path.join(config.OUTPUT_VIDEOS_DIR, audio_folder_name)
+    os.makedirs(specific_video_output_dir, exist_ok=True)
+    return specific_image_output_dir, specific_video_output_dir
+
+def get_event_outputs(audio_folder_name, folder, renditions, output_profile):
+    """Returns (image paths by layout, video paths by rendition) of an event, without creating anything."""
+    specific_image_output_dir = os.path.join(config.OUTPUT_IMAGES_DIR, audio_folder_name)
+    specific_video_output_dir = os.path.join(config.OUTPUT_VIDEOS_DIR, audio_folder_name)
+    layouts = dict.fromkeys(config.RENDITIONS[r]["layout"] for r in renditions)
+    image_paths = {
+        layout_name: os.path.join(specific_image_output_dir, image_generator.get_image_filename(folder, layout_name))
+        for layout_name in layouts
+    }
+    extension = config.OUTPUT_PROFILES[output_profile]["extension"]
+    rendition_outputs = {
+        rendition_name: os.path.join(specific_video_output_dir, f"{folder}{config.RENDITIONS[rendition_name]['suffix']}{extension}")
+        for rendition_name in renditions
+    }
+    return image_paths, rendition_outputs
+
+def find_audio_files(audio_dir, folder):
+    """Returns the .ogg clips of an event folder."""
+    audio_files = []
+    for root, _, files in os.walk(os.path.join(audio_dir, folder)):
+        for f in files:
+            if f.lower().endswith(('.ogg')):
+                audio_files.append(os.path.join(root, f))
+    return audio_files
+
+_lol_version_lock = threading.Lock()
+
+def get_lol_version(run_settings):
+    """Resolves the LoL version the first time an image needs it, instead of at startup."""
+    with _lol_version_lock:
+        if "lol_version" not in run_settings:
+            run_settings["lol_version"] = data_fetcher.get_latest_lol_version()
+            if run_settings["lol_version"] is None:
+                print("Could not get LoL version, but will try to use existing cache.")
+        return run_settings["lol_version"]
+
+def resolve_icon(target_for_icon, icon_type, display_text, run_settings):
+    """
+    Finds the icon of a parsed event. A category target (like "Void", "Noxus") is replaced by
+    one of its champions. Returns (icon lookup name, icon path or None).
+    """
+    icon_lookup_name = target_for_icon
+    all_categories = {**config.CHAMPIONS_BY_REGIONS, **config.CHAMPIONS_BY_SKINS}
+    if target_for_icon in all_categories:
+        icon_lookup_name = utils.choose(all_categories[target_for_icon], target_for_icon, display_text)
+        print(f"  - Category '{target_for_icon}' detected, randomly selected champion: {icon_lookup_name}")
+
+    with run_settings["profiler"].stage("icon resolve"):
+        icon_path = None
+        if icon_type == "item":
+            icon_path = icon_manager.get_item_icon(target_for_icon)
+        elif icon_type == "monster":
+            icon_path = icon_manager.get_monster_icon(target_for_icon)
+        elif icon_type == "champion":
+            # lol_version is needed for champion icons
+            # Use the icon_lookup_name which could be a random champion
+            icon_path = icon_manager.get_champion_icon(icon_lookup_name, get_lol_version(run_settings))
+        # For "generic" icon_type, icon_path remains None
+    return icon_lookup_name, icon_path
+
+def create_event_images(interaction_data, layout_names, icon_lookup_name, run_settings):
+    """Creates the image of an event for every layout, stopping at the first failure. Returns the number created."""
+    # Use the same background for every layout of the event. With a seed, it only depends on
+    # what is drawn, so identical renders share one cached image.
+    background_path = image_generator.get_random_background(config.UTILS_DIR, interaction_data["display_text"], icon_lookup_name)
+    for created_count, layout_name in enumerate(layout_names):
+        created_path = image_generator.create_image(interaction_data, run_settings.get("lol_version"), layout_name,
+                                                    background_path, run_settings.get("layout_scale", 1.0))
+        if not created_path:
+            print(f"  ✗ ERROR: Could not create image for '{interaction_data['original_folder']}' ({layout_name}).")
+            return created_count
+        print(f"  ✓ Image created: {os.path.basename(created_path)}")
+    return len(layout_names)
+
+def get_text_path(image_output_dir, folder):
+    """Returns the text file of an event in --text-mode drawtext and subtitles."""
+    return os.path.join(image_output_dir, f"{folder}.txt")
+
+def create_text_mode_inputs(display_text, icon_lookup_name, icon_path, layout_names, text_path, run_settings):
+    """
+    Prepares an event of --text-mode drawtext or subtitles: writes its text file and creates the
+    images without text of its icon, shared by every event with the same icon and background.
+    Returns (image paths by layout, encode job keys carrying the text), or (None, None).
+    """
+    # The text file only changes with the text, so its age keeps telling when videos are up to date
+    try:
+        with open(text_path, encoding="utf-8") as f:
+            current_text = f.read()
+    except OSError:
+        current_text = None
+    if current_text != display_text:
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(display_text)
+    # The background only depends on the icon, even without --seed, so events differing by their
+    # text share one image without text and one base track
+    background_path = image_generator.get_random_background(config.UTILS_DIR, icon_lookup_name, stable=True)
+    scale = run_settings.get("layout_scale", 1.0)
+    image_paths = {}
+    for layout_name in layout_names:
+        image_paths[layout_name] = image_generator.create_base_image(icon_path, background_path, layout_name, scale)
+        if image_paths[layout_name] is None:
+            print(f"  ✗ ERROR: Could not create the image without text ({layout_name}).")
+            return None, None
+
+    text_job = {"text_path": text_path, "display_text": display_text}
+    if run_settings["text_mode"] == "drawtext":
+        text_job["text_placements"] = {
+            layout_name: image_generator.get_text_placement(display_text, layout_name, scale) for layout_name in layout_names
+        }
+    return image_paths, text_job
+
+def prepare_text_mode_event(audio_dir, folder, run_settings):
+    """
+    prepare_event of --text-mode drawtext and subtitles. No image is rendered for the event:
+    its videos only need its text and the shared images without text.
+    """
+    result = {"image_created": False, "video_created": False, "video_up_to_date": False, "has_audio": False}
+    profiler = run_settings["profiler"]
+    specific_image_output_dir, _ = get_output_dirs(os.path.basename(audio_dir))
+    image_paths, rendition_outputs = get_event_outputs(os.path.basename(audio_dir), folder,
+                                                       run_settings["renditions"], run_settings["output_profile"])
+    text_path = get_text_path(specific_image_output_dir, folder)
+
+    with profiler.stage("scan"):
+        audio_files_in_folder = find_audio_files(audio_dir, folder)
+    if not audio_files_in_folder:
+        print(f"  ⚠ WARNING: No audio files found in '{os.path.join(audio_dir, folder)}'.")
+        return result, None
+    result["has_audio"] = True
+    if not run_settings["force"] and utils.is_up_to_date(rendition_outputs.values(), [text_path] + audio_files_in_folder,
+                                                         get_settings_signature(run_settings, list(rendition_outputs))):
+        result["video_up_to_date"] = True
+        print(f"  ✓ Video already up to date. Skipping encode.")
+        return result, None
+
+    with profiler.stage("parse"):
+        display_text, target_for_icon, icon_type = name_parser.parse_folder_name(folder, run_settings["translations"],
+                                                                                run_settings["language"])
+    print(f"  Folder Processed: {folder} --> Parsed Text: {display_text}")
+    icon_lookup_name, icon_path = resolve_icon(target_for_icon, icon_type, display_text, run_settings)
+    with profiler.stage("render"):
+        base_image_paths, text_job = create_text_mode_inputs(display_text, icon_lookup_name, icon_path, list(image_paths),
+                                                             text_path, run_settings)
+    if base_image_paths is None:
+        print(f"  ✗ ERROR: No image available for '{folder}'. Skipping video creation.")
+        return result, None
+
+    encode_job = {
+        "name": folder,
+        "image_paths": base_image_paths,
+        "audio_files": audio_files_in_folder,
+        "rendition_outputs": rendition_outputs,
+        "duration": None,
+        **text_job,
+    }
+    return result, encode_job
+
+def prepare_event(audio_dir, folder, run_settings):
+    """
+    Creates the images of a single event folder and describes the encode it needs.
+    Returns (result, encode_job). The result dict tells whether a new image was created, whether
+    the folder had any audio at all and whether its videos were already up to date; encode_job
+    is None when there is nothing to encode.
+    """
+    if run_settings.get("text_mode", "image") != "image":
+        return prepare_text_mode_event(audio_dir, folder, run_settings)
+    result = {"image_created": False, "video_created": False, "video_up_to_date": False, "has_audio": False}
+    encode_job = None
+    profiler = run_settings["profiler"]
+    specific_image_output_dir, specific_video_output_dir = get_output_dirs(os.path.basename(audio_dir))
+    translations = run_settings["translations"]
+    selected_language = run_settings["language"]
+
+    # Every layout used by a requested rendition needs its own image
+    image_paths, rendition_outputs = get_event_outputs(os.path.basename(audio_dir), folder,
+                                                       run_settings["renditions"], run_settings["output_profile"])
+    missing_layouts = [name for name, path in image_paths.items() if not os.path.exists(path)]
+
+    if not missing_layouts:
+        existing_names = ", ".join(os.path.basename(p) for p in image_paths.values())
+        print(f"  ✓ Image already exists: '{existing_names}'. Skipping creation.")
+    else:
+        print("  - Creating image...")
+        # Pass the selected language to the parsing function
+        with profiler.stage("parse"):
+            display_text, target_for_icon, icon_type = name_parser.parse_folder_name(folder, translations, selected_language)
+        print(f"  Folder Processed: {folder} --> Parsed Text: {display_text}")
+
+        icon_lookup_name, icon_path = resolve_icon(target_for_icon, icon_type, display_text, run_settings)
+        interaction_data = {
+            "original_folder": folder,
+            "display_text": display_text,
+            "target_for_icon": target_for_icon, # Keep for potential debug/logging if needed
+            "icon_path": icon_path,
+            "icon_type": icon_type,
+            "output_dir": specific_image_output_dir
+        }
+
+        with profiler.stage("render"):
+            created_count = create_event_images(interaction_data, missing_layouts, icon_lookup_name, run_settings)
+        result["image_created"] = created_count > 0
+        if created_count < len(missing_layouts):
+            image_paths = None
+
+    if image_paths:
+        with profiler.stage("scan"):
+            audio_files_in_folder = find_audio_files(audio_dir, folder)
+
+        if audio_files_in_folder and not run_settings["force"] and utils.is_up_to_date(
+                rendition_outputs.values(), list(image_paths.values()) + audio_files_in_folder,
+                get_settings_signature(run_settings, list(rendition_outputs))):
+            result["has_audio"] = True
+            result["video_up_to_date"] = True
+            print(f"  ✓ Video already up to date. Skipping encode.")
+        elif audio_files_in_folder:
+            result["has_audio"] = True
+            encode_job = {
+                "name": folder,
+                "image_paths": image_paths,
+                "audio_files": audio_files_in_folder,
+                "rendition_outputs": rendition_outputs,
+                "duration": None,
+            }
+        else:
+            print(f"  ⚠ WARNING: No audio files found in '{os.path.join(audio_dir, folder)}'.")
+    else:
+        print(f"  ✗ ERROR: No image available for '{folder}'. Skipping video creation.")
+
+    return result, encode_job
+
+def get_encode_settings(run_settings, renditions):
+    """Returns the settings deciding what the videos of an event look like, for deduplication and up-to-date checks."""
+    return {
+        "silence_duration": run_settings["silence_duration"],
+        "renditions": {name: config.RENDITIONS[name] for name in renditions},
+        "encoder": video_generator.get_encoder_signature(run_settings["output_profile"], run_settings["encoder_profile"]),
+        "loudnorm": config.LOUDNORM_TARGET if run_settings["loudnorm"] else None,
+        "text_mode": run_settings["text_mode"],
+    }
+
+def get_settings_signature(run_settings, renditions):
+    """Hashes the encode settings of some renditions. It is stored next to every video (see utils.is_up_to_date)."""
+    settings_json = json.dumps(get_encode_settings(run_settings, renditions), sort_keys=True)
+    return hashlib.sha256(settings_json.encode("utf-8")).hexdigest()
+
+def mark_encoded(encode_job, run_settings):
+    """Records the settings the videos of an event were just made with, so reruns with other settings encode them again."""
+    rendition_outputs = encode_job["rendition_outputs"]
+    utils.write_settings_signature(rendition_outputs.values(), get_settings_signature(run_settings, list(rendition_outputs)))
+
+def record_encode(encode_job, created, run_settings):
+    """Counts an encoded event and the seconds of audio it produced in the run metrics."""
+    run_metrics = metrics.get_metrics()
+    run_metrics.increment("videos_encoded_total", result="created" if created else "failed")
+    if created:
+        duration = encode_job.get("duration")
+        if duration is None:
+            duration = video_generator.get_total_audio_duration(encode_job["audio_files"], run_settings["silence_duration"])
+        run_metrics.increment("audio_seconds_encoded_total", duration or 0.0)
+
+def encode_event(encode_job, run_settings, threads=None):
+    """Encodes every rendition of an event with the given number of encoder threads. Returns True on success."""
+    folder = encode_job["name"]
+    audio_files_in_folder = encode_job["audio_files"]
+    rendition_outputs = encode_job["rendition_outputs"]
+    video_output_filenames = ", ".join(os.path.basename(p) for p in rendition_outputs.values())
+
+    if len(audio_files_in_folder) > 1:
+        print(f"  - [{folder}] Concatenating {len(audio_files_in_folder)} audio files and creating video...")
+    else:
+        print(f"  - [{folder}] Creating video...")
+
+    if run_settings.get("text_mode") == "subtitles":
+        created = video_generator.create_video_subtitled(encode_job["image_paths"], audio_files_in_folder, rendition_outputs,
+                                                         encode_job["display_text"], run_settings["silence_duration"], threads,
+                                                         run_settings["output_profile"], run_settings["encoder_profile"],
+                                                         run_settings["loudnorm"])
+    else:
+        text_overlay = None
+        if run_settings.get("text_mode") == "drawtext":
+            text_overlay = {"text_path": encode_job["text_path"], "placements": encode_job["text_placements"]}
+        created = video_generator.create_video_renditions(encode_job["image_paths"], audio_files_in_folder, rendition_outputs,
+                                                          run_settings["silence_duration"], threads, run_settings["output_profile"],
+                                                          run_settings["encoder_profile"], run_settings["loudnorm"], text_overlay)
+    record_encode(encode_job, created, run_settings)
+    if created:
+        mark_encoded(encode_job, run_settings)
+        print(f"  ✓ Video created: {video_output_filenames}")
+        return True
+    print(f"  ✗ ERROR creating video for '{folder}'.")
+    return False
+
+def encode_batch(batch_job, run_settings, threads=None):
+    """Encodes a batch of short events in one ffmpeg process. Returns one success flag per event."""
+    events = batch_job["batch"]
+    print(f"  - [{batch_job['name']}] Creating videos: {', '.join(job['name'] for job in events)}")
+    results = video_generator.create_video_batch(events, run_settings["silence_duration"], threads,
+                                                 run_settings["output_profile"], run_settings["encoder_profile"],
+                                                 run_settings["loudnorm"])
+    for job, created in zip(events, results):
+        record_encode(job, created, run_settings)
+        if created:
+            mark_encoded(job, run_settings)
+            print(f"  ✓ Video created: {', '.join(os.path.basename(p) for p in job['rendition_outputs'].values())}")
+        else:
+            print(f"  ✗ ERROR creating video for '{job['name']}'.")
+    return results
+
+def process_event(audio_dir, folder, run_settings, threads=None):
+    """Creates the images and the videos of a single event folder. Returns the result dict of prepare_event."""
+    result, encode_job = prepare_event(audio_dir, folder, run_settings)
+    if encode_job:
+        result["video_created"] = encode_event(encode_job, run_settings, threads)
+    return result
+
+def ffmpeg_available():
+    """Checks for ffmpeg right before the first encode, so runs with nothing to encode never start it."""
+    if utils.check_ffmpeg_installed():
+        return True
+    print("\n--- FFMPEG NOT FOUND! ---")
+    print(f"Make sure 'ffmpeg.exe' and 'ffprobe.exe' are in the '{config.FFMPEG_BIN_DIR}' folder.")
+    print("------------------------------")
+    return False
+
+def plan_run(audio_directories, run_settings):
+    """
+    Prints what a run would do, from file names, modification times and the settings recorded
+    next to the videos only: no network, no image rendering and no ffmpeg.
+    """
+    print(f"\n--- PLAN FOR {len(audio_directories)} AUDIO FOLDERS ---")
+    totals = {"events": 0, "images": 0, "videos": 0, "up_to_date": 0, "no_audio": 0}
+    for audio_dir in audio_directories:
+        if not os.path.isdir(audio_dir):
+            continue
+        audio_folder_name = os.path.basename(audio_dir)
+        counts = dict.fromkeys(totals, 0)
+        for folder in list_event_folders(audio_dir, run_settings.get("approved_events")):
+            counts["events"] += 1
+            image_paths, rendition_outputs = get_event_outputs(audio_folder_name, folder, run_settings["renditions"],
+                                                               run_settings["output_profile"])
+            if run_settings.get("text_mode", "image") != "image":
+                # No image per event: the videos only depend on the text file and the clips
+                missing_images = []
+                image_inputs = [get_text_path(os.path.join(config.OUTPUT_IMAGES_DIR, audio_folder_name), folder)]
+            else:
+                missing_images = [path for path in image_paths.values() if not os.path.exists(path)]
+                image_inputs = list(image_paths.values())
+            counts["images"] += len(missing_images)
+            audio_files = find_audio_files(audio_dir, folder)
+            if not audio_files:
+                counts["no_audio"] += 1
+            elif not missing_images and not run_settings["force"] and utils.is_up_to_date(
+                    rendition_outputs.values(), image_inputs + audio_files, get_settings_signature(run_settings, list(rendition_outputs))):
+                counts["up_to_date"] += 1
+            else:
+                counts["videos"] += 1
+        print(f"  {audio_folder_name}: {counts['events']} events, {counts['images']} images to create, "
+              f"{counts['videos']} events to encode, {counts['up_to_date']} up to date, {counts['no_audio']} without audio")
+        for key in totals:
+            totals[key] += counts[key]
+
+    print("\n=== PLAN SUMMARY ===")
+    print(f"Events: {totals['events']}")
+    print(f"Images to create: {totals['images']}")
+    print(f"Events to encode: {totals['videos']}")
+    print(f"Events already up to date: {totals['up_to_date']}")
+    print(f"Events without audio: {totals['no_audio']}")
+    print("====================")
+    return totals
+
+def run_verify(audio_directories, run_settings):
+    """Verifies the videos of every event with audio (see src/verify.py) and writes the failed events."""
+    from src import audio_metadata
+    checks = []
+    for audio_dir in audio_directories:
+        if not os.path.isdir(audio_dir):
+            continue
+        audio_folder_name = os.path.basename(audio_dir)
+        for folder in list_event_folders(audio_dir, run_settings.get("approved_events")):
+            audio_files = find_audio_files(audio_dir, folder)
+            if not audio_files:
+                continue
+            _, rendition_outputs = get_event_outputs(audio_folder_name, folder, run_settings["renditions"],
+                                                     run_settings["output_profile"])
+            checks += [
+                {"event_id": f"{audio_folder_name}/{folder}", "video_path": video_path, "audio_files": audio_files}
+                for video_path in rendition_outputs.values()
+            ]
+
+    print(f"\n--- VERIFYING {len(checks)} VIDEOS ---")
+    audio_metadata.get_store().prefill([path for check in checks for path in check["audio_files"]])
+    failed_events = verify.verify_videos(checks, run_settings["silence_duration"])
+    # Always rewritten, so the list of an earlier verify never brings back events that pass now
+    failures_path = verify.write_failures(failed_events)
+    if failed_events:
+        print(f"Failed events written to '{failures_path}'. Encode them again with:")
+        print(f"  python main.py --approved \"{failures_path}\" --force")
+    return failed_events
+
+def render_request(request, run_settings):
+    """
+    Renders one event for the render service (see src/render_service.py). The request names an
+    event "folder", parsed like the folders of an audio directory, or gives the "text" and the
+    "icon" ({"type": ..., "name": ...}) to draw under an output "name". The clips are the
+    "clips" paths, or those of the event folder in "audio_folder". Raises ValueError for an
+    invalid request. Returns the output paths and the timings of the image and encode stages.
+    """
+    folder = request.get("folder")
+    name = request.get("name") or folder
+    if not isinstance(name, str) or not name or os.path.basename(name) != name or name in (".", ".."):
+        raise ValueError("a request needs an event 'folder', or a 'name' with its 'text'")
+    audio_folder_name = request.get("audio_folder")
+    if audio_folder_name is not None and (not isinstance(audio_folder_name, str) or os.path.basename(audio_folder_name) != audio_folder_name):
+        raise ValueError(f"invalid audio folder: {audio_folder_name!r}")
+    renditions = request.get("renditions") or run_settings["renditions"]
+    unknown_renditions = [r for r in renditions if r not in config.RENDITIONS]
+    if unknown_renditions:
+        raise ValueError(f"unknown renditions: {', '.join(map(str, unknown_renditions))}")
+    language = request.get("language") or run_settings["language"]
+
+    clips = request.get("clips")
+    if clips is None and audio_folder_name:
+        clips = find_audio_files(os.path.join(config.BASE_DIR, "audios", audio_folder_name), folder or name)
+    if not clips:
+        raise ValueError("no audio clips: give the 'clips' paths or the 'audio_folder' of the event")
+    missing_clips = [path for path in clips if not os.path.isfile(path)]
+    if missing_clips:
+        raise ValueError(f"clips not found: {', '.join(missing_clips)}")
+
+    if "text" in request:
+        display_text = request["text"]
+        icon = request.get("icon") or {}
+        icon_type, target_for_icon = icon.get("type", "generic"), icon.get("name")
+        if icon_type not in ("champion", "item", "monster", "generic"):
+            raise ValueError(f"unknown icon type: {icon_type!r}")
+    elif folder:
+        display_text, target_for_icon, icon_type = name_parser.parse_folder_name(folder, run_settings["translations"], language)
+    else:
+        raise ValueError("a request with a 'name' needs its 'text'")
+
+    output_folder = audio_folder_name or config.SERVICE_OUTPUT_FOLDER
+    specific_image_output_dir, _ = get_output_dirs(output_folder)
+    image_paths, rendition_outputs = get_event_outputs(output_folder, name, renditions, run_settings["output_profile"])
+
+    print(f"\n- Service request: {name} --> {display_text}")
+    start = time.perf_counter()
+    icon_lookup_name, icon_path = resolve_icon(target_for_icon, icon_type, display_text, run_settings)
+    text_job = {}
+    if run_settings["text_mode"] != "image":
+        text_path = get_text_path(specific_image_output_dir, name)
+        image_paths, text_job = create_text_mode_inputs(display_text, icon_lookup_name, icon_path, list(image_paths),
+                                                        text_path, run_settings)
+        if image_paths is None:
+            raise RuntimeError(f"Could not create the image of '{name}'")
+        encode_inputs = [text_path] + clips
+    else:
+        interaction_data = {
+            "original_folder": name,
+            "display_text": display_text,
+            "target_for_icon": target_for_icon,
+            "icon_path": icon_path,
+            "icon_type": icon_type,
+            "output_dir": specific_image_output_dir
+        }
+        if create_event_images(interaction_data, list(image_paths), icon_lookup_name, run_settings) < len(image_paths):
+            raise RuntimeError(f"Could not create the image of '{name}'")
+        encode_inputs = list(image_paths.values()) + clips
+    image_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    video_up_to_date = not request.get("force") and utils.is_up_to_date(
+        rendition_outputs.values(), encode_inputs, get_settings_signature(run_settings, list(rendition_outputs)))
+    if video_up_to_date:
+        print(f"  ✓ Video already up to date. Skipping encode.")
+    else:
+        encode_job = {"name": name, "image_paths": image_paths, "audio_files": clips, "rendition_outputs": rendition_outputs,
+                      **text_job}
+        if not encode_event(encode_job, run_settings, run_settings["service_threads"]):
+            raise RuntimeError(f"Could not create the video of '{name}'")
+
+    return {
+        "name": name,
+        "text": display_text,
+        "image_paths": image_paths,
+        "video_paths": rendition_outputs,
+        "video_up_to_date": video_up_to_date,
+        "timings": {"image": round(image_seconds, 3), "encode": round(time.perf_counter() - start, 3)},
+    }
+
+def run_service(run_settings, port=None):
+    """Loads everything render requests share, then serves them until interrupted."""
+    from src import render_service
+    if not ffmpeg_available():
+        return
+    print("Warming up the render service...")
+    version = get_lol_version(run_settings)
+    if version:
+        data_fetcher.get_champion_index(version)
+    data_fetcher.get_skins_data()
+    icon_manager.get_item_icon_filenames()
+    image_generator.preload_fonts(run_settings.get("layout_scale", 1.0))
+
+    # Requests split the encode CPU budget like the workers of a distributed node
+    cpu_budget = scheduler.get_cpu_budget(run_settings["cpu_budget"])
+    workers, threads = scheduler.plan_concurrency(cpu_budget, config.SERVICE_WORKERS or cpu_budget, run_settings["max_jobs"])
+    run_settings["service_threads"] = threads
+    try:
+        render_service.serve(lambda request: render_request(request, run_settings), workers, port=port)
+    finally:
+        asset_cache.get_cache().flush()
+        print(f"Metrics written to '{metrics.get_metrics().export()}'")
+
+def estimate_durations(encode_jobs, silence_duration, cpu_budget, loudnorm=False):
+    """
+    Probes every clip not known to the audio metadata store in parallel, then sets the audio
+    length of every encode job, for longest-first scheduling and the total work estimate.
+    With loudnorm, the clips never measured before are measured in parallel too.
+    """
+    from src import audio_metadata, loudness
+    audio_files = [path for job in encode_jobs for path in job["audio_files"]]
+    audio_metadata.get_store().prefill(audio_files, workers=max(1, cpu_budget))
+    if loudnorm:
+        loudness.get_store().prefill(audio_files, workers=max(1, cpu_budget))
+    for job in encode_jobs:
+        job["duration"] = video_generator.get_total_audio_duration(job["audio_files"], silence_duration)
+    total_duration = sum(job["duration"] or 0.0 for job in encode_jobs)
+    print(f"Total audio to encode: {total_duration / 60:.1f} minutes in {len(encode_jobs)} jobs.")
+
+def render_images_in_parallel(audio_directories, run_settings, workers):
+    """
+    Renders the missing images of every event in worker processes (see --render-workers), so
+    that preparing the events afterwards finds them all. Parsing and icon lookups stay in this
+    process, since they share the network and the caches. Returns the number of events whose
+    images were created.
+    """
+    tasks = []
+    scale = run_settings.get("layout_scale", 1.0)
+    for audio_dir in audio_directories:
+        if not os.path.isdir(audio_dir):
+            continue
+        audio_folder_name = os.path.basename(audio_dir)
+        specific_image_output_dir, _ = get_output_dirs(audio_folder_name)
+        for folder in list_event_folders(audio_dir, run_settings.get("approved_events")):
+            image_paths, _ = get_event_outputs(audio_folder_name, folder, run_settings["renditions"], run_settings["output_profile"])
+            missing_layouts = [name for name, path in image_paths.items() if not os.path.exists(path)]
+            if not missing_layouts:
+                continue
+            try:
+                with run_settings["profiler"].stage("parse"):
+                    display_text, target_for_icon, icon_type = name_parser.parse_folder_name(
+                        folder, run_settings["translations"], run_settings["language"])
+                icon_lookup_name, icon_path = resolve_icon(target_for_icon, icon_type, display_text, run_settings)
+            except Exception as e:
+                # prepare_event meets the same folder again and reports it
+                print(f"  ✗ ERROR preparing the images of '{folder}': {e}")
+                continue
+            interaction_data = {
+                "original_folder": folder,
+                "display_text": display_text,
+                "target_for_icon": target_for_icon,
+                "icon_path": icon_path,
+                "icon_type": icon_type,
+                "output_dir": specific_image_output_dir
+            }
+            # The same background as create_event_images would pick
+            background_path = image_generator.get_random_background(config.UTILS_DIR, display_text, icon_lookup_name)
+            tasks += [(interaction_data, layout_name, background_path, scale) for layout_name in missing_layouts]
+
+    if not tasks:
+        return 0
+    print(f"\n--- RENDERING {len(tasks)} IMAGES IN {workers} PROCESSES ---")
+    with run_settings["profiler"].stage("render"):
+        created_paths = image_generator.create_images_parallel(tasks, workers)
+    created_events = set()
+    for (interaction_data, _, _, _), created_path in zip(tasks, created_paths):
+        if created_path:
+            created_events.add((interaction_data["output_dir"], interaction_data["original_folder"]))
+    print(f"Rendered {sum(1 for path in created_paths if path)} of {len(tasks)} images.")
+    return len(created_events)
+
+def get_video_settings(run_settings):
+    """Returns the settings deciding what the videos look like, shared with the videos stage (see --stage)."""
+    keys = ("silence_duration", "renditions", "output_profile", "encoder_profile", "loudnorm", "text_mode")
+    return {key: run_settings[key] for key in keys}
+
+def encode_all(encode_jobs, run_settings):
+    """
+    Encodes the jobs that are not identical to an earlier output in parallel through the
+    scheduler. Returns (videos generated, encodes saved by deduplication).
+    """
+    with run_settings["profiler"].stage("encode orchestration"):
+        encodes_saved = 0
+        deduplicator = None
+        if run_settings["dedup"] and encode_jobs:
+            # The reused outputs are identical to ones made with the settings of this run
+            deduplicator = dedup.EncodeDeduplicator(get_encode_settings(run_settings, run_settings["renditions"]),
+                                                    mark_served=lambda job: mark_encoded(job, run_settings))
+            job_count = len(encode_jobs)
+            encode_jobs = deduplicator.plan(encode_jobs)
+            encodes_saved += job_count - len(encode_jobs) - sum(len(j.get("duplicates", [])) for j in encode_jobs)
+
+        encode_scheduler = scheduler.EncodeScheduler(run_settings["cpu_budget"], run_settings["max_jobs"])
+        if encode_jobs:
+            estimate_durations(encode_jobs, run_settings["silence_duration"], encode_scheduler.cpu_budget, run_settings["loudnorm"])
+            # Batches join events in one filter graph, which only the image text mode supports
+            if run_settings["text_mode"] == "image":
+                encode_jobs = scheduler.group_into_batches(encode_jobs, run_settings["batch_size"])
+
+        def run_job(job, threads):
+            if "batch" in job:
+                return encode_batch(job, run_settings, threads)
+            return encode_event(job, run_settings, threads)
+        results = scheduler.expand_batch_results(encode_scheduler.run(encode_jobs, run_job))
+        total_videos_generated = sum(1 for _, created in results if created) + encodes_saved
+
+        if deduplicator:
+            for job, created in results:
+                duplicates_served = deduplicator.finish(job, created)
+                encodes_saved += duplicates_served
+                total_videos_generated += duplicates_served
+            deduplicator.save_index()
+            print(f"\nDeduplication: {deduplicator.hasher.files_hashed} files hashed, {encodes_saved} encodes saved "
+                  f"({', '.join(f'{n} {m}' for m, n in deduplicator.link_methods.items()) or 'no outputs reused'}).")
+    return total_videos_generated, encodes_saved
+
+def run_local(audio_directories, run_settings):
+    """
+    Processes every event folder on this machine. Images are created first, then the encodes
+    that are not identical to an earlier output run in parallel through the scheduler. In the
+    images stage (see --stage), the encodes are written to the stage manifest instead.
+    Returns the run statistics dict.
+    """
+    total_images_generated = 0
+    total_up_to_date = 0
+    encode_jobs = []
+    if run_settings["render_workers"] > 1 and run_settings["text_mode"] == "image":
+        total_images_generated += render_images_in_parallel(audio_directories, run_settings, run_settings["render_workers"])
+
+    print(f"\n--- {len(audio_directories)} AUDIO FOLDERS WILL BE PROCESSED ---")
+    for i, audio_dir in enumerate(audio_directories, 1):
+        print(f"\n--- ({i}/{len(audio_directories)}) Processing Audio Directory: {os.path.basename(audio_dir)} ---")
+
+        if not os.path.isdir(audio_dir):
+            print(f"Error: Audio directory '{audio_dir}' does not exist. Skipping...")
+            continue
+
+        with run_settings["profiler"].stage("scan"):
+            folders = list_event_folders(audio_dir, run_settings.get("approved_events"))
+        for folder in folders:
+            print(f"\n- Processing event: {folder}")
+            try:
+                result, encode_job = prepare_event(audio_dir, folder, run_settings)
+                total_images_generated += result["image_created"]
+                total_up_to_date += result["video_up_to_date"]
+                if encode_job:
+                    encode_jobs.append(encode_job)
+            except Exception as e:
+                print(f"  ✗ CRITICAL ERROR processing folder '{folder}': {e}")
+                traceback.print_exc()
+
+    if run_settings["stage"] == "images":
+        manifest_path = stage_manifest.write_manifest(encode_jobs, get_video_settings(run_settings), run_settings["manifest_path"])
+        print(f"\nImages stage: {len(encode_jobs)} events to encode written to '{manifest_path}'.")
+        print(f"Encode them with: python main.py --stage videos --manifest \"{manifest_path}\"")
+        return {"images_generated": total_images_generated, "videos_generated": 0,
+                "videos_up_to_date": total_up_to_date, "encodes_saved": 0}
+
+    if encode_jobs and not ffmpeg_available():
+        return {"images_generated": total_images_generated, "videos_generated": 0,
+                "videos_up_to_date": total_up_to_date, "encodes_saved": 0}
+
+    total_videos_generated, encodes_saved = encode_all(encode_jobs, run_settings)
+    return {
+        "images_generated": total_images_generated,
+        "videos_generated": total_videos_generated,
+        "videos_up_to_date": total_up_to_date,
+        "encodes_saved": encodes_saved,
+    }
+
+def run_video_stage(run_settings):
+    """
+    Runs the videos stage (see --stage): encodes the jobs of the stage manifest with its settings.
+    Jobs whose videos were made since the images stage are skipped. Returns the run statistics
+    dict, or None if the manifest cannot be read.
+    """
+    settings, encode_jobs = stage_manifest.read_manifest(run_settings["manifest_path"])
+    if settings is None:
+        return None
+    run_settings.update(settings)
+    print(f"Using manifest settings: silence {run_settings['silence_duration']}s, renditions {', '.join(run_settings['renditions'])}, "
+          f"{run_settings['output_profile']} / {run_settings['encoder_profile']}, text mode {run_settings['text_mode']}.")
+
+    up_to_date = 0
+    pending_jobs = []
+    for job in encode_jobs:
+        image_inputs = [job["text_path"]] if job.get("text_path") else list(job["image_paths"].values())
+        if not run_settings["force"] and utils.is_up_to_date(job["rendition_outputs"].values(), image_inputs + job["audio_files"],
+                                                             get_settings_signature(run_settings, list(job["rendition_outputs"]))):
+            up_to_date += 1
+        else:
+            pending_jobs.append(job)
+    print(f"\n--- VIDEOS STAGE: {len(pending_jobs)} events to encode, {up_to_date} already up to date ---")
+
+    if pending_jobs and not ffmpeg_available():
+        return {"images_generated": 0, "videos_generated": 0, "videos_up_to_date": up_to_date, "encodes_saved": 0}
+    videos_generated, encodes_saved = encode_all(pending_jobs, run_settings)
+    return {"images_generated": 0, "videos_generated": videos_generated, "videos_up_to_date": up_to_date,
+            "encodes_saved": encodes_saved}
+
+def run_calibration(audio_directories, run_settings, sample_size):
+    """
+    Prepares a sample of events spread evenly over every audio folder, then encodes it under
+    every encoder profile (see src/calibrate.py).
+    """
+    events = []
+    for audio_dir in audio_directories:
+        if os.path.isdir(audio_dir):
+            events += [(audio_dir, folder) for folder in sorted(list_event_folders(audio_dir, run_settings.get("approved_events")))]
+    if not events:
+        print("No events found to calibrate with.")
+        return
+
+    # Up-to-date events would yield no encode job, so the sample is always prepared as if forced
+    sample_settings = {**run_settings, "force": True}
+    step = max(1, len(events) // sample_size)
+    encode_jobs = []
+    for audio_dir, folder in events[::step]:
+        if len(encode_jobs) >= sample_size:
+            break
+        print(f"\n- Preparing sample event: {folder}")
+        try:
+            _, encode_job = prepare_event(audio_dir, folder, sample_settings)
+        except Exception as e:
+            print(f"  ✗ CRITICAL ERROR processing folder '{folder}': {e}")
+            continue
+        if encode_job:
+            encode_jobs.append(encode_job)
+
+    if not encode_jobs:
+        print("None of the sample events could be prepared for encoding.")
+        return
+    if not ffmpeg_available():
+        return
+    calibrate.run_calibration(encode_jobs, run_settings["output_profile"], run_settings["silence_duration"])
+
+def run_distributed(audio_directories, run_settings, queue):
+    """
+    Enqueues every event folder in the shared queue, then claims and processes jobs
+    until the queue is finished. Returns the run statistics dict of this node.
+    """
+    totals = {"images": 0, "videos": 0, "up_to_date": 0}
+    totals_lock = threading.Lock()
+
+    new_jobs = 0
+    reopened_jobs = 0
+    for audio_dir in audio_directories:
+        audio_folder_name = os.path.basename(audio_dir)
+        for folder in list_event_folders(audio_dir, run_settings.get("approved_events")):
+            job_id = work_queue.make_job_id(audio_folder_name, folder)
+            if queue.enqueue(job_id, {"audio_folder": audio_folder_name, "folder": folder}):
+                new_jobs += 1
+            elif queue.is_done(job_id):
+                # Events whose clips changed since an earlier run are rendered again
+                audio_mtimes = [os.path.getmtime(path) for path in find_audio_files(audio_dir, folder)]
+                if audio_mtimes and queue.reopen_if_changed(job_id, max(audio_mtimes)):
+                    reopened_jobs += 1
+    print(f"\n--- DISTRIBUTED MODE (node '{queue.node_id}') ---")
+    print(f"Enqueued {new_jobs} new jobs, reopened {reopened_jobs} changed jobs. Jobs waiting in queue: {queue.pending_count()}")
+
+    def process_job(job_id, payload):
+        # Resolve the audio folder locally, since the share may be mounted at another path on each node.
+        audio_dir = os.path.join(config.BASE_DIR, "audios", payload["audio_folder"])
+        print(f"\n- Processing event: {payload['folder']} (job '{job_id}')")
+        result = process_event(audio_dir, payload["folder"], run_settings, threads)
+        if result["has_audio"] and not (result["video_created"] or result["video_up_to_date"]):
+            raise RuntimeError(f"No video created for '{payload['folder']}'")
+        with totals_lock:
+            totals["images"] += result["image_created"]
+            totals["videos"] += result["video_created"]
+            totals["up_to_date"] += result["video_up_to_date"]
+        return result
+
+    # Each node runs several workers, splitting its CPU budget between their encoders.
+    cpu_budget = scheduler.get_cpu_budget(run_settings["cpu_budget"])
+    workers, threads = scheduler.plan_concurrency(cpu_budget, max(1, queue.pending_count()), run_settings["max_jobs"])
+    print(f"Running {workers} workers with {threads} encoder threads each.")
+    if queue.pending_count() and not ffmpeg_available():
+        return {"images_generated": 0, "videos_generated": 0, "videos_up_to_date": 0, "encodes_saved": 0}
+    processed = queue.run_worker(process_job, workers=workers)
+    print(f"\nNode '{queue.node_id}' processed {processed} jobs. The queue is finished.")
+    return {"images_generated": totals["images"], "videos_generated": totals["videos"],
+            "videos_up_to_date": totals["up_to_date"], "encodes_saved": 0}
+
+def write_draft_contact_sheet(audio_directories, run_settings):
+    """Writes the contact sheet of the draft images of every event (see src/contact_sheet.py)."""
+    events = []
+    for audio_dir in audio_directories:
+        if not os.path.isdir(audio_dir):
+            continue
+        audio_folder_name = os.path.basename(audio_dir)
+        for folder in sorted(list_event_folders(audio_dir, run_settings.get("approved_events"))):
+            image_paths, _ = get_event_outputs(audio_folder_name, folder, run_settings["renditions"], run_settings["output_profile"])
+            events.append((f"{audio_folder_name}/{folder}", list(image_paths.values())))
+    return contact_sheet.write_contact_sheet(events)
+
 def main():
-    if "-h" in sys.argv or "--help" in sys.argv:
+    args = parse_arguments(sys.argv[1:])
+    if args.help:
         print_help()
         return
 
+    config.OFFLINE = args.offline
+    if args.node_id:
+        config.METRICS_NODE = args.node_id
+    # Start the clock of the run metrics (see src/metrics.py)
+    run_metrics = metrics.get_metrics()
+
+    if args.command == "prefetch":
+        if args.offline:
+            print("The 'prefetch' command downloads icons and cannot run with --offline.")
+            return
+        prefetch.prefetch_all()
+        return
+    if args.command == "bundle":
+        action = args.command_args[0] if args.command_args else None
+        if action == "export":
+            bundle.export_bundle(args.command_args[1] if len(args.command_args) > 1 else None)
+        elif action == "import" and len(args.command_args) > 1:
+            bundle.import_bundle(args.command_args[1])
+        else:
+            print("Usage: python main.py bundle export [PATH] | bundle import PATH")
+        return
+    if args.command not in ("render", "calibrate", "verify", "serve"):
+        print(f"Unknown command: '{args.command}'. Use --help to see the available commands.")
+        return
+
+    renditions = [r.strip() for r in args.renditions.split(",") if r.strip()]
+    unknown_renditions = [r for r in renditions if r not in config.RENDITIONS]
+    if not renditions or unknown_renditions:
+        print(f"Unknown renditions: {', '.join(unknown_renditions) or '(none given)'}")
+        print(f"Available renditions: {', '.join(config.RENDITIONS)}")
+        return
+    if args.output_profile not in config.OUTPUT_PROFILES:
+        print(f"Unknown output profile: '{args.output_profile}'")
+        print(f"Available output profiles: {', '.join(config.OUTPUT_PROFILES)}")
+        return
+    output_profile = args.output_profile
+    if args.encoder_profile not in config.ENCODER_PROFILES:
+        print(f"Unknown encoder profile: '{args.encoder_profile}'")
+        print(f"Available encoder profiles: {', '.join(config.ENCODER_PROFILES)}")
+        return
+    encoder_profile = args.encoder_profile
+    if args.text_mode not in config.TEXT_MODES:
+        print(f"Unknown text mode: '{args.text_mode}'")
+        print(f"Available text modes: {', '.join(config.TEXT_MODES)}")
+        return
+    # Calibration compares the encodes with their event images, so it always renders them
+    text_mode = "image" if args.command == "calibrate" else args.text_mode
+    loudnorm = args.loudnorm
+    sample_size = config.CALIBRATION_SAMPLE_SIZE
+    if args.command == "calibrate" and args.command_args:
+        try:
+            sample_size = max(1, int(args.command_args[0]))
+        except ValueError:
+            print(f"Invalid sample size: '{args.command_args[0]}'")
+            return
+
+    approved_events = None
+    if args.approved:
+        try:
+            approved_events = contact_sheet.load_approved_events(args.approved)
+        except OSError as e:
+            print(f"Error reading approved list '{args.approved}': {e}")
+            return
+        print(f"Approved list: {len(approved_events)} events from '{args.approved}'")
+
+    layout_scale = 1.0
+    if args.draft:
+        if args.distributed:
+            print("--draft renders previews on this machine only and cannot run with --distributed.")
+            return
+        # Previews go to their own folders, one draft rendition per requested layout
+        config.OUTPUT_IMAGES_DIR = config.DRAFT_IMAGES_DIR
+        config.OUTPUT_VIDEOS_DIR = config.DRAFT_VIDEOS_DIR
+        renditions = list(dict.fromkeys(config.DRAFT_RENDITIONS[config.RENDITIONS[r]["layout"]] for r in renditions))
+        encoder_profile = config.DRAFT_ENCODER_PROFILE
+        layout_scale = config.DRAFT_LAYOUT_SCALE
+        if args.seed is None:
+            print("⚠ WARNING: --draft without --seed. The final render will pick other backgrounds and champions.")
+    elif args.contact_sheet:
+        print("--contact-sheet shows draft images and needs --draft.")
+        return
+    if args.stage not in ("all", "images", "videos"):
+        print(f"Unknown stage: '{args.stage}'. Available stages: all, images, videos")
+        return
+    if args.stage != "all" and (args.command != "render" or args.distributed):
+        print("--stage splits a local render and cannot run with --distributed or another command.")
+        return
+    if args.profile and args.distributed:
+        print("--profile measures the stages of the main thread, but distributed workers run in their own")
+        print("threads. Profile a local run instead.")
+        return
+    if args.queue_reset and not args.distributed:
+        print("--queue-reset clears the queue of distributed mode and needs --distributed.")
+        return
+    if args.contact_sheet and text_mode != "image":
+        print("--contact-sheet shows the image of every event and needs --text-mode image.")
+        return
+
+    # Stages of concurrent service requests would overlap, so the service is never profiled
+    profiler = profiling.StageProfiler(enabled=args.profile and args.command != "serve")
+
+    if args.stage == "videos":
+        # The settings come from the manifest of the images stage: nothing is asked, parsed or downloaded
+        run_settings = {
+            "cpu_budget": args.cpu_budget,
+            "max_jobs": args.jobs,
+            "batch_size": args.batch_size,
+            "dedup": not args.no_dedup,
+            "force": args.force,
+            "manifest_path": args.manifest,
+            "profiler": profiler,
+        }
+        run_stats = run_video_stage(run_settings)
+        if run_stats is None:
+            return
+        print(f"\n=== EXECUTION SUMMARY ===")
+        print(f"Videos generated: {run_stats['videos_generated']}")
+        print(f"Videos already up to date: {run_stats['videos_up_to_date']}")
+        print(f"Encodes saved by deduplication: {run_stats['encodes_saved']}")
+        print("=========================")
+        run_metrics.print_summary()
+        print(f"Metrics written to '{run_metrics.export()}' and '{run_metrics.prometheus_path()}'")
+        profiler.write_reports()
+        profiler.print_summary()
+        return
+
+    with profiler.stage("scan"):
+        audio_directories = utils.detect_audio_directories(config.BASE_DIR)
+    if not audio_directories and args.command != "serve":
+        print("\n--- ACTION REQUIRED! ---")
+        print("No audio folders found to process.")
+        print("Please place your audio folders (e.g., a folder named 'champion_vo_audio_en')")
+        print(f"inside the 'audios/' directory: '{os.path.join(config.BASE_DIR, 'audios')}'")
+        print("--------------------------")
+        return
+
+    if args.plan_only:
+        plan_run(audio_directories, {
+            "renditions": renditions,
+            "output_profile": output_profile,
+            "encoder_profile": encoder_profile,
+            "silence_duration": args.silence if args.silence is not None else config.SILENCE_DURATION,
+            "loudnorm": loudnorm,
+            "text_mode": text_mode,
+            "force": args.force,
+            "approved_events": approved_events,
+        })
+        return
+    if args.command == "verify":
+        run_verify(audio_directories, {
+            "renditions": renditions,
+            "output_profile": output_profile,
+            "silence_duration": args.silence if args.silence is not None else config.SILENCE_DURATION,
+            "approved_events": approved_events,
+        })
+        return
+
     # Load translations once
     translations = translation.load_translations(config.UTILS_DIR)
 
-    # Set language and silence duration at the beginning
-    selected_language = select_language_interactively(translations)
-    silence_duration = select_silence_duration_interactively()
+    queue = None
+    if args.distributed:
+        # Nodes run unattended, so settings come from the arguments and the queue, never from prompts.
+        queue = work_queue.WorkQueue(args.queue_dir, node_id=args.node_id)
+        if args.queue_reset:
+            if not queue.reset():
+                print(f"Cannot reset the queue: nodes are still working on {', '.join(queue.active_leases())}.")
+                return
+            print(f"Queue '{args.queue_dir}' reset.")
+        node_settings = {
+            "language": args.language or config.SELECTED_LANGUAGE,
+            "silence_duration": args.silence if args.silence is not None else config.SILENCE_DURATION,
+            "renditions": renditions,
+            "output_profile": output_profile,
+            "encoder_profile": encoder_profile,
+            "loudnorm": args.loudnorm,
+            "text_mode": text_mode,
+            "seed": args.seed,
+        }
+        shared_settings = queue.share_settings(node_settings)
+        if shared_settings is None:
+            print(f"Cannot read the settings of the queue '{args.queue_dir}'. Start it over with --queue-reset")
+            print("once no node is working on it.")
+            return
+        mismatched = [key for key in node_settings if shared_settings.get(key) != node_settings[key]]
+        if mismatched:
+            # Rendering with other settings than the queue would mix two kinds of outputs
+            print("\n--- QUEUE SETTINGS MISMATCH ---")
+            for key in mismatched:
+                print(f"  {key}: queue {shared_settings.get(key)!r}, this node {node_settings[key]!r}")
+            print("Run this node with the settings of the queue, or start the queue over with --queue-reset")
+            print("once no node is working on it.")
+            print("-------------------------------")
+            return
+        selected_language = shared_settings["language"]
+        silence_duration = shared_settings["silence_duration"]
+        config.SELECTION_SEED = shared_settings["seed"]
+        print(f"Using queue settings: language {selected_language}, silence {silence_duration}s, renditions {', '.join(renditions)}.")
+    elif args.command == "serve":
+        # The service runs unattended, so settings come from the arguments, never from prompts.
+        selected_language = args.language or config.SELECTED_LANGUAGE
+        silence_duration = args.silence if args.silence is not None else config.SILENCE_DURATION
+        if args.seed is not None:
+            config.SELECTION_SEED = args.seed
+    else:
+        # Set language and silence duration at the beginning
+        selected_language = args.language or select_language_interactively(translations)
+        silence_duration = args.silence if args.silence is not None else select_silence_duration_interactively()
+        if args.seed is not None:
+            config.SELECTION_SEED = args.seed
 
 
     print("Starting automated image and video generator...")
@@ -118,150 +1322,71 @@ def main():
         print("--------------------------")
         return
 
-    if utils.check_ffmpeg_installed() is False:
-        print("\n--- FFMPEG NOT FOUND! ---")
-        print(f"Make sure 'ffmpeg.exe' and 'ffprobe.exe' are in the '{config.FFMPEG_BIN_DIR}' folder.")
-        print("------------------------------")
+    # ffmpeg and the LoL version are only checked once an encode or a champion icon needs them
+    # (see ffmpeg_available and get_lol_version), so up-to-date reruns start nothing at all.
+    run_settings = {
+        "translations": translations,
+        "language": selected_language,
+        "silence_duration": silence_duration,
+        "renditions": renditions,
+        "output_profile": output_profile,
+        "encoder_profile": encoder_profile,
+        "loudnorm": loudnorm,
+        "text_mode": text_mode,
+        "stage": args.stage,
+        "manifest_path": args.manifest,
+        "cpu_budget": args.cpu_budget,
+        "max_jobs": args.jobs,
+        "batch_size": args.batch_size,
+        "render_workers": max(1, args.render_workers),
+        "dedup": not args.no_dedup,
+        "force": args.force,
+        "approved_events": approved_events,
+        "layout_scale": layout_scale,
+        "profiler": profiler,
+    }
+    if args.command == "calibrate":
+        run_calibration(audio_directories, run_settings, sample_size)
         return
-
-    lol_version = data_fetcher.get_latest_lol_version()
-    if lol_version is None:
-        print("Could not get LoL version, but will try to use existing cache.")
-
-
-    audio_directories = utils.detect_audio_directories(config.BASE_DIR)
-    if not audio_directories:
-        print("\n--- ACTION REQUIRED! ---")
-        print("No audio folders found to process.")
-        print("Please place your audio folders (e.g., a folder named 'champion_vo_audio_en')")
-        print(f"inside the 'audios/' directory: '{os.path.join(config.BASE_DIR, 'audios')}'")
-        print("--------------------------")
+    if args.command == "serve":
+        run_service(run_settings, args.port)
         return
 
-    total_images_generated = 0
-    total_videos_generated = 0
-    initial_cache_size = len(icon_manager.get_cached_icons())
-
-    print(f"\n--- {len(audio_directories)} AUDIO FOLDERS WILL BE PROCESSED ---")
-    for i, audio_dir in enumerate(audio_directories, 1):
-        print(f"\n--- ({i}/{len(audio_directories)}) Processing Audio Directory: {os.path.basename(audio_dir)} ---")
-        
-        audio_folder_name = os.path.basename(audio_dir)
-        specific_video_output_dir = os.path.join(config.OUTPUT_VIDEOS_DIR, audio_folder_name)
-        os.makedirs(specific_video_output_dir, exist_ok=True)
-        specific_image_output_dir = os.path.join(config.OUTPUT_IMAGES_DIR, audio_folder_name)
-        os.makedirs(specific_image_output_dir, exist_ok=True)
+    icon_cache = asset_cache.get_cache()
+    initial_cache_size = sum(count for count, _ in icon_cache.stats().values())
 
-        if not os.path.isdir(audio_dir):
-            print(f"Error: Audio directory '{audio_dir}' does not exist. Skipping...")
-            continue
-            
-        folders = [d for d in os.listdir(audio_dir) if os.path.isdir(os.path.join(audio_dir, d))]
-        
-        # Filter out folders containing "cast3D" or "cast2D"
-        initial_folder_count = len(folders)
-        filtered_folders = [f for f in folders if "cast3D" not in f and "cast2D" not in f]
-        skipped_folder_count = initial_folder_count - len(filtered_folders)
-
-        print(f"Found {len(folders)} event folders in '{audio_folder_name}'")
-        if skipped_folder_count > 0:
-            print(f"  (Skipped {skipped_folder_count} folders containing 'cast3D' or 'cast2D')")
-        
-        for folder in filtered_folders:
-            print(f"\n- Processing event: {folder}")
-            try:
-                expected_image_filename = f"{folder}.png"
-                image_output_path = os.path.join(specific_image_output_dir, expected_image_filename)
-
-                if os.path.exists(image_output_path):
-                    print(f"  ✓ Image already exists: '{expected_image_filename}'. Skipping creation.")
-                else:
-                    print("  - Creating image...")
-                    # Pass the selected language to the parsing function
-                    display_text, target_for_icon, icon_type = name_parser.parse_folder_name(folder, translations, selected_language)
-                    print(f"  Folder Processed: {folder} --> Parsed Text: {display_text}")
-                    
-                    # If the target is a category (like "Void", "Noxus"), pick a random champion from it.
-                    icon_lookup_name = target_for_icon
-                    all_categories = {**config.CHAMPIONS_BY_REGIONS, **config.CHAMPIONS_BY_SKINS}
-                    if target_for_icon in all_categories:
-                        icon_lookup_name = random.choice(all_categories[target_for_icon])
-                        print(f"  - Category '{target_for_icon}' detected, randomly selected champion: {icon_lookup_name}")
-
-                    icon_path = None
-                    if icon_type == "item":
-                        icon_path = icon_manager.get_item_icon(target_for_icon)
-                    elif icon_type == "monster":
-                        icon_path = icon_manager.get_monster_icon(target_for_icon)
-                    elif icon_type == "champion":
-                        # lol_version is needed for champion icons
-                        # Use the icon_lookup_name which could be a random champion
-                        icon_path = icon_manager.get_champion_icon(icon_lookup_name, lol_version, config.ICON_CACHE_DIR)
-                    # For "generic" icon_type, icon_path remains None
-
-                    interaction_data = {
-                        "original_folder": folder,
-                        "display_text": display_text,
-                        "target_for_icon": target_for_icon, # Keep for potential debug/logging if needed
-                        "icon_path": icon_path,
-                        "icon_type": icon_type,
-                        "output_dir": specific_image_output_dir
-                    }
-                    
-                    created_path = image_generator.create_image(interaction_data, lol_version)
-                    if created_path:
-                        total_images_generated += 1
-                        print(f"  ✓ Image created: {os.path.basename(created_path)}")
-                        image_output_path = created_path
-                    else:
-                        print(f"  ✗ ERROR: Could not create image for '{folder}'.")
-                        image_output_path = None
-
-                if image_output_path:
-                    audio_files_in_folder = []
-                    for root, _, files in os.walk(os.path.join(audio_dir, folder)):
-                        for f in files:
-                            if f.lower().endswith(('.ogg')):
-                                audio_files_in_folder.append(os.path.join(root, f))
-                    
-                    if audio_files_in_folder:
-                        video_output_filename = f"{folder}.mp4"
-                        video_output_path = os.path.join(specific_video_output_dir, video_output_filename)
-                        
-                        if len(audio_files_in_folder) > 1:
-                            print(f"  - Concatenating {len(audio_files_in_folder)} audio files and creating video...")
-                        else:
-                            print(f"  - Creating video...")
-                            
-                        if video_generator.create_video(image_output_path, audio_files_in_folder, video_output_path, silence_duration):
-                            total_videos_generated += 1
-                            print(f"  ✓ Video created: {video_output_filename}")
-                        else:
-                            print(f"  ✗ ERROR creating video for '{folder}'.")
-                    else:
-                        print(f"  ⚠ WARNING: No audio files found in '{os.path.join(audio_dir, folder)}'.")
-                else:
-                    print(f"  ✗ ERROR: No image available for '{folder}'. Skipping video creation.")
+    if queue is not None:
+        run_stats = run_distributed(audio_directories, run_settings, queue)
+    else:
+        run_stats = run_local(audio_directories, run_settings)
 
-            except Exception as e:
-                print(f"  ✗ CRITICAL ERROR processing folder '{folder}': {e}")
-                traceback.print_exc()
+    if args.contact_sheet:
+        write_draft_contact_sheet(audio_directories, run_settings)
 
-    final_cache_size = len(icon_manager.get_cached_icons())
-    new_icons_downloaded = final_cache_size - initial_cache_size
+    # Record this run's icon use and apply the cache size cap
+    icon_cache.flush()
+    final_cache_size = sum(count for count, _ in icon_cache.stats().values())
     
     print(f"\n=== EXECUTION SUMMARY ===")
     print(f"Processed audio directories: {len(audio_directories)}")
-    print(f"New images generated: {total_images_generated}")
-    print(f"Videos generated: {total_videos_generated}")
+    print(f"New images generated: {run_stats['images_generated']}")
+    print(f"Videos generated: {run_stats['videos_generated']}")
+    print(f"Videos already up to date: {run_stats['videos_up_to_date']}")
+    print(f"Encodes saved by deduplication: {run_stats['encodes_saved']}")
     print(f"Initial cache size: {initial_cache_size}")
-    print(f"New icons downloaded: {new_icons_downloaded}")
+    print(f"New icons downloaded: {icon_cache.downloads}")
+    print(f"Icons evicted by the cache size cap: {icon_cache.evictions}")
     print(f"Final cache size: {final_cache_size}")
     print(f"Image location: '{config.OUTPUT_IMAGES_DIR}'")
     print(f"Video location: '{config.OUTPUT_VIDEOS_DIR}'")
     print(f"Cache location: '{config.ICON_CACHE_DIR}'")
     print("=========================")
 
+    run_metrics.print_summary()
+    print(f"Metrics written to '{run_metrics.export()}' and '{run_metrics.prometheus_path()}'")
+
+    profiler.write_reports()
+    profiler.print_summary()
+
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,226 @@
+"""
+This module manages the downloaded icons (champion, item and monster) as one cache.
+
+Every asset is recorded in an index file with its size, its SHA-256 and when it was last used.
+The index gives cheap statistics and drives the size cap: when the cache grows over
+config.ASSET_CACHE_MAX_BYTES, the least recently used assets are deleted, except the ones
+used by the current run or within config.ASSET_CACHE_EVICTION_GRACE_SECONDS. Downloads are
+checked to be whole images before they are stored, so a cut-off transfer never ends up looking
+like a valid icon.
+
+Several processes (render nodes, parallel runs) may share the cache folder: every change to
+the index is made under a lock file, by re-reading the index and merging into it. Since that
+rewrites the whole index, new assets are merged in batches of config.ASSET_CACHE_FLUSH_EVERY
+and at exit (see flush), not one by one.
+"""
+import os
+import json
+import atexit
+import time
+import hashlib
+import threading
+from . import config
+from . import data_fetcher
+from . import metrics
+from . import utils
+
+class AssetCache:
+    """The icon cache. Asset kinds and their folders come from config.ASSET_CACHE_KINDS."""
+    def __init__(self, index_path=None, max_bytes=None):
+        self.index_path = index_path or config.ASSET_CACHE_INDEX_PATH
+        self.lock_path = self.index_path + ".lock"
+        self.max_bytes = config.ASSET_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._used_this_run = set()
+        self._pending_touches = {}
+        self._pending_entries = {}
+        self.downloads = 0
+        self.evictions = 0
+        with utils.file_lock(self.lock_path):
+            self._entries = self._read_index()
+            if self._entries is None:
+                self._entries = self._scan_folders()
+                self._write_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)["entries"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _write_index(self):
+        temp_path = f"{self.index_path}.{os.getpid()}.part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self._entries}, f)
+        os.replace(temp_path, self.index_path)
+
+    def _scan_folders(self):
+        """Builds the index from the cache folders, for caches made before the index existed."""
+        entries = {}
+        for kind, directory in config.ASSET_CACHE_KINDS.items():
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if filename.lower().endswith((".png", ".jpg", ".jpeg")):
+                    stat = os.stat(os.path.join(directory, filename))
+                    entries[f"{kind}/{filename}"] = {"size": stat.st_size, "sha256": None, "last_used": stat.st_mtime}
+        return entries
+
+    def path(self, kind, filename):
+        """Returns where an asset is stored, whether it is cached or not."""
+        return os.path.join(config.ASSET_CACHE_KINDS[kind], filename)
+
+    def lookup(self, kind, filename):
+        """Returns the path of a cached asset, or None if it is not cached."""
+        path = self.path(kind, filename)
+        if not os.path.exists(path):
+            metrics.get_metrics().increment("cache_lookups_total", kind=kind, result="miss")
+            return None
+        metrics.get_metrics().increment("cache_lookups_total", kind=kind, result="hit")
+        key = f"{kind}/{filename}"
+        with self._lock:
+            self._used_this_run.add(key)
+            # Last-use times are written with the next index update instead of on every hit
+            self._pending_touches[key] = time.time()
+            if key not in self._entries:
+                self._entries[key] = {"size": os.path.getsize(path), "sha256": None, "last_used": time.time()}
+        return path
+
+    def fetch(self, kind, filename, url):
+        """
+        Returns the path of an asset, downloading it into the cache if needed.
+        Returns None if it is not cached and cannot be downloaded whole.
+        """
+        cached_path = self.lookup(kind, filename)
+        if cached_path:
+            return cached_path
+
+        path = self.path(kind, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if data_fetcher.download_icon(url, path) is None:
+            return None
+        self.insert(kind, filename)
+        return path
+
+    def insert(self, kind, filename, downloaded=True):
+        """
+        Records an asset written into the cache folder, then evicts assets over the size cap.
+        downloaded is False for assets made locally (see icon_manager.crop_champion_icon).
+        """
+        path = self.path(kind, filename)
+        with open(path, "rb") as f:
+            data = f.read()
+        key = f"{kind}/{filename}"
+        entry = {"size": len(data), "sha256": hashlib.sha256(data).hexdigest(), "last_used": time.time()}
+        with self._lock:
+            self._used_this_run.add(key)
+            self.downloads += downloaded
+            self._entries[key] = self._pending_entries[key] = entry
+            if len(self._pending_entries) >= config.ASSET_CACHE_FLUSH_EVERY:
+                self._update_index()
+
+    def _update_index(self):
+        """Merges local changes into the index on disk and applies the size cap. Needs self._lock."""
+        with utils.file_lock(self.lock_path):
+            entries = self._read_index() or {}
+            entries.update(self._entries_not_on_disk(entries))
+            entries.update(self._pending_entries)
+            for key, last_used in self._pending_touches.items():
+                if key in entries:
+                    entries[key]["last_used"] = max(entries[key]["last_used"], last_used)
+            self._pending_entries = {}
+            self._pending_touches = {}
+            self._entries = entries
+            self._evict()
+            self._write_index()
+
+    def _entries_not_on_disk(self, disk_entries):
+        """Returns the entries this process adopted that the index on disk does not have yet."""
+        return {
+            key: entry for key, entry in self._entries.items()
+            if key not in disk_entries and os.path.exists(self.path(*key.split("/", 1)))
+        }
+
+    def _evict(self):
+        """
+        Deletes the least recently used assets until the cache fits its cap. Needs the file lock.
+        Assets used within config.ASSET_CACHE_EVICTION_GRACE_SECONDS are kept, as another process may
+        be about to read them.
+        """
+        if not self.max_bytes:
+            return
+        total = sum(entry["size"] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        grace_start = time.time() - config.ASSET_CACHE_EVICTION_GRACE_SECONDS
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["last_used"]):
+            # Sorted by last use: once an asset is within the grace window, every remaining one is too
+            if total <= self.max_bytes or entry["last_used"] >= grace_start:
+                break
+            if key in self._used_this_run:
+                continue
+            kind, filename = key.split("/", 1)
+            try:
+                os.remove(self.path(kind, filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not evict cached asset '{key}': {e}")
+                continue
+            del self._entries[key]
+            total -= entry["size"]
+            self.evictions += 1
+
+    def rescan(self):
+        """Adds the assets written into the cache folders by other means (see bundle.py) to the index."""
+        with self._lock:
+            scanned = self._scan_folders()
+            self._entries.update({key: entry for key, entry in scanned.items() if key not in self._entries})
+            self._update_index()
+
+    def flush(self):
+        """Writes the new assets and last-use times of this run into the index and applies the size cap."""
+        with self._lock:
+            if self._pending_entries or self._pending_touches:
+                self._update_index()
+
+    def filenames(self, kind):
+        """Returns the filenames of the cached assets of a kind, from the index."""
+        with self._lock:
+            return [key.split("/", 1)[1] for key in self._entries if key.split("/", 1)[0] == kind]
+
+    def stats(self):
+        """Returns {kind: (asset count, total bytes)} from the index, without listing any folder."""
+        summary = {kind: [0, 0] for kind in config.ASSET_CACHE_KINDS}
+        with self._lock:
+            for key, entry in self._entries.items():
+                kind = key.split("/", 1)[0]
+                if kind in summary:
+                    summary[kind][0] += 1
+                    summary[kind][1] += entry["size"]
+        return {kind: tuple(counts) for kind, counts in summary.items()}
+
+    def print_stats(self):
+        stats = self.stats()
+        total_count = sum(count for count, _ in stats.values())
+        total_bytes = sum(size for _, size in stats.values())
+        cap = f"{self.max_bytes / 1024 / 1024:.0f} MiB" if self.max_bytes else "no limit"
+        print(f"\n--- CACHE STATISTICS ---")
+        for kind, (count, size) in stats.items():
+            print(f"{kind.capitalize()} icons: {count} ({size / 1024 / 1024:.1f} MiB)")
+        print(f"Total: {total_count} icons, {total_bytes / 1024 / 1024:.1f} MiB (cap: {cap})")
+        print("--------------------------")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Returns the asset cache of this process, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AssetCache()
+            # Commands that never flush still record their downloads
+            atexit.register(_cache.flush)
+        return _cache
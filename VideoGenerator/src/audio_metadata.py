@@ -0,0 +1,128 @@
+"""
+This module remembers what ffprobe said about each audio clip: duration, codec, sample rate,
+channel count and codec headers hash. Clips rarely change between runs, so the answers are
+kept in a SQLite file keyed by clip path, size and modification time, and a clip is only
+probed again once it has been replaced.
+
+The clips of a run are probed in parallel during the inventory (see prefill), so concat
+planning, silence generation, longest-first scheduling and stream-copy checks all read the
+store afterwards without starting ffprobe.
+"""
+import os
+import json
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+from . import metrics
+
+# Bump when the probed fields change, so older stores are rebuilt
+_SCHEMA_VERSION = 1
+
+def probe_clip(audio_path):
+    """Runs ffprobe once on a clip. Returns its metadata dict, or None if it cannot be probed."""
+    cmd = [
+        config.FFPROBE_EXE, "-v", "error", "-select_streams", "a:0", "-show_data_hash", "sha256",
+        "-show_entries", "format=duration:stream=codec_name,sample_rate,channels,extradata_hash",
+        "-of", "json", audio_path
+    ]
+    try:
+        with metrics.get_metrics().timer("ffmpeg_seconds", operation="probe"):
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        probe = json.loads(result.stdout)
+        stream = probe["streams"][0]
+        return {
+            "duration": float(probe["format"]["duration"]),
+            "codec_name": stream.get("codec_name"),
+            "sample_rate": int(stream.get("sample_rate", 0)) or None,
+            "channels": stream.get("channels"),
+            "extradata_hash": stream.get("extradata_hash"),
+        }
+    except FileNotFoundError:
+        print(f"Error: '{config.FFPROBE_EXE}' not found. Make sure the file is in the 'bin' folder.")
+        return None
+    except (subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+        print(f"Error probing {audio_path}: {e}")
+        return None
+
+class AudioMetadataStore:
+    """Clip metadata, kept in memory for the run and in SQLite across runs."""
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.AUDIO_METADATA_DB_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory = {}
+        self.probes = 0
+        # One connection shared by the probing threads, used under self._lock only
+        # sqlite3 is imported when the store opens, so commands that never need it do not load it
+        import sqlite3
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        with self._db:
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS clips")
+                self._db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS clips (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                "duration REAL, codec_name TEXT, sample_rate INTEGER, channels INTEGER, extradata_hash TEXT)"
+            )
+
+    def _cached(self, path, stat):
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+            row = self._db.execute(
+                "SELECT duration, codec_name, sample_rate, channels, extradata_hash FROM clips "
+                "WHERE path = ? AND size = ? AND mtime_ns = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            metadata = dict(zip(("duration", "codec_name", "sample_rate", "channels", "extradata_hash"), row))
+            self._memory[key] = metadata
+            return metadata
+
+    def get(self, audio_path):
+        """Returns the metadata of a clip, probing it only if it is new or has changed."""
+        path = os.path.abspath(audio_path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            print(f"Error reading {audio_path}: {e}")
+            return None
+        metadata = self._cached(path, stat)
+        if metadata is not None:
+            return metadata
+
+        metadata = probe_clip(path)
+        if metadata is None:
+            return None
+        with self._lock:
+            self.probes += 1
+            self._memory[(path, stat.st_size, stat.st_mtime_ns)] = metadata
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, stat.st_size, stat.st_mtime_ns, metadata["duration"], metadata["codec_name"],
+                     metadata["sample_rate"], metadata["channels"], metadata["extradata_hash"])
+                )
+        return metadata
+
+    def prefill(self, audio_paths, workers=None):
+        """Makes sure every clip is known, probing the new and changed ones in parallel."""
+        workers = workers or config.AUDIO_PROBE_WORKERS or os.cpu_count() or 1
+        probes_before = self.probes
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(self.get, audio_paths))
+        probed = self.probes - probes_before
+        print(f"Audio metadata: {len(audio_paths)} clips, {len(audio_paths) - probed} known, {probed} probed.")
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the metadata store of this process, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AudioMetadataStore()
+        return _store
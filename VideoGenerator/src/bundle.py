@@ -0,0 +1,135 @@
+"""
+This module implements the 'bundle export' and 'bundle import' commands. A bundle is a single
+zip archive of every cached asset: champion, item and monster icons, the skins data, the item
+icon index, the champion data and the LoL version, with their HTTP validators. A manifest
+lists every file with its size and SHA-256, so a copy damaged on the way is refused.
+
+Render nodes without reliable internet import the bundle of a connected machine, then run
+with --offline to serve every lookup from it.
+"""
+import os
+import json
+import time
+import glob
+import hashlib
+import zipfile
+from . import config
+from . import asset_cache
+
+def _bundle_sources():
+    """Returns the (path, name in the archive) of every cached asset that goes into a bundle."""
+    paths = []
+    for directory in config.ASSET_CACHE_KINDS.values():
+        if os.path.isdir(directory):
+            paths += [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.lower().endswith(".png")]
+    for cache_path in (config.SKINS_CACHE_PATH, config.ITEM_INDEX_CACHE_PATH):
+        paths += [cache_path, cache_path + config.HTTP_META_SUFFIX]
+    paths.append(config.VERSION_CACHE_PATH)
+    paths += sorted(glob.glob(os.path.join(config.CACHE_DIR, "champion_*.json")))
+
+    return [
+        (path, os.path.relpath(path, config.CACHE_DIR).replace(os.sep, "/"))
+        for path in paths if os.path.isfile(path)
+    ]
+
+def _read_lol_version():
+    try:
+        with open(config.VERSION_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (FileNotFoundError, ValueError, AttributeError):
+        return None
+
+def export_bundle(bundle_path=None):
+    """Packs every cached asset into a bundle. Returns the bundle path."""
+    bundle_path = bundle_path or config.BUNDLE_DEFAULT_PATH
+    sources = _bundle_sources()
+    manifest = {
+        "format_version": config.BUNDLE_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "lol_version": _read_lol_version(),
+        "files": {},
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(bundle_path)), exist_ok=True)
+    temp_path = bundle_path + ".part"
+    with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, name in sources:
+            with open(path, "rb") as f:
+                data = f.read()
+            manifest["files"][name] = {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+            # Icons are PNGs and do not shrink any further, so they are stored as is
+            compression = zipfile.ZIP_STORED if name.endswith(".png") else zipfile.ZIP_DEFLATED
+            archive.writestr(name, data, compress_type=compression)
+        archive.writestr(config.BUNDLE_MANIFEST_NAME, json.dumps(manifest, indent=2))
+    os.replace(temp_path, bundle_path)
+
+    print(f"Bundle exported: '{bundle_path}' ({len(sources)} files, LoL version {manifest['lol_version'] or 'unknown'})")
+    return bundle_path
+
+def _safe_target(name):
+    """
+    Returns where a bundle file goes inside the cache, or None for names escaping the cache.
+    Names use '/' only: backslashes, drives and absolute names are refused on every platform.
+    """
+    parts = name.split("/")
+    if "\\" in name or ":" in name or os.path.isabs(name) or os.path.splitdrive(name)[0]:
+        return None
+    if any(part in ("", ".", "..") for part in parts):
+        return None
+    target = os.path.join(config.CACHE_DIR, *parts)
+    cache_dir = os.path.realpath(config.CACHE_DIR)
+    # A symlink inside the cache could still lead outside of it
+    if os.path.commonpath([os.path.realpath(target), cache_dir]) != cache_dir:
+        return None
+    return target
+
+def import_bundle(bundle_path):
+    """
+    Unpacks a bundle into the cache, checking every file against the manifest first.
+    Returns the number of files imported, or None if the bundle was refused.
+    """
+    try:
+        archive = zipfile.ZipFile(bundle_path)
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"Error opening bundle '{bundle_path}': {e}")
+        return None
+
+    with archive:
+        try:
+            manifest = json.loads(archive.read(config.BUNDLE_MANIFEST_NAME))
+        except (KeyError, ValueError) as e:
+            print(f"Error: '{bundle_path}' has no valid manifest: {e}")
+            return None
+        if manifest.get("format_version", 0) > config.BUNDLE_FORMAT_VERSION:
+            print(f"Error: bundle format {manifest.get('format_version')} is newer than this version "
+                  f"supports ({config.BUNDLE_FORMAT_VERSION}).")
+            return None
+
+        # Check everything before writing anything, so a bad bundle leaves the cache untouched
+        files = {}
+        for name, expected in manifest.get("files", {}).items():
+            target = _safe_target(name)
+            if target is None:
+                print(f"Error: bundle file '{name}' points outside the cache.")
+                return None
+            try:
+                data = archive.read(name)
+            except KeyError:
+                print(f"Error: bundle file '{name}' is listed in the manifest but missing.")
+                return None
+            if len(data) != expected["size"] or hashlib.sha256(data).hexdigest() != expected["sha256"]:
+                print(f"Error: bundle file '{name}' does not match its checksum.")
+                return None
+            files[target] = data
+
+    for target, data in files.items():
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{os.getpid()}.part"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, target)
+    asset_cache.get_cache().rescan()
+
+    print(f"Bundle imported: {len(files)} files into '{config.CACHE_DIR}' "
+          f"(created {manifest.get('created_at', '?')}, LoL version {manifest.get('lol_version') or 'unknown'})")
+    return len(files)
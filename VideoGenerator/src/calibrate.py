@@ -0,0 +1,115 @@
+"""
+This module implements the 'calibrate' command. A sample of events is encoded under every
+encoder profile (see config.ENCODER_PROFILES), and each profile is reported with its encode
+speed, its file size and its quality, so the fastest acceptable profile can be chosen for
+the hardware at hand.
+
+Quality is the mean SSIM of the encoded video against the image it was made from: the image
+is the exact source of every frame, so it is a lossless reference. Encodes run one at a time
+with the per-process thread count of a normal run (config.ENCODE_THREADS_PER_JOB), so the
+speeds are comparable with what the scheduler achieves per ffmpeg process.
+"""
+import os
+import re
+import time
+import subprocess
+from . import config
+from . import metrics
+from . import video_generator
+
+_SSIM_PATTERN = re.compile(r"All:([0-9.]+)")
+
+def measure_ssim(video_path, image_path):
+    """Returns the mean SSIM of a video against its source image, or None if it cannot be measured."""
+    cmd = [
+        config.FFMPEG_EXE, "-v", "info", "-i", video_path, "-loop", "1", "-i", image_path,
+        "-filter_complex", "[1:v][0:v]scale2ref[ref][main];[main][ref]ssim",
+        "-shortest", "-f", "null", "-"
+    ]
+    try:
+        with metrics.get_metrics().timer("ffmpeg_seconds", operation="ssim"):
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        print(f"Error measuring quality of {video_path}: {e}")
+        return None
+    matches = _SSIM_PATTERN.findall(result.stderr)
+    return float(matches[-1]) if matches else None
+
+def _calibration_outputs(job, profile_name, output_profile):
+    """Returns the rendition outputs of an encode job inside the calibration folder of a profile."""
+    extension = video_generator.get_output_profile(output_profile)["extension"]
+    output_dir = os.path.join(config.CALIBRATION_DIR, profile_name)
+    os.makedirs(output_dir, exist_ok=True)
+    return {
+        rendition_name: os.path.join(output_dir, f"{job['name']}{config.RENDITIONS[rendition_name]['suffix']}{extension}")
+        for rendition_name in job["rendition_outputs"]
+    }
+
+def calibrate_profile(profile_name, encode_jobs, output_profile=None, silence_duration=0.0):
+    """Encodes every job under one encoder profile. Returns the measurements of the profile."""
+    measurement = {"profile": profile_name, "encoded": 0, "failed": 0, "wall_seconds": 0.0,
+                   "media_seconds": 0.0, "bytes": 0, "ssim": []}
+    for job in encode_jobs:
+        outputs = _calibration_outputs(job, profile_name, output_profile)
+        start = time.perf_counter()
+        created = video_generator.create_video_renditions(
+            job["image_paths"], job["audio_files"], outputs, silence_duration,
+            config.ENCODE_THREADS_PER_JOB, output_profile, profile_name
+        )
+        elapsed = time.perf_counter() - start
+        if not created:
+            measurement["failed"] += 1
+            continue
+
+        measurement["encoded"] += 1
+        measurement["wall_seconds"] += elapsed
+        measurement["media_seconds"] += video_generator.get_total_audio_duration(job["audio_files"], silence_duration) or 0.0
+        for rendition_name, output_path in outputs.items():
+            measurement["bytes"] += os.path.getsize(output_path)
+            image_path = job["image_paths"][config.RENDITIONS[rendition_name]["layout"]]
+            ssim = measure_ssim(output_path, image_path)
+            if ssim is not None:
+                measurement["ssim"].append(ssim)
+    return measurement
+
+def choose_profile(measurements, min_ssim=None):
+    """Returns the name of the fastest profile whose mean SSIM reaches min_ssim, or None."""
+    min_ssim = config.CALIBRATION_MIN_SSIM if min_ssim is None else min_ssim
+    acceptable = [
+        m for m in measurements
+        if m["encoded"] and not m["failed"] and m["ssim"] and sum(m["ssim"]) / len(m["ssim"]) >= min_ssim
+    ]
+    if not acceptable:
+        return None
+    return min(acceptable, key=lambda m: m["wall_seconds"])["profile"]
+
+def run_calibration(encode_jobs, output_profile=None, silence_duration=0.0, profile_names=None):
+    """
+    Encodes the sample under every encoder profile and prints the comparison.
+    Returns (measurements, recommended profile name or None).
+    """
+    profile_names = profile_names or list(config.ENCODER_PROFILES)
+    print(f"\n--- CALIBRATING {len(profile_names)} ENCODER PROFILES ON {len(encode_jobs)} EVENTS ---")
+
+    measurements = []
+    for profile_name in profile_names:
+        print(f"\n[{profile_name}] {config.ENCODER_PROFILES[profile_name]['description']}")
+        measurements.append(calibrate_profile(profile_name, encode_jobs, output_profile, silence_duration))
+
+    print("\n=== CALIBRATION SUMMARY ===")
+    print(f"{'Profile':<12} {'Encode time':>12} {'Speed':>9} {'Avg size':>11} {'Mean SSIM':>10}  Failed")
+    for m in measurements:
+        speed = f"{m['media_seconds'] / m['wall_seconds']:.1f}x" if m["wall_seconds"] else "-"
+        average_size = f"{m['bytes'] / m['encoded'] / 1024:.0f} KiB" if m["encoded"] else "-"
+        ssim = f"{sum(m['ssim']) / len(m['ssim']):.4f}" if m["ssim"] else "-"
+        print(f"{m['profile']:<12} {m['wall_seconds']:>11.2f}s {speed:>9} {average_size:>11} {ssim:>10}  {m['failed']}")
+
+    recommended = choose_profile(measurements)
+    if recommended:
+        print(f"\nFastest profile with a mean SSIM of at least {config.CALIBRATION_MIN_SSIM}: {recommended}")
+        print(f"Use it with '--encoder-profile {recommended}', or set DEFAULT_ENCODER_PROFILE in src/config.py.")
+    else:
+        print(f"\nNo profile reached a mean SSIM of {config.CALIBRATION_MIN_SSIM} on every sample.")
+    print(f"Calibration videos: '{config.CALIBRATION_DIR}'")
+    print("===========================")
+    return measurements, recommended
@@ -10,6 +10,12 @@ CACHE_DIR = os.path.join(UTILS_DIR, "cache")
 ICON_CACHE_DIR = os.path.join(CACHE_DIR, "icon_cache")
 ITEM_ICON_CACHE_DIR = os.path.join(CACHE_DIR, "item_cache")
 MONSTER_ICON_CACHE_DIR = os.path.join(CACHE_DIR, "monsters_cache")
+SPRITE_CACHE_DIR = os.path.join(CACHE_DIR, "sprite_cache")
+# Rendered event images, named after the hash of their render inputs
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, "render_cache")
+# Images and short video tracks without text, shared by the events of --text-mode
+BASE_IMAGE_DIR = os.path.join(CACHE_DIR, "base_images")
+BASE_TRACK_CACHE_DIR = os.path.join(CACHE_DIR, "base_tracks")
 
 # URL for monster data
 MONSTER_WIKI_BASE_URL = "https://wiki.leagueoflegends.com"
@@ -22,17 +28,331 @@ FFMPEG_BIN_DIR = os.path.join(UTILS_DIR, "bin")
 FFMPEG_EXE = os.path.join(FFMPEG_BIN_DIR, "ffmpeg.exe")
 FFPROBE_EXE = os.path.join(FFMPEG_BIN_DIR, "ffprobe.exe")
 
+# --- LAYOUTS AND RENDITIONS ---
+# Layout presets describe how an event image is composed for a given canvas.
+# "background_fit" is either "stretch" (resize to the canvas) or "cover" (scale and center-crop).
+# "icon_align" places the icon above the ribbon, on the "left" (with margin) or in the "center".
+LAYOUT_PRESETS = {
+    "landscape": {
+        "size": (1920, 1080),
+        "background_fit": "stretch",
+        "font_size": 52,
+        "ribbon_height": 120,
+        "text_anchor_y": 958,
+        "icon_size": 180,
+        "icon_align": "left",
+        "icon_margin_left": 50,
+        "icon_margin_bottom": 20,
+    },
+    "vertical": {
+        "size": (1080, 1920),
+        "background_fit": "cover",
+        "font_size": 56,
+        "ribbon_height": 160,
+        "text_anchor_y": 1460,
+        "icon_size": 260,
+        "icon_align": "center",
+        "icon_margin_left": 0,
+        "icon_margin_bottom": 40,
+    },
+}
+
+# Renditions are the videos written for every event. Each one uses a layout and an output size,
+# and all the requested renditions of an event are encoded by a single ffmpeg process.
+RENDITIONS = {
+    "1080p": {"layout": "landscape", "size": (1920, 1080), "suffix": ""},
+    "720p": {"layout": "landscape", "size": (1280, 720), "suffix": "_720p"},
+    "vertical": {"layout": "vertical", "size": (1080, 1920), "suffix": "_vertical"},
+    # 480p previews written by --draft (see DRAFT_RENDITIONS)
+    "draft": {"layout": "landscape", "size": (854, 480), "suffix": ""},
+    "draft_vertical": {"layout": "vertical", "size": (480, 854), "suffix": "_vertical"},
+}
+DEFAULT_RENDITIONS = ["1080p"]
+
+# --- OUTPUT PROFILES ---
+# Container and codecs of the videos. The rate control of the video codec comes from the
+# encoder profile (see ENCODER_PROFILES). "audio" is either "transcode" (always encode with
+# "audio_args") or "copy": the source Ogg audio is muxed by stream copy when every clip of the
+# event shares the codec and its parameters, and it falls back to "audio_args" otherwise.
+# "copy_codecs" limits stream copy to the audio codecs the container accepts.
+# "subtitle_codec" is the subtitle format of the container, used by --text-mode subtitles.
+OUTPUT_PROFILES = {
+    "mp4": {
+        "extension": ".mp4",
+        "video_codec": "libx264",
+        "audio": "transcode",
+        "audio_args": ["-c:a", "aac", "-b:a", "128k"],
+        "subtitle_codec": "mov_text",
+    },
+    "mkv": {
+        "extension": ".mkv",
+        "video_codec": "libx264",
+        "audio": "copy",
+        "audio_args": ["-c:a", "libopus", "-b:a", "128k"],
+        "subtitle_codec": "srt",
+    },
+    "webm": {
+        "extension": ".webm",
+        "video_codec": "libvpx-vp9",
+        "audio": "copy",
+        "copy_codecs": ["vorbis", "opus"],
+        "audio_args": ["-c:a", "libopus", "-b:a", "128k"],
+        "subtitle_codec": "webvtt",
+    },
+}
+# AAC in MP4 stays the default, since it is what most upload platforms expect.
+DEFAULT_OUTPUT_PROFILE = "mp4"
+
+# --- ENCODER PROFILES ---
+# How the still image is turned into video. "fps" is the frame rate read from the image,
+# "gop_seconds" the distance between keyframes (None lets the encoder decide), and the
+# codec keys hold the rate control arguments for each video codec of OUTPUT_PROFILES.
+# Run 'python main.py calibrate' to compare them on your own hardware.
+ENCODER_PROFILES = {
+    "balanced": {
+        "description": "25 fps, x264 superfast CRF 25 (the historical settings)",
+        "fps": 25,
+        "gop_seconds": None,
+        "libx264": ["-tune", "stillimage", "-preset", "superfast", "-crf", "25"],
+        "libvpx-vp9": ["-deadline", "realtime", "-cpu-used", "8", "-crf", "35", "-b:v", "0"],
+    },
+    "fast": {
+        "description": "25 fps, x264 ultrafast CRF 28",
+        "fps": 25,
+        "gop_seconds": None,
+        "libx264": ["-tune", "stillimage", "-preset", "ultrafast", "-crf", "28"],
+        "libvpx-vp9": ["-deadline", "realtime", "-cpu-used", "8", "-crf", "40", "-b:v", "0"],
+    },
+    "quality": {
+        "description": "25 fps, x264 medium CRF 20",
+        "fps": 25,
+        "gop_seconds": None,
+        "libx264": ["-tune", "stillimage", "-preset", "medium", "-crf", "20"],
+        "libvpx-vp9": ["-deadline", "good", "-cpu-used", "4", "-crf", "31", "-b:v", "0"],
+    },
+    "draft": {
+        "description": "1 fps, one keyframe every 10 s, x264 ultrafast CRF 32 (previews)",
+        "fps": 1,
+        "gop_seconds": 10,
+        "libx264": ["-tune", "stillimage", "-preset", "ultrafast", "-crf", "32"],
+        "libvpx-vp9": ["-deadline", "realtime", "-cpu-used", "8", "-crf", "50", "-b:v", "0"],
+    },
+    "still": {
+        "description": "2 fps, one keyframe every 10 s, x264 superfast CRF 25",
+        "fps": 2,
+        "gop_seconds": 10,
+        "libx264": ["-tune", "stillimage", "-preset", "superfast", "-crf", "25"],
+        "libvpx-vp9": ["-deadline", "realtime", "-cpu-used", "8", "-crf", "35", "-b:v", "0"],
+    },
+}
+DEFAULT_ENCODER_PROFILE = "balanced"
+
+# --- DRAFT PREVIEWS ---
+# --draft renders the images at DRAFT_LAYOUT_SCALE and encodes 480p previews with the draft
+# encoder profile, in their own folders, so translators can review them before the final render.
+DRAFT_LAYOUT_SCALE = 0.5
+# Draft rendition replacing the renditions of each layout
+DRAFT_RENDITIONS = {"landscape": "draft", "vertical": "draft_vertical"}
+DRAFT_ENCODER_PROFILE = "draft"
+DRAFT_OUTPUT_DIR = os.path.join(OUTPUT_BASE_DIR, "draft")
+DRAFT_IMAGES_DIR = os.path.join(DRAFT_OUTPUT_DIR, "images")
+DRAFT_VIDEOS_DIR = os.path.join(DRAFT_OUTPUT_DIR, "videos")
+CONTACT_SHEET_PATH = os.path.join(DRAFT_OUTPUT_DIR, "contact_sheet.html")
+# Approved events, one 'audio_folder/event' per line, as saved from the contact sheet
+APPROVED_EVENTS_PATH = os.path.join(DRAFT_OUTPUT_DIR, "approved.txt")
+
+# --- CALIBRATION ---
+# Number of events encoded under every encoder profile by the 'calibrate' command
+CALIBRATION_SAMPLE_SIZE = 5
+# Lowest mean SSIM (against the source image) a profile needs to be recommended
+CALIBRATION_MIN_SSIM = 0.97
+CALIBRATION_DIR = os.path.join(OUTPUT_BASE_DIR, "calibration")
+
+# --- RENDER SERVICE ---
+# Address of the service started by the 'serve' command (see src/render_service.py).
+# Keep it on localhost: the service renders any clip path it is given.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+# Requests rendered at the same time. None splits the encode CPU budget like a normal run.
+SERVICE_WORKERS = None
+# Requests allowed to wait for a worker before new ones are refused
+SERVICE_MAX_PENDING = 32
+# Output subfolder of the events requested with explicit text instead of an audio folder
+SERVICE_OUTPUT_FOLDER = "service"
+
+# --- VERIFY ---
+# Parallel file readers used by the 'verify' command. None uses four per CPU core.
+VERIFY_WORKERS = None
+# Largest difference in seconds allowed between a video and its audio. Videos end on a frame
+# boundary, so this must stay above the frame interval of the slowest encoder profile (1 fps).
+VERIFY_DURATION_TOLERANCE = 1.0
+# Events whose videos failed verification, in the format read by --approved
+VERIFY_FAILURES_PATH = os.path.join(OUTPUT_BASE_DIR, "verify_failures.txt")
+
+# --- TEXT MODES ---
+# How the text of an event reaches its video (see --text-mode):
+#   "image": drawn into a PNG rendered for each event (the historical output).
+#   "drawtext": one image without text per background and icon, the text is drawn by ffmpeg
+#               while encoding, so no image is rendered per event.
+#   "subtitles": one short video track without text per background, icon and rendition,
+#                encoded once and looped by stream copy. The text is a subtitle track, shown
+#                by players (and upload platforms) instead of being drawn into the video.
+TEXT_MODE = "image"
+TEXT_MODES = ("image", "drawtext", "subtitles")
+# Length of the base tracks of the subtitles mode, looped for longer events
+BASE_TRACK_SECONDS = 10
+
+# --- LOUDNESS NORMALIZATION ---
+# EBU R128 target of --loudnorm: integrated loudness (LUFS), true peak (dBTP), loudness range (LU).
+# Every clip is normalized on its own before the concat, so clips from different sessions match.
+LOUDNORM_TARGET = {"I": -16, "TP": -1.5, "LRA": 11}
+# Loudness measurements, keyed by clip content and target (see src/loudness.py)
+LOUDNESS_DB_PATH = os.path.join(CACHE_DIR, "loudness.sqlite3")
+
+# --- AUDIO METADATA ---
+# ffprobe results of every clip, reused until the clip changes (see src/audio_metadata.py)
+AUDIO_METADATA_DB_PATH = os.path.join(CACHE_DIR, "audio_metadata.sqlite3")
+# Parallel ffprobe processes used to probe new clips. None uses every CPU core.
+AUDIO_PROBE_WORKERS = None
+
+# --- ENCODE SCHEDULING ---
+# Total threads shared by all concurrent ffmpeg processes. None uses every CPU core.
+ENCODE_CPU_BUDGET = None
+# Base number of threads per ffmpeg process. The budget divided by this gives the number of
+# concurrent processes. Jobs started when the queue drains receive the threads left free.
+ENCODE_THREADS_PER_JOB = 2
+# Short events encoded together by one ffmpeg process (see --batch-size). 1 disables batching.
+ENCODE_BATCH_SIZE = 1
+# Only events with at most this many seconds of audio are batched; longer ones gain nothing.
+ENCODE_BATCH_MAX_SECONDS = 5.0
+
+# --- IMAGE RENDERING ---
+# Processes rendering the images of a run in parallel (see --render-workers). 1 renders them
+# one by one in the main process. Decoded backgrounds and icons are shared between the
+# processes through shared memory (see src/template_pool.py).
+RENDER_WORKERS = 1
+
+# --- SPLIT STAGES ---
+# Handoff manifest written by '--stage images' and read by '--stage videos' (see src/stage_manifest.py)
+STAGE_MANIFEST_PATH = os.path.join(OUTPUT_BASE_DIR, "stage_manifest.json")
+
+# --- DEDUPLICATION ---
+# Index of earlier outputs, used to reuse a video instead of encoding identical inputs again.
+DEDUP_INDEX_PATH = os.path.join(OUTPUT_BASE_DIR, "dedup_index.json")
+
+# --- METRICS ---
+# Counters and histograms exported after every run (see src/metrics.py): a Prometheus
+# textfile per node, replaced by each run, and a JSON summary per run.
+METRICS_DIR = os.path.join(OUTPUT_BASE_DIR, "metrics")
+# Folder of the textfiles, 'videogenerator_<node>.prom'. Point it at the local directory of the
+# node_exporter textfile collector when 'output/' is shared by several nodes.
+METRICS_TEXTFILE_DIR = METRICS_DIR
+# Name of this machine in the metrics ("node" label and textfile name). None uses the hostname;
+# --node-id overrides it.
+METRICS_NODE = None
+METRICS_PREFIX = "videogenerator_"
+# Upper bounds in seconds of the histogram buckets (ffmpeg and render times)
+METRICS_HISTOGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# --- PROFILING ---
+# Reports written by '--profile', one timestamped folder per run.
+PROFILE_OUTPUT_DIR = os.path.join(OUTPUT_BASE_DIR, "profile")
+PROFILE_TRACEMALLOC_FRAMES = 1
+PROFILE_TOP_ALLOCATIONS = 25
+# Number of functions shown per stage in the summary printed at the end of the run.
+PROFILE_HOT_SPOTS = 5
+
 # --- LANGUAGE SELECTION ---
 # Supported languages: "EN" (English), "TR" (Turkish)
 SELECTED_LANGUAGE = "EN"
 
+# --- DETERMINISTIC SELECTION ---
+# Backgrounds and category champions are picked at random. With a seed (e.g. "v1"), every pick
+# depends only on the seed and the event, so outputs are reproducible across runs and machines.
+SELECTION_SEED = None
+
 # --- AUDIO SILENCE ---
 # Default silence duration between audio tracks in seconds.
 SILENCE_DURATION = 0.0
 
 # Cache for skins data
+SKINS_DATA_URL = "https://raw.communitydragon.org/pbe/plugins/rcp-be-lol-game-data/global/default/v1/skins.json"
 SKINS_CACHE_PATH = os.path.join(CACHE_DIR, "skins_data.json")
 
+# Item icons directory listing, cached and revalidated with the server
+ITEM_ICONS_URL = "https://raw.communitydragon.org/pbe/plugins/rcp-be-lol-game-data/global/default/assets/items/icons2d/"
+ITEM_INDEX_CACHE_PATH = os.path.join(CACHE_DIR, "item_icons_index.html")
+
+# HTTP validators (ETag/Last-Modified) are stored next to each cached payload with this suffix
+HTTP_META_SUFFIX = ".meta.json"
+HTTP_CHUNK_SIZE = 64 * 1024
+
+# Champion names used in folder names that are neither the display name nor the id of the
+# champion in ddragon 'champion.json', mapped to that id (see data_fetcher.get_champion_index).
+CHAMPION_ALIASES = {
+    "Nunu": "Nunu",
+    "Willump": "Nunu",
+    "Renata": "Renata",
+    "Glasc": "Renata",
+}
+
+# Cache for the latest LoL version, so it is not requested on every run
+VERSION_CACHE_PATH = os.path.join(CACHE_DIR, "lol_version.json")
+VERSION_CACHE_TTL = 6 * 3600  # 6 hours in seconds
+
+# --- CHAMPION ICON SOURCE ---
+# "icons" downloads one 120x120 PNG per champion. "sprites" downloads the few ddragon sprite
+# sheets of the version once and crops every champion icon out of them, so a cold cache fills
+# in a handful of requests. Sprite icons are only 48x48 and look softer once scaled up, so
+# they are opt-in; a full icon already in the cache is still preferred, and champions missing
+# from the sheets are downloaded one by one.
+CHAMPION_ICON_SOURCE = "icons"
+
+# --- ASSET CACHE ---
+# Downloaded icons by asset kind (see src/asset_cache.py)
+ASSET_CACHE_KINDS = {
+    "champion": ICON_CACHE_DIR,
+    "item": ITEM_ICON_CACHE_DIR,
+    "monster": MONSTER_ICON_CACHE_DIR,
+    "sprite": SPRITE_CACHE_DIR,
+}
+ASSET_CACHE_INDEX_PATH = os.path.join(CACHE_DIR, "asset_index.json")
+# Least recently used icons are deleted above this size. None keeps every icon.
+ASSET_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# New assets are merged into the index file this many at a time, and at the end of the run
+ASSET_CACHE_FLUSH_EVERY = 200
+# Icons used within this many seconds are never evicted, even above the size cap, so a render
+# running on another process does not lose an icon it has just looked up
+ASSET_CACHE_EVICTION_GRACE_SECONDS = 3600
+
+# --- OFFLINE BUNDLES ---
+# With OFFLINE set (see --offline), every lookup is served from the cache and nothing is
+# downloaded. Bundles ('bundle export'/'bundle import') carry the cache to offline nodes.
+OFFLINE = False
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_DEFAULT_PATH = os.path.join(OUTPUT_BASE_DIR, "asset_bundle.zip")
+BUNDLE_MANIFEST_NAME = "manifest.json"
+
+# --- PREFETCH ---
+# Number of parallel downloads used by the 'prefetch' command.
+PREFETCH_WORKERS = 8
+# Monster icons downloaded by 'prefetch', named like the folders parsed by MonsterAttackHandler.
+KNOWN_MONSTERS = [
+    "Baron", "Blue_Sentinel", "Dragon", "Elder_Dragon", "Elemental_Dragon", "Gromp",
+    "Herald", "Krug", "Murkwolf", "Raptor", "Red_Brambleback",
+]
+
+# --- DISTRIBUTED MODE ---
+# Shared queue directory used when several render nodes work on the same output share.
+QUEUE_DIR = os.path.join(OUTPUT_BASE_DIR, "queue")
+# A lease is considered abandoned when its heartbeat is older than this many seconds.
+QUEUE_LEASE_SECONDS = 120
+QUEUE_HEARTBEAT_SECONDS = 30
+# How long a node waits before checking again for jobs leased by other nodes.
+QUEUE_POLL_SECONDS = 10
+# A job that fails this many times is marked as finished with an error.
+QUEUE_MAX_ATTEMPTS = 3
+
 # Dictionary of champions by region/type
 CHAMPIONS_BY_REGIONS = {
     "Bandle City": ["Corki", "Lulu", "Yuumi", "Veigar"],
@@ -0,0 +1,86 @@
+"""
+This module writes the HTML contact sheet of a draft run (see --draft): every event image
+on one page, with a checkbox per event. The reviewer ticks the events that are right and
+saves the list as 'approved.txt', which '--approved' then uses to render only those events
+at full quality.
+"""
+import os
+import html
+from urllib.request import pathname2url
+from . import config
+
+_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Draft contact sheet</title>
+<style>
+body {{ font-family: sans-serif; background: #222; color: #eee; margin: 16px; }}
+.grid {{ display: flex; flex-wrap: wrap; gap: 12px; }}
+.event {{ background: #333; padding: 8px; width: 320px; }}
+.event img {{ width: 100%; display: block; margin-bottom: 4px; }}
+.event label {{ display: block; word-break: break-all; font-size: 13px; }}
+button {{ font-size: 15px; padding: 6px 12px; margin-bottom: 12px; }}
+</style>
+</head>
+<body>
+<h1>Draft contact sheet ({count} events)</h1>
+<button onclick="saveApproved()">Save approved list</button>
+<div class="grid">
+{cards}
+</div>
+<script>
+function saveApproved() {{
+  var ids = [];
+  document.querySelectorAll("input[type=checkbox]:checked").forEach(function (box) {{ ids.push(box.value); }});
+  var link = document.createElement("a");
+  link.href = URL.createObjectURL(new Blob([ids.join("\\n") + "\\n"], {{type: "text/plain"}}));
+  link.download = "approved.txt";
+  link.click();
+}}
+</script>
+</body>
+</html>
+"""
+
+_CARD_TEMPLATE = """<div class="event">
+{images}
+<label><input type="checkbox" value="{event_id}"> {event_id}</label>
+</div>"""
+
+def write_contact_sheet(events, output_path=None):
+    """
+    Writes the contact sheet of a list of (event id, image paths) pairs, where the event id is
+    'audio_folder/event'. Images that do not exist are left out. Returns the sheet path.
+    """
+    output_path = output_path or config.CONTACT_SHEET_PATH
+    sheet_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(sheet_dir, exist_ok=True)
+
+    cards = []
+    for event_id, image_paths in events:
+        images = [
+            f'<img loading="lazy" src="{html.escape(pathname2url(os.path.relpath(path, sheet_dir)))}">'
+            for path in image_paths if os.path.exists(path)
+        ]
+        if images:
+            cards.append(_CARD_TEMPLATE.format(images="\n".join(images), event_id=html.escape(event_id)))
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(_PAGE_TEMPLATE.format(count=len(cards), cards="\n".join(cards)))
+    print(f"Contact sheet: '{output_path}' ({len(cards)} events)")
+    return output_path
+
+def load_approved_events(path):
+    """
+    Reads an approved list. Returns the set of approved 'audio_folder/event' ids; a line without
+    an audio folder approves the event in every audio folder.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip() and not line.startswith("#")}
+
+def is_approved(approved_events, audio_folder_name, folder):
+    """Tells whether an event is in the approved list. Without a list, every event is."""
+    if approved_events is None:
+        return True
+    return f"{audio_folder_name}/{folder}" in approved_events or folder in approved_events
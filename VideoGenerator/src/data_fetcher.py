@@ -1,69 +1,300 @@
 import os
 import json
 import time
-import requests
 import re
+import threading
+from urllib.parse import urlsplit
 from . import config
+from . import metrics
+from . import utils
 
-def get_skins_data():
-    """Gets the skin data, using cache if available."""
-    if os.path.exists(config.SKINS_CACHE_PATH):
-        try:
-            cache_age = time.time() - os.path.getmtime(config.SKINS_CACHE_PATH)
-            if cache_age < 86400:  # 24 hours in seconds
-                print("Using skins cache...")
-                with open(config.SKINS_CACHE_PATH, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Error reading skins cache: {e}")
-            return []
+# 'requests' is imported inside the functions that go to the network: it is slow to import,
+# and runs that find everything in the cache never need it.
+
+_skins_data = None
+_champion_indexes = {}
 
-    print("Downloading skins data...")
+def _offline(what):
+    """Returns True in offline mode, telling which download was skipped."""
+    if config.OFFLINE:
+        print(f"Offline mode: not downloading {what}.")
+    return config.OFFLINE
+
+def _read_http_meta(cache_path):
     try:
-        response = requests.get("https://raw.communitydragon.org/pbe/plugins/rcp-be-lol-game-data/global/default/v1/skins.json")
-        response.raise_for_status()
-        skins_data = response.json()
+        with open(cache_path + config.HTTP_META_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _forget_validators(cache_path):
+    """Removes the validators of a cached payload, so the next revalidation downloads it again."""
+    try:
+        os.remove(cache_path + config.HTTP_META_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+def _record_http(url, status, size=0):
+    """Counts an HTTP request and the bytes of its body in the run metrics."""
+    host = urlsplit(url).hostname or "unknown"
+    metrics.get_metrics().increment("http_requests_total", host=host, status=status)
+    if size:
+        metrics.get_metrics().increment("http_response_bytes_total", size, host=host)
+
+def _record_http_error(url, error):
+    """Counts a request that got no response at all. Error statuses were already counted with their code."""
+    if getattr(error, "response", True) is None:
+        _record_http(url, "error")
+
+def fetch_with_revalidation(url, cache_path, label):
+    """
+    Keeps a cached copy of a URL up to date using HTTP conditional requests.
+    The ETag/Last-Modified validators are stored next to the payload, so an unchanged resource
+    only costs a 304 response. New content is streamed to a temporary file and moved into place.
+    Returns the path of the cached payload, or None if it is not available at all.
+    In offline mode the cached copy is used as is.
+    """
+    cache_kind = label.replace(" ", "_")
+    if config.OFFLINE:
+        if os.path.exists(cache_path):
+            metrics.get_metrics().increment("cache_lookups_total", kind=cache_kind, result="hit")
+            return cache_path
+        metrics.get_metrics().increment("cache_lookups_total", kind=cache_kind, result="miss")
+        _offline(label)
+        return None
+
+    import requests
+    meta = _read_http_meta(cache_path) if os.path.exists(cache_path) else {}
+    headers = {'User-Agent': 'My-Agent/1.0'}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
 
-        os.makedirs(config.CACHE_DIR, exist_ok=True)
-        with open(config.SKINS_CACHE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(skins_data, f, ensure_ascii=False, indent=2)
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+            if response.status_code == 304:
+                _record_http(url, 304)
+                metrics.get_metrics().increment("cache_lookups_total", kind=cache_kind, result="hit")
+                print(f"{label.capitalize()} not modified, using cache...")
+                return cache_path
+            if not response.ok:
+                _record_http(url, response.status_code)
+            response.raise_for_status()
+            metrics.get_metrics().increment("cache_lookups_total", kind=cache_kind, result="miss")
+
+            print(f"Downloading {label}...")
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Several threads and nodes may refresh the same shared cache file at once
+            temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.part"
+            size = 0
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=config.HTTP_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(temp_path, cache_path)
+            _record_http(url, response.status_code, size)
 
-        print(f"Skins data downloaded and saved to cache ({len(skins_data)} skins)")
-        return skins_data
+            new_meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            meta_temp_path = f"{cache_path}{config.HTTP_META_SUFFIX}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(meta_temp_path, 'w', encoding='utf-8') as f:
+                json.dump(new_meta, f)
+            os.replace(meta_temp_path, cache_path + config.HTTP_META_SUFFIX)
+            return cache_path
     except requests.RequestException as e:
-        print(f"Error downloading skins data: {e}")
+        _record_http_error(url, e)
+        print(f"Error downloading {label}: {e}")
+        if os.path.exists(cache_path):
+            print(f"Using the cached {label}, which could not be revalidated.")
+            return cache_path
+        return None
+
+def get_skins_data():
+    """Gets the skin data, revalidating the cache with the server once per run."""
+    global _skins_data
+    if _skins_data is not None:
+        return _skins_data
+
+    skins_path = fetch_with_revalidation(config.SKINS_DATA_URL, config.SKINS_CACHE_PATH, "skins data")
+    if skins_path is None:
+        return []
+    try:
+        with open(skins_path, 'r', encoding='utf-8') as f:
+            _skins_data = json.load(f)
+    except Exception as e:
+        print(f"Error reading skins cache: {e}")
+        # Otherwise the server would keep answering 304 and the broken copy would be used forever
+        _forget_validators(config.SKINS_CACHE_PATH)
         return []
 
+    print(f"Skins data loaded ({len(_skins_data)} skins)")
+    return _skins_data
+
+def _read_cached_version():
+    """Returns (version, age in seconds) from the version cache, or (None, None)."""
+    try:
+        with open(config.VERSION_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        return cached["version"], time.time() - cached["fetched_at"]
+    except (FileNotFoundError, KeyError, ValueError, TypeError):
+        return None, None
+
 def get_latest_lol_version():
+    """
+    Gets the latest LoL version, reusing the cached one while it is younger than the TTL.
+    In offline mode the cached version is used whatever its age.
+    """
+    cached_version, cache_age = _read_cached_version()
+    if cached_version and (cache_age < config.VERSION_CACHE_TTL or config.OFFLINE):
+        return cached_version
+    if _offline("the LoL version"):
+        return None
+
+    import requests
+    versions_url = "https://ddragon.leagueoflegends.com/api/versions.json"
     try:
-        response = requests.get("https://ddragon.leagueoflegends.com/api/versions.json")
+        response = requests.get(versions_url)
+        _record_http(versions_url, response.status_code, len(response.content))
         response.raise_for_status()
-        return response.json()[0]
+        version = response.json()[0]
     except requests.RequestException as e:
+        _record_http_error(versions_url, e)
         print(f"Error getting LoL version: {e}")
+        if cached_version:
+            print(f"Using last known LoL version from cache: {cached_version}")
+        return cached_version
+
+    os.makedirs(config.CACHE_DIR, exist_ok=True)
+    with open(config.VERSION_CACHE_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"version": version, "fetched_at": time.time()}, f)
+    return version
+
+def get_champion_data(version):
+    """
+    Gets the ddragon 'champion.json' data of a version, keyed by champion id.
+    The file never changes for a given version, so it is cached forever.
+    """
+    cache_path = os.path.join(config.CACHE_DIR, f"champion_{version}.json")
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading champion data cache: {e}")
+    if _offline(f"the champion data of version {version}"):
+        return {}
+
+    import requests
+    url = f"https://ddragon.leagueoflegends.com/cdn/{version}/data/en_US/champion.json"
+    try:
+        response = requests.get(url)
+        _record_http(url, response.status_code, len(response.content))
+        response.raise_for_status()
+        champion_data = response.json()["data"]
+    except (requests.RequestException, KeyError, ValueError) as e:
+        _record_http_error(url, e)
+        print(f"Error getting champion data for version {version}: {e}")
+        return {}
+
+    os.makedirs(config.CACHE_DIR, exist_ok=True)
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(champion_data, f, ensure_ascii=False)
+    return champion_data
+
+def normalize_champion_name(name):
+    """Lowercases a champion name and drops spaces and punctuation ("Kai'Sa" -> "kaisa")."""
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+def get_champion_index(version):
+    """
+    Returns the champion index of a version, built once from 'champion.json' and cached on disk:
+    "aliases" maps every normalized display name, id, numeric key and alias (see
+    config.CHAMPION_ALIASES) to the champion id, "icons" maps each id to its icon file and
+    "sprites" maps each id to its place in the ddragon sprite sheets. Returns None when the
+    champion data of the version is not available.
+    """
+    if version in _champion_indexes:
+        return _champion_indexes[version]
+
+    index_path = os.path.join(config.CACHE_DIR, f"champion_index_{version}.json")
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        # Indexes written before sprite sheets were used are rebuilt from the cached data
+        if "sprites" in index:
+            _champion_indexes[version] = index
+            return index
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        print(f"Error reading champion index cache, rebuilding it: {e}")
+
+    champion_data = get_champion_data(version)
+    if not champion_data:
         return None
 
+    index = {"aliases": {}, "icons": {}, "sprites": {}}
+    for champion_id, champion in champion_data.items():
+        image = champion.get("image", {})
+        index["icons"][champion_id] = image.get("full", f"{champion_id}.png")
+        if all(key in image for key in ("sprite", "x", "y", "w", "h")):
+            index["sprites"][champion_id] = {key: image[key] for key in ("sprite", "x", "y", "w", "h")}
+        for name in (champion_id, champion.get("name"), champion.get("key")):
+            if name:
+                index["aliases"][normalize_champion_name(name)] = champion_id
+    for alias, champion_id in config.CHAMPION_ALIASES.items():
+        if champion_id in index["icons"]:
+            index["aliases"].setdefault(normalize_champion_name(alias), champion_id)
+
+    os.makedirs(config.CACHE_DIR, exist_ok=True)
+    temp_path = f"{index_path}.{os.getpid()}.part"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+    _champion_indexes[version] = index
+    return index
+
 def download_icon(url, save_path):
-    """Generic function to download an image from a URL."""
+    """
+    Generic function to download an image from a URL. The image is only moved into place
+    once it is known to be whole, so an interrupted download never leaves a broken file.
+    """
+    if _offline(url):
+        return None
+    import requests
     try:
         print(f"Downloading from: {url}")
-        response = requests.get(url, headers={'User-Agent': 'My-Agent/1.0'})
+        response = requests.get(url, headers={'User-Agent': 'My-Agent/1.0'}, timeout=30)
+        _record_http(url, response.status_code, len(response.content))
         response.raise_for_status()
-        with open(save_path, "wb") as f:
-            f.write(response.content)
-        return save_path
     except requests.RequestException as e:
+        _record_http_error(url, e)
         print(f"Error downloading {url}: {e}")
         return None
 
+    if not utils.is_complete_image(response.content):
+        print(f"Error downloading {url}: the response is not a complete image.")
+        return None
+    temp_path = f"{save_path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(temp_path, "wb") as f:
+        f.write(response.content)
+    os.replace(temp_path, save_path)
+    return save_path
+
 def fetch_item_icon_html():
-    """Fetches the HTML content from the item icon URL."""
+    """Fetches the HTML content from the item icon URL, revalidating the cached copy."""
+    index_path = fetch_with_revalidation(config.ITEM_ICONS_URL, config.ITEM_INDEX_CACHE_PATH, "item icon index")
+    if index_path is None:
+        return ""
     try:
-        response = requests.get("https://raw.communitydragon.org/pbe/plugins/rcp-be-lol-game-data/global/default/assets/items/icons2d/")
-        response.raise_for_status()
-        return response.text
-    except requests.RequestException as e:
-        print(f"Error fetching item icon HTML: {e}")
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError as e:
+        print(f"Error reading item icon index: {e}")
         return ""
 
 def get_all_item_icon_filenames():
@@ -78,21 +309,28 @@ def get_all_item_icon_filenames():
 
 def get_monster_wiki_content():
     """Fetches the HTML content of the monster wiki page directly from the web."""
+    if _offline("the monster wiki page"):
+        return ""
+    import requests
     print("Fetching monster wiki page from the web...")
     try:
         response = requests.get(config.MONSTER_WIKI_URL, headers={'User-Agent': 'My-Agent/1.0'})
+        _record_http(config.MONSTER_WIKI_URL, response.status_code, len(response.content))
         response.raise_for_status()
         return response.text
     except requests.RequestException as e:
+        _record_http_error(config.MONSTER_WIKI_URL, e)
         print(f"Error downloading monster wiki page: {e}")
         return ""
 
-def get_monster_icon_url(monster_name_formatted):
+def get_monster_icon_url(monster_name_formatted, html_content=None):
     """
     Scrapes the League of Legends wiki for the icon URL of a given monster.
     Expects monster_name_formatted to be like "Baron_Nashor" or "Blue_Sentinel".
+    The wiki page can be passed in to look up several monsters with a single download.
     """
-    html_content = get_monster_wiki_content()
+    if html_content is None:
+        html_content = get_monster_wiki_content()
     if not html_content:
         return None
 
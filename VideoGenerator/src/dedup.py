@@ -0,0 +1,164 @@
+"""
+This module avoids encoding the same video twice. Chroma and legacy skin VO packs often ship
+byte-identical clips under different folder names, so two events can have the same clips,
+the same rendered image and the same settings. Such an event reuses the earlier output
+through a reflink, a hard link or, as a last resort, a copy.
+
+Hashing is lazy: events are first bucketed by the sizes of their clips and images, and files
+are only hashed when another event (from this run or from the index of earlier runs) has the
+exact same sizes. Most events therefore never read their clips at all.
+"""
+import os
+import json
+import hashlib
+from . import config
+from .utils import ContentHasher, link_or_copy
+
+class EncodeDeduplicator:
+    """
+    Finds encode jobs whose output already exists, in this run or in an earlier one.
+
+    An encode job is a dict with "audio_files", "image_paths" and "rendition_outputs"
+    (see main.prepare_event). The index of earlier outputs is kept in config.DEDUP_INDEX_PATH.
+    mark_served(job) is called for every job served from an identical output, to record the
+    settings its outputs were made with.
+    """
+    def __init__(self, settings, index_path=None, mark_served=None):
+        self.index_path = index_path or config.DEDUP_INDEX_PATH
+        # The settings are part of every key, so outputs are only reused for identical settings
+        self.settings_json = json.dumps(settings, sort_keys=True)
+        self.hasher = ContentHasher()
+        self.encodes_saved = 0
+        self.link_methods = {}
+        self.mark_served = mark_served
+        self._index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_index(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        temp_path = self.index_path + ".part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self.index_path)
+
+    def _job_files(self, job):
+        layouts = sorted(job["image_paths"])
+        files = list(job["audio_files"]) + [job["image_paths"][name] for name in layouts]
+        # In --text-mode drawtext and subtitles, the images are shared and the text is its own file
+        if job.get("text_path"):
+            files.append(job["text_path"])
+        return files
+
+    def _size_signature(self, files):
+        """Cheap bucket key: the settings plus the size of every clip and image, in order."""
+        sizes = [os.path.getsize(path) for path in files]
+        return hashlib.sha256(json.dumps([self.settings_json, sizes]).encode()).hexdigest()
+
+    def _content_key(self, files):
+        """Full key: the settings plus the content hash of every clip and image, in order."""
+        hashes = [self.hasher.hash_file(path) for path in files]
+        return hashlib.sha256(json.dumps([self.settings_json, hashes]).encode()).hexdigest()
+
+    def _entry_key(self, entry):
+        """Returns the content key of an index entry, hashing its files the first time it is needed."""
+        if entry.get("key") is None:
+            if not all(os.path.exists(path) for path in entry["files"]):
+                return None
+            entry["key"] = self._content_key(entry["files"])
+        return entry["key"]
+
+    def _reuse(self, source_outputs, job):
+        """Links the outputs of job to source_outputs. Returns False if they cannot be linked or copied."""
+        methods = []
+        try:
+            for rendition_name, output_path in job["rendition_outputs"].items():
+                methods.append(link_or_copy(source_outputs[rendition_name], output_path))
+                # A link keeps the mtime of the earlier output, which may be older than the clips
+                # and image of this job; without a fresh mtime reruns would never see it as up to date
+                os.utime(output_path)
+        except OSError as e:
+            print(f"  ⚠ [{job['name']}] Could not reuse the identical output: {e}")
+            return False
+        for method in methods:
+            self.link_methods[method] = self.link_methods.get(method, 0) + 1
+        self.encodes_saved += 1
+        if self.mark_served:
+            self.mark_served(job)
+        return True
+
+    def plan(self, encode_jobs):
+        """
+        Returns the jobs that really need an encode. Jobs matching an earlier output are served
+        from it right away. Jobs identical to another job of this run are attached to it as
+        job["duplicates"] and served once it has been encoded (see finish).
+        """
+        buckets = {}
+        for job in encode_jobs:
+            job["dedup_files"] = self._job_files(job)
+            job["dedup_signature"] = self._size_signature(job["dedup_files"])
+            buckets.setdefault(job["dedup_signature"], []).append(job)
+
+        jobs_to_encode = []
+        primaries = {}
+        for job in encode_jobs:
+            signature = job["dedup_signature"]
+            previous_entries = self._index.get(signature, [])
+            if len(buckets[signature]) == 1 and not previous_entries:
+                jobs_to_encode.append(job)
+                continue
+
+            key = self._content_key(job["dedup_files"])
+            job["dedup_key"] = key
+
+            reused = False
+            for entry in list(previous_entries):
+                outputs = entry["outputs"]
+                if self._entry_key(entry) != key or set(outputs) != set(job["rendition_outputs"]):
+                    continue
+                if outputs == job["rendition_outputs"] or not all(os.path.exists(p) for p in outputs.values()):
+                    continue
+                if self._reuse(outputs, job):
+                    print(f"  ✓ [{job['name']}] Identical to an earlier output, reusing it instead of encoding.")
+                    reused = True
+                    break
+                # The earlier output cannot be read anymore: forget it and encode this job
+                previous_entries.remove(entry)
+            if reused:
+                continue
+
+            if key in primaries:
+                primaries[key].setdefault("duplicates", []).append(job)
+            else:
+                primaries[key] = job
+                jobs_to_encode.append(job)
+        return jobs_to_encode
+
+    def finish(self, job, created):
+        """
+        Records a finished encode in the index and serves its duplicates.
+        Returns the number of duplicate jobs that got their videos from it.
+        """
+        duplicates = job.get("duplicates", [])
+        if not created:
+            for duplicate in duplicates:
+                print(f"  ✗ [{duplicate['name']}] Not created: the identical event '{job['name']}' failed to encode.")
+            return 0
+
+        entries = self._index.setdefault(job["dedup_signature"], [])
+        entries[:] = [e for e in entries if e["outputs"] != job["rendition_outputs"]]
+        entries.append({"files": job["dedup_files"], "key": job.get("dedup_key"), "outputs": job["rendition_outputs"]})
+
+        served = 0
+        for duplicate in duplicates:
+            if self._reuse(job["rendition_outputs"], duplicate):
+                print(f"  ✓ [{duplicate['name']}] Identical to '{job['name']}', reusing its video instead of encoding.")
+                served += 1
+            else:
+                print(f"  ✗ [{duplicate['name']}] Not created. Run again with --no-dedup to encode it.")
+        return served
@@ -3,11 +3,11 @@ This module contains the event handlers for parsing folder names.
 Each handler is responsible for a specific type of event folder structure.
 """
 import re
-import random
 from abc import ABC, abstractmethod
 from . import translation
 from . import data_fetcher
 from . import config
+from . import utils
 
 class EventHandler(ABC):
     """
@@ -214,7 +214,7 @@ class GroupInteractionHandler(EventHandler):
         
         # Get a random representative champion for the icon
         champions = config.CHAMPIONS_BY_CLASS[matched_group]
-        icon_target = random.choice(champions) if champions else "General"
+        icon_target = utils.choose(champions, matched_group, name_part) if champions else "General"
         
         # Get the translated name of the group
         group_translation_key = f"class_{matched_group.lower()}"
@@ -275,7 +275,7 @@ class MappedInteractionHandler(EventHandler):
             # Handle special case for 'AppearanceDragon'
             if target_suffix == 'AppearanceDragon':
                 champions = config.CHAMPIONS_BY_SKINS["Dragonmancer"]
-                icon_target = random.choice(champions) if champions else "Aurelion Sol"
+                icon_target = utils.choose(champions, "Dragonmancer", name_part) if champions else "Aurelion Sol"
                 display_name = "Appearance Dragon"
                 result_text = self._get_text(translations, selected_language, base_text_key, display_name)
                 return result_text, icon_target, "champion"
@@ -283,7 +283,7 @@ class MappedInteractionHandler(EventHandler):
             # Check if the cleaned name corresponds to a skin theme
             if cleaned_target_name in config.CHAMPIONS_BY_SKINS:
                 champions = config.CHAMPIONS_BY_SKINS[cleaned_target_name]
-                icon_target = random.choice(champions) if champions else "General"
+                icon_target = utils.choose(champions, cleaned_target_name, name_part) if champions else "General"
                 
                 skin_theme_translation_key = f"skin_theme_{cleaned_target_name.lower().replace(' ', '_')}"
                 display_name = self._get_text(translations, selected_language, skin_theme_translation_key)
@@ -1,10 +1,21 @@
 import os
 import re
 import difflib
+import threading
 from . import config
+from . import asset_cache
 from src import data_fetcher
 
-ITEM_ICON_FILENAMES = data_fetcher.get_all_item_icon_filenames()
+ITEM_ICON_BASE_URL = config.ITEM_ICONS_URL
+# The item icon index is only downloaded when the first item icon is needed, not at import
+_item_icon_filenames = None
+
+def get_item_icon_filenames():
+    """Returns the filenames of every item icon, fetching the index once per run."""
+    global _item_icon_filenames
+    if _item_icon_filenames is None:
+        _item_icon_filenames = data_fetcher.get_all_item_icon_filenames()
+    return _item_icon_filenames
 
 def get_item_icon(item_name):
     """Gets an item's icon by searching for the best fuzzy match."""
@@ -14,7 +25,7 @@ def get_item_icon(item_name):
     highest_score = 0.0
     MATCH_THRESHOLD = 0.6 # Lowered threshold to catch partial matches like 'runaans' in 'runaanshurricane'
 
-    for filename in ITEM_ICON_FILENAMES:
+    for filename in get_item_icon_filenames():
         # Clean and split filename into parts. Also handle hyphens.
         filename_parts = filename.lower().replace('.png', '').replace('-', '_').split('_')
         
@@ -44,59 +55,114 @@ def get_item_icon(item_name):
 
     found_filename = best_match_filename
     print(f"Found best match for '{item_name}': '{found_filename}' with score {highest_score:.2f}")
-    icon_path = os.path.join(config.ITEM_ICON_CACHE_DIR, found_filename)
-
-    if os.path.exists(icon_path):
+    cache = asset_cache.get_cache()
+    icon_path = cache.lookup("item", found_filename)
+    if icon_path:
         print(f"Using item icon from cache: {found_filename}")
         return icon_path
 
-    url = f"https://raw.communitydragon.org/pbe/plugins/rcp-be-lol-game-data/global/default/assets/items/icons2d/{found_filename}"
     print(f"Downloading new item icon: {found_filename}")
-    os.makedirs(os.path.dirname(icon_path), exist_ok=True)
-    return data_fetcher.download_icon(url, icon_path)
+    return cache.fetch("item", found_filename, f"{ITEM_ICON_BASE_URL}{found_filename}")
 
 def get_cached_icons():
-    """Gets the list of icons already downloaded in the cache."""
-    if os.path.exists(config.ICON_CACHE_DIR) is False:
-        os.makedirs(config.ICON_CACHE_DIR, exist_ok=True)
-        return set()
-    
-    cached_icons = set()
-    for filename in os.listdir(config.ICON_CACHE_DIR):
-        if filename.endswith('.png'):
-            champion_name = filename[:-4]
-            cached_icons.add(champion_name)
-    return cached_icons
-
-def get_champion_icon(champion_name, version, cache_dir):
-    """Gets a champion's icon, reusing the cache if it exists."""
+    """Gets the names of the champion icons in the cache, from the asset cache index."""
+    return {filename[:-4] for filename in asset_cache.get_cache().filenames("champion") if not filename.startswith("sprite_")}
+
+def _guess_champion_icon_filename(champion_name):
+    """Guesses the icon file of a champion from its name, for when no champion index is available."""
     champion_name_formatted = champion_name.replace(" ", "").replace("'", "")
     name_map = {"Wukong": "MonkeyKing", "MasterYi": "MasterYi", "XinZhao": "XinZhao", "LeeSin": "LeeSin", "LeBlanc": "Leblanc"}
-    champion_name_formatted = name_map.get(champion_name_formatted, champion_name_formatted)
+    return f"{name_map.get(champion_name_formatted, champion_name_formatted)}.png"
+
+# Sprite sheets opened once per process, by (version, sheet filename). None if unavailable.
+_sprite_sheets = {}
+# One lock per sprite sheet, so threads needing other sheets never wait for its download
+_sprite_sheet_locks = {}
+_sprite_sheet_locks_lock = threading.Lock()
+
+def get_sprite_sheet_url(version, sprite):
+    return f"http://ddragon.leagueoflegends.com/cdn/{version}/img/sprite/{sprite}"
+
+def _get_sprite_sheet(version, sprite):
+    """Returns a ddragon sprite sheet as an image, downloading it into the cache on first use."""
+    key = (version, sprite)
+    with _sprite_sheet_locks_lock:
+        sheet_lock = _sprite_sheet_locks.setdefault(key, threading.Lock())
+    with sheet_lock:
+        if key not in _sprite_sheets:
+            from PIL import Image
+            sheet = None
+            sheet_path = asset_cache.get_cache().fetch("sprite", f"{version}_{sprite}", get_sprite_sheet_url(version, sprite))
+            if sheet_path:
+                try:
+                    sheet = Image.open(sheet_path).convert("RGBA")
+                except OSError as e:
+                    print(f"Error opening sprite sheet '{sheet_path}': {e}")
+            _sprite_sheets[key] = sheet
+        return _sprite_sheets[key]
+
+def crop_champion_icon(champion_id, champion_index, version):
+    """
+    Crops the icon of a champion out of its sprite sheet (see config.CHAMPION_ICON_SOURCE) and
+    stores it in the cache. Returns its path, or None if the sheets do not cover the champion.
+    """
+    sprite = champion_index.get("sprites", {}).get(champion_id)
+    if sprite is None or version is None:
+        return None
+    sheet = _get_sprite_sheet(version, sprite["sprite"])
+    if sheet is None:
+        return None
+
+    cache = asset_cache.get_cache()
+    filename = f"sprite_{champion_index['icons'][champion_id]}"
+    icon_path = cache.path("champion", filename)
+    os.makedirs(os.path.dirname(icon_path), exist_ok=True)
+    temp_path = f"{icon_path}.{os.getpid()}.{threading.get_ident()}.part"
+    sheet.crop((sprite["x"], sprite["y"], sprite["x"] + sprite["w"], sprite["y"] + sprite["h"])).save(temp_path, format="PNG")
+    os.replace(temp_path, icon_path)
+    cache.insert("champion", filename, downloaded=False)
+    return icon_path
+
+def get_champion_icon(champion_name, version):
+    """
+    Gets a champion's icon, reusing the cache if it exists. The name is resolved through the
+    champion index of the version (see data_fetcher.get_champion_index), so a name that matches
+    no champion is reported right away instead of costing a failed download.
+    """
+    champion_index = data_fetcher.get_champion_index(version) if version else None
+    if champion_index:
+        champion_id = champion_index["aliases"].get(data_fetcher.normalize_champion_name(champion_name))
+        if champion_id is None:
+            print(f"Champion not found in the champion data of version {version}: {champion_name}")
+            return None
+        icon_filename = champion_index["icons"][champion_id]
+    else:
+        icon_filename = _guess_champion_icon_filename(champion_name)
+    champion_name_formatted = icon_filename[:-4]
 
-    icon_path = os.path.join(cache_dir, f"{champion_name_formatted}.png")
-    if os.path.exists(icon_path):
+    cache = asset_cache.get_cache()
+    icon_path = cache.lookup("champion", icon_filename)
+    if icon_path:
         print(f"Using icon from cache: {champion_name_formatted}")
         return icon_path
 
+    if config.CHAMPION_ICON_SOURCE == "sprites" and champion_index:
+        icon_path = cache.lookup("champion", f"sprite_{icon_filename}") or crop_champion_icon(champion_id, champion_index, version)
+        if icon_path:
+            print(f"Using icon from sprite sheet: {champion_name_formatted}")
+            return icon_path
+
     if version is None:
         print(f"Cannot download icon for {champion_name_formatted}: version not available")
         return None
 
-    url = f"http://ddragon.leagueoflegends.com/cdn/{version}/img/champion/{champion_name_formatted}.png"
+    url = f"http://ddragon.leagueoflegends.com/cdn/{version}/img/champion/{icon_filename}"
     print(f"Downloading new icon: {champion_name_formatted}")
-    return data_fetcher.download_icon(url, icon_path)
+    return cache.fetch("champion", icon_filename, url)
 
 def print_cache_stats():
-    """Prints statistics of the icon cache."""
-    cached_icons = get_cached_icons()
-    print(f"\n--- CACHE STATISTICS ---")
-    print(f"Icons in cache: {len(cached_icons)}")
-    if cached_icons:
-        print("Champions available in cache:")
-        for icon in sorted(cached_icons):
-            print(f"  - {icon}")
-    print("--------------------------")
+    """Prints a summary of the icon cache, read from its index."""
+    asset_cache.get_cache().print_stats()
 
 def get_monster_icon(monster_name_formatted):
     """
@@ -104,9 +170,10 @@ def get_monster_icon(monster_name_formatted):
     Expected monster_name_formatted to be like "Baron_Nashor" or "Blue_Sentinel".
     """
     icon_filename = f"{monster_name_formatted}.png"
-    icon_path = os.path.join(config.MONSTER_ICON_CACHE_DIR, icon_filename)
+    cache = asset_cache.get_cache()
+    icon_path = cache.lookup("monster", icon_filename)
 
-    if os.path.exists(icon_path):
+    if icon_path:
         print(f"Using monster icon from cache: {icon_filename}")
         return icon_path
 
@@ -115,9 +182,7 @@ def get_monster_icon(monster_name_formatted):
 
     if monster_icon_url:
         print(f"Downloading new monster icon: {icon_filename} from {monster_icon_url}")
-        os.makedirs(config.MONSTER_ICON_CACHE_DIR, exist_ok=True)
-        downloaded_path = data_fetcher.download_icon(monster_icon_url, icon_path)
-        return downloaded_path
+        return cache.fetch("monster", icon_filename, monster_icon_url)
     else:
         print(f"Could not find a valid icon URL for monster: {monster_name_formatted}")
         return None
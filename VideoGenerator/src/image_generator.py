@@ -1,81 +1,187 @@
-from PIL import Image, ImageDraw, ImageFont
-import random
 import os
+import json
+import time
+import hashlib
 from . import config
+from . import metrics
+from . import template_pool
+from . import utils
 
-def get_random_background(utils_path):
-    """Scans the utils directory for image files and returns a path to a random one."""
+# Bump this when the drawing code changes, so cached renders are not reused anymore.
+RENDER_CACHE_VERSION = 1
+
+# File hashes are remembered for the whole run, since every event uses the same few backgrounds
+_hasher = utils.ContentHasher()
+
+def get_random_background(utils_path, *key_parts, stable=False):
+    """
+    Scans the utils directory for image files and returns a path to a random one.
+    With a selection seed, or when stable, the choice is deterministic for the given key parts
+    (see utils.choose).
+    """
     supported_extensions = ('.png', '.jpg', '.jpeg')
     try:
         all_files = os.listdir(utils_path)
-        image_files = [f for f in all_files if f.lower().endswith(supported_extensions)]
+        image_files = sorted(f for f in all_files if f.lower().endswith(supported_extensions))
         if not image_files:
             return None
-        return os.path.join(utils_path, random.choice(image_files))
+        return os.path.join(utils_path, utils.choose(image_files, "background", *key_parts, stable=stable))
     except FileNotFoundError:
         return None
 
-def create_image(interaction_data, lol_version):
+# Layout values that are lengths in pixels, scaled together for draft renders
+_LAYOUT_LENGTHS = ("font_size", "ribbon_height", "text_anchor_y", "icon_size", "icon_margin_left", "icon_margin_bottom")
+
+def get_layout(layout_name, scale=1.0):
+    """Returns a layout preset with every length multiplied by scale (see --draft)."""
+    layout = dict(config.LAYOUT_PRESETS[layout_name])
+    if scale != 1.0:
+        for key in _LAYOUT_LENGTHS:
+            layout[key] = max(1, round(layout[key] * scale))
+        # Video encoders need even dimensions
+        layout["size"] = tuple(max(2, round(length * scale / 2) * 2) for length in layout["size"])
+    return layout
+
+def get_render_key(display_text, icon_path, background_path, layout_name, scale=1.0):
+    """Hashes everything that decides how an image looks. Identical inputs give the same key."""
+    font_hash = _hasher.hash_file(config.FONT_PATH) if os.path.exists(config.FONT_PATH) else None
+    render_inputs = {
+        "version": RENDER_CACHE_VERSION,
+        "text": display_text,
+        "icon": _hasher.hash_file(icon_path) if icon_path and os.path.exists(icon_path) else None,
+        "background": _hasher.hash_file(background_path),
+        "font": font_hash,
+        "layout": get_layout(layout_name, scale),
+    }
+    return hashlib.sha256(json.dumps(render_inputs, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def get_image_filename(original_folder, layout_name="landscape"):
+    """Returns the image filename of an event for a layout. Landscape keeps the historical name."""
+    if layout_name == "landscape":
+        return f"{original_folder}.png"
+    return f"{original_folder}_{layout_name}.png"
+
+# Fonts by size, loaded once per process instead of once per image
+_fonts = {}
+
+def _get_font(font_size):
+    from PIL import ImageFont
+    font = _fonts.get(font_size)
+    if font is None:
+        font = _fonts[font_size] = ImageFont.truetype(config.FONT_PATH, size=font_size)
+    return font
+
+def _load_font(font_size, display_text, max_width):
+    """Loads the font, shrinking it when the text would not fit in the canvas width."""
+    from PIL import ImageFont
+    try:
+        font = _get_font(font_size)
+    except FileNotFoundError:
+        print(f"WARNING: Font not found at {config.FONT_PATH}. Using default font.")
+        return ImageFont.load_default(size=font_size + 8)
+
+    while font_size > 20 and font.getlength(display_text) > max_width:
+        font_size -= 2
+        font = _get_font(font_size)
+    return font
+
+def preload_fonts(scale=1.0):
+    """Loads the font at the size of every layout, for processes rendering many images (see 'serve')."""
+    for layout_name in config.LAYOUT_PRESETS:
+        try:
+            _get_font(get_layout(layout_name, scale)["font_size"])
+        except FileNotFoundError:
+            return
+
+def get_text_placement(display_text, layout_name="landscape", scale=1.0):
+    """Returns the font size and the vertical center of the text of a layout, as create_image draws it."""
+    layout = get_layout(layout_name, scale)
+    font = _load_font(layout["font_size"], display_text, layout["size"][0] - 80)
+    return {"font_size": getattr(font, "size", layout["font_size"]), "anchor_y": layout["text_anchor_y"]}
+
+def create_base_image(icon_path, background_path, layout_name="landscape", scale=1.0):
+    """
+    Creates the image of a layout without its text, shared by every event with the same
+    background and icon (see --text-mode). Returns its path, or None if it cannot be created.
+    """
+    try:
+        base_name = get_render_key(None, icon_path, background_path, layout_name, scale)
+    except OSError as e:
+        print(f"ERROR: Could not hash the inputs of a base image: {e}")
+        return None
+    base_path = os.path.join(config.BASE_IMAGE_DIR, get_image_filename(base_name, layout_name))
+    if os.path.exists(base_path):
+        return base_path
+    os.makedirs(config.BASE_IMAGE_DIR, exist_ok=True)
+    interaction_data = {"original_folder": base_name, "display_text": None, "icon_path": icon_path,
+                        "output_dir": config.BASE_IMAGE_DIR}
+    return create_image(interaction_data, None, layout_name, background_path, scale)
+
+def create_image(interaction_data, lol_version, layout_name="landscape", background_path=None, scale=1.0):
+    """
+    Creates the image of an event for a layout. Renders are kept in config.IMAGE_CACHE_DIR under
+    the hash of their inputs, so an identical render is produced once and linked everywhere else.
+    A display_text of None leaves the ribbon empty (see create_base_image).
+    """
+    # PIL is imported on first use, so runs with nothing to render never load it
+    from PIL import Image, ImageDraw
     display_text = interaction_data["display_text"]
     original_folder = interaction_data["original_folder"]
     icon_path = interaction_data.get("icon_path")
     output_dir = interaction_data["output_dir"]
-    
-    # 1. Select a random background
-    background_path = get_random_background(config.UTILS_DIR)
+    layout = get_layout(layout_name, scale)
+    canvas_width, canvas_height = layout["size"]
+
+    # 1. Select a random background, unless the caller already picked one for this event
+    if background_path is None:
+        background_path = get_random_background(config.UTILS_DIR)
     if not background_path:
         print(f"CRITICAL ERROR: No background image files (.png, .jpg) found in {config.UTILS_DIR}")
         print("Please make sure there is at least one image file in the 'utils' directory.")
         return None
-        
+
+    output_filename = get_image_filename(original_folder, layout_name)
+    output_path = os.path.join(output_dir, output_filename)
     try:
-        # Open all images and convert to RGBA for consistency
-        background = Image.open(background_path).convert("RGBA").resize((1920, 1080))
+        render_key = get_render_key(display_text, icon_path, background_path, layout_name, scale)
+    except OSError as e:
+        print(f"WARNING: Could not hash render inputs, skipping image cache: {e}")
+        render_key = None
+    cached_render_path = os.path.join(config.IMAGE_CACHE_DIR, f"{render_key}.png") if render_key else None
+    if cached_render_path and os.path.exists(cached_render_path):
+        metrics.get_metrics().increment("cache_lookups_total", kind="render", result="hit")
+        print(f"Using identical render from cache: {render_key[:12]}")
+        utils.link_or_copy(cached_render_path, output_path)
+        # A linked or copied render keeps the mtime of the cache file; the image is new for this event,
+        # so it must look newer than the videos made from its previous version
+        os.utime(output_path)
+        return output_path
+    metrics.get_metrics().increment("cache_lookups_total", kind="render", result="miss")
+
+    render_start = time.perf_counter()
+    try:
+        # The decoded background is shared (see template_pool.py), so draw on a copy of it
+        background = template_pool.get_background(background_path, layout["size"], layout["background_fit"]).copy()
     except Exception as e:
         print(f"CRITICAL ERROR: Could not open or process background file '{background_path}'. Error: {e}")
         return None
 
-    # 2. Load icon if available
-    icon_image = None
-    if icon_path:
-        try:
-            border_size = 2
-            final_size = (180, 180)
-            icon_original = Image.open(icon_path).convert("RGBA")
-            
-            # Create a white background for the border
-            bordered_icon = Image.new('RGBA', final_size, (255, 255, 255, 255))
-            
-            icon_resized = icon_original.resize(
-                (final_size[0] - border_size * 2, final_size[1] - border_size * 2),
-                Image.Resampling.LANCZOS
-            )
-            
-            paste_position = (border_size, border_size)
-            bordered_icon.paste(icon_resized, paste_position, icon_resized)
-            icon_image = bordered_icon
-        except Exception as e:
-            print(f"Error loading or applying border to icon from path '{icon_path}': {e}")
-            # Ensure icon_image is None if there's an error
-    
+    # 2. Load icon if available, with its white border
+    icon_image = template_pool.get_icon(icon_path, layout["icon_size"]) if icon_path else None
+
     if icon_image is None and icon_path is not None:
          print(f"WARNING: Could not load icon from path '{icon_path}'.")
 
     # 3. Prepare to draw
     draw = ImageDraw.Draw(background)
-    try:
-        font = ImageFont.truetype(config.FONT_PATH, size=52)
-    except FileNotFoundError:
-        print(f"WARNING: Font not found at {config.FONT_PATH}. Using default font.")
-        font = ImageFont.load_default(size=60)
 
     # 4. Define fixed ribbon position for consistency
-    # The ribbon is vertically centered around the text's y-anchor of 958.
-    ribbon_height = 120
-    text_anchor_y = 958
+    # The ribbon is vertically centered around the text's y-anchor of the layout.
+    ribbon_height = layout["ribbon_height"]
+    text_anchor_y = layout["text_anchor_y"]
     ribbon_y0 = text_anchor_y - (ribbon_height // 2)
     ribbon_y1 = text_anchor_y + (ribbon_height // 2)
-    
+
     # Create a transparent layer for the ribbon
     ribbon_layer = Image.new('RGBA', background.size, (0, 0, 0, 0))
     ribbon_draw = ImageDraw.Draw(ribbon_layer)
@@ -83,7 +189,7 @@ def create_image(interaction_data, lol_version):
     # Draw the semi-transparent rectangle with a white border at a fixed position
     # Extend the rectangle horizontally beyond the canvas to hide the side borders
     ribbon_draw.rectangle(
-        [-5, ribbon_y0, 1925, ribbon_y1], # Draw from x=-5 to x=1925
+        [-5, ribbon_y0, canvas_width + 5, ribbon_y1], # Draw from x=-5 to 5px past the right edge
         fill=(0, 0, 0, 150),       # Semi-transparent black
         outline=(255, 255, 255, 255), # Solid white
         width=2
@@ -95,23 +201,60 @@ def create_image(interaction_data, lol_version):
 
     # 5. Draw the text on top of the ribbon
     # The "mm" anchor ensures the text is perfectly centered within the fixed ribbon area.
-    text_anchor = (960, text_anchor_y)
-    draw.text(text_anchor, display_text, font=font, fill="white", anchor="mm")
+    if display_text is not None:
+        font = _load_font(layout["font_size"], display_text, canvas_width - 80)
+        text_anchor = (canvas_width // 2, text_anchor_y)
+        draw.text(text_anchor, display_text, font=font, fill="white", anchor="mm")
 
     # 6. Place the icon above the ribbon
     if icon_image:
-        ICON_MARGIN_LEFT = 50
-        ICON_MARGIN_BOTTOM = 20
-        icon_x = ICON_MARGIN_LEFT
+        if layout["icon_align"] == "center":
+            icon_x = (canvas_width - icon_image.width) // 2
+        else:
+            icon_x = layout["icon_margin_left"]
         # Position the icon relative to the new fixed ribbon top
-        icon_y = int(ribbon_y0 - icon_image.height - ICON_MARGIN_BOTTOM)
+        icon_y = int(ribbon_y0 - icon_image.height - layout["icon_margin_bottom"])
         background.paste(icon_image, (icon_x, icon_y), icon_image)
 
     # 7. Add a 1px white border to the entire image
-    draw.rectangle((0, 0, 1919, 1079), outline="white", width=1)
+    draw.rectangle((0, 0, canvas_width - 1, canvas_height - 1), outline="white", width=1)
 
-    # 8. Save the final image
-    output_filename = f"{original_folder}.png"
-    output_path = os.path.join(output_dir, output_filename)
-    background.save(output_path)
+    # 8. Save the final image, through the render cache when possible
+    if cached_render_path is None:
+        background.save(output_path)
+    else:
+        os.makedirs(config.IMAGE_CACHE_DIR, exist_ok=True)
+        temp_path = f"{cached_render_path}.{os.getpid()}.part"
+        background.save(temp_path, format="PNG")
+        os.replace(temp_path, cached_render_path)
+        utils.link_or_copy(cached_render_path, output_path)
+        os.utime(output_path)
+    metrics.get_metrics().observe("render_seconds", time.perf_counter() - render_start, layout=layout_name)
     return output_path
+
+def _render_task(task):
+    interaction_data, layout_name, background_path, scale = task
+    return create_image(interaction_data, None, layout_name, background_path, scale)
+
+def create_images_parallel(tasks, workers):
+    """
+    Creates images in worker processes. Each task is (interaction_data, layout_name,
+    background_path, scale), as passed to create_image. The backgrounds and icons of the tasks
+    are decoded once and shared with every worker (see template_pool.py).
+    Returns the created image paths in task order, None for the images that failed.
+    """
+    # multiprocessing is only loaded by runs rendering in several processes
+    from concurrent.futures import ProcessPoolExecutor
+    backgrounds = set()
+    icons = set()
+    for interaction_data, layout_name, background_path, scale in tasks:
+        layout = get_layout(layout_name, scale)
+        if background_path:
+            backgrounds.add((background_path, layout["size"], layout["background_fit"]))
+        if interaction_data.get("icon_path"):
+            icons.add((interaction_data["icon_path"], layout["icon_size"]))
+
+    with template_pool.share_templates(sorted(backgrounds), sorted(icons)) as descriptors:
+        with ProcessPoolExecutor(max_workers=workers, initializer=template_pool.attach_shared_templates,
+                                 initargs=(descriptors,)) as executor:
+            return list(executor.map(_render_task, tasks))
@@ -0,0 +1,150 @@
+"""
+This module measures the loudness of audio clips for EBU R128 normalization (see --loudnorm).
+
+Each clip is measured once with the first pass of ffmpeg's loudnorm filter. The measurements
+are kept in a SQLite file keyed by the SHA-256 of the clip content and the loudness target,
+so renamed or copied clips, reruns and runs with other silence or encoder settings never
+measure a clip again. Clips that cannot be measured (silent or unreadable ones) are recorded
+in a table of their own with the size and mtime of the file, so they are only measured again
+once the file changes. The second pass is not a separate step: create_video_renditions feeds
+the measurements to loudnorm in the ffmpeg process that concatenates and encodes the event.
+"""
+import os
+import json
+import math
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+from . import metrics
+from . import utils
+
+_MEASUREMENT_KEYS = ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset")
+# loudnorm option receiving each measurement in the second pass
+_SECOND_PASS_OPTIONS = {"input_i": "measured_I", "input_tp": "measured_TP", "input_lra": "measured_LRA",
+                        "input_thresh": "measured_thresh", "target_offset": "offset"}
+
+def get_target():
+    """Returns the loudnorm target options (integrated loudness, true peak, loudness range)."""
+    return f"I={config.LOUDNORM_TARGET['I']}:TP={config.LOUDNORM_TARGET['TP']}:LRA={config.LOUDNORM_TARGET['LRA']}"
+
+def measure_clip(audio_path):
+    """
+    Runs the first loudnorm pass on a clip. Returns its measurement dict, or None if it cannot be
+    measured. Raises FileNotFoundError if ffmpeg is missing.
+    """
+    cmd = [
+        config.FFMPEG_EXE, "-hide_banner", "-nostats", "-i", audio_path,
+        "-af", f"loudnorm={get_target()}:print_format=json", "-f", "null", "-"
+    ]
+    try:
+        with metrics.get_metrics().timer("ffmpeg_seconds", operation="loudness"):
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        # The measurement is the last JSON object printed on stderr
+        report = json.loads(result.stderr[result.stderr.rindex("{"):result.stderr.rindex("}") + 1])
+        measurement = {key: float(report[key]) for key in _MEASUREMENT_KEYS}
+    except (subprocess.CalledProcessError, ValueError, KeyError) as e:
+        print(f"Error measuring loudness of {audio_path}: {e}")
+        return None
+    if not all(math.isfinite(value) for value in measurement.values()):
+        # Silent clips measure as -inf and are left to the one-pass filter
+        print(f"Loudness of {audio_path} cannot be measured (silent clip).")
+        return None
+    return measurement
+
+def get_filter(measurement):
+    """Returns the loudnorm filter applying a measurement, or a one-pass loudnorm without one."""
+    if measurement is None:
+        return f"loudnorm={get_target()}"
+    measured = ":".join(f"{_SECOND_PASS_OPTIONS[key]}={measurement[key]}" for key in _MEASUREMENT_KEYS)
+    return f"loudnorm={get_target()}:{measured}:linear=true"
+
+class LoudnessStore:
+    """Loudness measurements, kept in memory for the run and in SQLite across runs."""
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.LOUDNESS_DB_PATH
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory = {}
+        self._hasher = utils.ContentHasher()
+        self.measurements = 0
+        # One connection shared by the measuring threads, used under self._lock only
+        # sqlite3 is imported when the store opens, so commands that never need it do not load it
+        import sqlite3
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS loudness (content_hash TEXT, target TEXT, input_i REAL, input_tp REAL, "
+                "input_lra REAL, input_thresh REAL, target_offset REAL, PRIMARY KEY (content_hash, target))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS loudness_failures (content_hash TEXT, target TEXT, size INTEGER, "
+                "mtime_ns INTEGER, PRIMARY KEY (content_hash, target))"
+            )
+
+    def get(self, audio_path):
+        """
+        Returns the measurement of a clip, measuring it only if its content was never measured.
+        A clip that could not be measured is tried again once its file has another size or mtime.
+        """
+        try:
+            stat = os.stat(audio_path)
+            key = (self._hasher.hash_file(os.path.abspath(audio_path)), get_target())
+        except OSError as e:
+            print(f"Error reading {audio_path}: {e}")
+            return None
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+            row = self._db.execute(
+                f"SELECT {', '.join(_MEASUREMENT_KEYS)} FROM loudness WHERE content_hash = ? AND target = ? "
+                "AND input_i IS NOT NULL", key
+            ).fetchone()
+            if row is not None:
+                self._memory[key] = dict(zip(_MEASUREMENT_KEYS, row))
+                return self._memory[key]
+            failure = self._db.execute(
+                "SELECT size, mtime_ns FROM loudness_failures WHERE content_hash = ? AND target = ?", key
+            ).fetchone()
+            if failure == (stat.st_size, stat.st_mtime_ns):
+                self._memory[key] = None
+                return None
+
+        try:
+            measurement = measure_clip(audio_path)
+        except FileNotFoundError:
+            # Not a property of the clip, so nothing is stored
+            print(f"Error: '{config.FFMPEG_EXE}' not found. Make sure the file is in the 'bin' folder.")
+            return None
+        with self._lock:
+            self.measurements += 1
+            self._memory[key] = measurement
+            with self._db:
+                if measurement is None:
+                    self._db.execute("INSERT OR REPLACE INTO loudness_failures VALUES (?, ?, ?, ?)",
+                                     key + (stat.st_size, stat.st_mtime_ns))
+                else:
+                    values = tuple(measurement[k] for k in _MEASUREMENT_KEYS)
+                    self._db.execute("INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?, ?, ?, ?)", key + values)
+                    self._db.execute("DELETE FROM loudness_failures WHERE content_hash = ? AND target = ?", key)
+        return measurement
+
+    def prefill(self, audio_paths, workers=None):
+        """Makes sure every clip is measured, measuring the new ones in parallel."""
+        workers = workers or os.cpu_count() or 1
+        measurements_before = self.measurements
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(self.get, audio_paths))
+        measured = self.measurements - measurements_before
+        print(f"Loudness: {len(audio_paths)} clips, {len(audio_paths) - measured} known, {measured} measured.")
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the loudness store of this process, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LoudnessStore()
+        return _store
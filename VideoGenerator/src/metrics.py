@@ -0,0 +1,211 @@
+"""
+This module keeps the counters and histograms of a run, for capacity planning: cache hits and
+misses, HTTP requests and bytes, ffmpeg wall and CPU time, render time and how many seconds of
+audio were encoded per second of wall time.
+
+The pipeline records into one registry per process (see get_metrics). At the end of a run the
+registry is exported twice: as a Prometheus textfile per node (in config.METRICS_TEXTFILE_DIR,
+read by the textfile collector of node_exporter) and as a JSON summary in config.METRICS_DIR,
+one file per run, so runs can be compared over time. Every series carries a "node" label, so
+nodes sharing the output folder never overwrite each other's numbers.
+
+The CPU time of ffmpeg and ffprobe comes from the resource module, which Windows does not have.
+There child_cpu_seconds is missing from both exports, and the JSON summary says so in its
+"notes", so a missing value is not read as zero CPU.
+"""
+import os
+import json
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from . import config
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module: child CPU time is then left out of the export (see to_summary)
+    resource = None
+
+_CHILD_CPU_UNAVAILABLE_NOTE = "child_cpu_seconds is not measured on this platform (no resource module)."
+
+# Help text of every metric, as shown in the Prometheus export
+_DESCRIPTIONS = {
+    "cache_lookups_total": "Cache lookups by cached kind and result (hit or miss).",
+    "http_requests_total": "HTTP requests by host and status code.",
+    "http_response_bytes_total": "Bytes of HTTP response bodies downloaded, by host.",
+    "ffmpeg_seconds": "Wall time of ffmpeg and ffprobe processes, by operation.",
+    "render_seconds": "Wall time of rendering one image with PIL, by layout.",
+    "audio_seconds_encoded_total": "Seconds of audio in the videos encoded.",
+    "videos_encoded_total": "Events encoded, by result.",
+    "run_wall_seconds": "Wall time of the run so far.",
+    "child_cpu_seconds": "CPU time (user and system) of the finished ffmpeg and ffprobe processes.",
+    "audio_seconds_per_wall_second": "Seconds of audio encoded per second of run wall time.",
+}
+
+def get_node():
+    """Returns the name of this node in the metrics (see config.METRICS_NODE)."""
+    return config.METRICS_NODE or socket.gethostname()
+
+def _node_file_name():
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in get_node())
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _child_cpu_seconds():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class Metrics:
+    """Thread-safe counters and histograms, each keyed by a name and a set of labels."""
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or config.METRICS_HISTOGRAM_BUCKETS)
+        self._lock = threading.Lock()
+        self._counters = {}    # name -> {label key: value}
+        self._histograms = {}  # name -> {label key: [bucket counts..., sum, count]}
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        self._child_cpu_at_start = _child_cpu_seconds()
+
+    def increment(self, name, amount=1, **labels):
+        """Adds amount to a counter."""
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Records one value (usually seconds) in a histogram."""
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.setdefault(_label_key(labels), [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Records the wall time of the block in a histogram, even when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _gauges(self):
+        """Returns the values derived from the counters at the time of the export."""
+        wall_seconds = time.perf_counter() - self._start
+        gauges = {"run_wall_seconds": wall_seconds}
+        child_cpu = _child_cpu_seconds()
+        if child_cpu is not None:
+            gauges["child_cpu_seconds"] = child_cpu - self._child_cpu_at_start
+        audio_seconds = sum(self._counters.get("audio_seconds_encoded_total", {}).values())
+        gauges["audio_seconds_per_wall_second"] = audio_seconds / wall_seconds if wall_seconds else 0.0
+        return gauges
+
+    def to_prometheus(self):
+        """Returns every metric in the Prometheus text exposition format, labelled with the node."""
+        prefix = config.METRICS_PREFIX
+        node = (("node", get_node()),)
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {prefix}{name} {_DESCRIPTIONS.get(name, name)}", f"# TYPE {prefix}{name} counter"]
+                lines += [f"{prefix}{name}{_format_labels(node + key)} {value}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {prefix}{name} {_DESCRIPTIONS.get(name, name)}", f"# TYPE {prefix}{name} histogram"]
+                for key, values in sorted(series.items()):
+                    for bound, count in zip(self.buckets, values):
+                        lines.append(f"{prefix}{name}_bucket{_format_labels(node + key, [('le', bound)])} {count}")
+                    lines.append(f"{prefix}{name}_bucket{_format_labels(node + key, [('le', '+Inf')])} {values[-1]}")
+                    lines.append(f"{prefix}{name}_sum{_format_labels(node + key)} {values[-2]}")
+                    lines.append(f"{prefix}{name}_count{_format_labels(node + key)} {values[-1]}")
+            for name, value in self._gauges().items():
+                lines += [f"# HELP {prefix}{name} {_DESCRIPTIONS.get(name, name)}", f"# TYPE {prefix}{name} gauge",
+                          f"{prefix}{name}{_format_labels(node)} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def to_summary(self):
+        """Returns every metric as a JSON-serializable dict. Histograms are summed up by count, sum and mean."""
+        def label_text(key):
+            return ",".join(f"{name}={value}" for name, value in key) or "all"
+        with self._lock:
+            summary = {
+                "node": get_node(),
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started_at)),
+                "counters": {
+                    name: {label_text(key): value for key, value in sorted(series.items())}
+                    for name, series in sorted(self._counters.items())
+                },
+                "histograms": {
+                    name: {
+                        label_text(key): {"count": values[-1], "sum": values[-2],
+                                          "mean": values[-2] / values[-1] if values[-1] else 0.0}
+                        for key, values in sorted(series.items())
+                    }
+                    for name, series in sorted(self._histograms.items())
+                },
+                "gauges": self._gauges(),
+            }
+        if "child_cpu_seconds" not in summary["gauges"]:
+            summary["notes"] = [_CHILD_CPU_UNAVAILABLE_NOTE]
+        return summary
+
+    def prometheus_path(self):
+        """Returns the Prometheus textfile of this node."""
+        return os.path.join(config.METRICS_TEXTFILE_DIR, f"videogenerator_{_node_file_name()}.prom")
+
+    def export(self, run_name=None):
+        """Writes the Prometheus textfile and the JSON summary of this run. Returns the JSON path."""
+        os.makedirs(config.METRICS_DIR, exist_ok=True)
+        os.makedirs(config.METRICS_TEXTFILE_DIR, exist_ok=True)
+        prometheus_path = self.prometheus_path()
+        # Written to a temporary file first, so the collector never reads half a file
+        temp_path = f"{prometheus_path}.{os.getpid()}.part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, prometheus_path)
+
+        summary = self.to_summary()
+        run_name = run_name or time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started_at))
+        summary_path = os.path.join(config.METRICS_DIR, f"run_{run_name}_{_node_file_name()}_{os.getpid()}.json")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary_path
+
+    def print_summary(self):
+        """Prints the headline numbers of the run."""
+        summary = self.to_summary()
+        counters, gauges = summary["counters"], summary["gauges"]
+        lookups = counters.get("cache_lookups_total", {})
+        hits = sum(value for key, value in lookups.items() if key.endswith("result=hit"))
+        print(f"Cache hit rate: {hits}/{sum(lookups.values())} lookups")
+        http_bytes = sum(counters.get("http_response_bytes_total", {}).values())
+        print(f"HTTP: {sum(counters.get('http_requests_total', {}).values())} requests, {http_bytes / 1024 / 1024:.1f} MiB")
+        ffmpeg_seconds = sum(entry["sum"] for entry in summary["histograms"].get("ffmpeg_seconds", {}).values())
+        cpu_text = f", {gauges['child_cpu_seconds']:.1f}s CPU" if "child_cpu_seconds" in gauges else ", CPU not measured"
+        print(f"ffmpeg: {ffmpeg_seconds:.1f}s wall{cpu_text}")
+        print(f"Audio encoded per wall second: {gauges['audio_seconds_per_wall_second']:.2f}s")
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    """Returns the metrics registry of this process, created on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
@@ -0,0 +1,119 @@
+"""
+This module implements the 'prefetch' command. It resolves the current LoL version once and
+downloads every champion, item and monster icon that is not cached yet, in parallel, so that
+production renders start with a fully warm cache.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+from . import asset_cache
+from . import data_fetcher
+from . import icon_manager
+
+def _crop_from_sprites(version, missing, workers):
+    """
+    Downloads the sprite sheets covering the missing champion icons in parallel, then crops the
+    icons out of them. Returns the {champion id: icon filename} of the icons still missing.
+    """
+    champion_index = data_fetcher.get_champion_index(version)
+    if not champion_index:
+        return missing
+    cache = asset_cache.get_cache()
+    sprites = champion_index["sprites"]
+    sheets = sorted({sprites[champion_id]["sprite"] for champion_id in missing if champion_id in sprites})
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda sheet: cache.fetch("sprite", f"{version}_{sheet}", icon_manager.get_sprite_sheet_url(version, sheet)), sheets))
+
+    still_missing = {
+        champion_id: icon_filename for champion_id, icon_filename in missing.items()
+        if not (cache.lookup("champion", f"sprite_{icon_filename}") or icon_manager.crop_champion_icon(champion_id, champion_index, version))
+    }
+    print(f"Champion icons from {len(sheets)} sprite sheets: {len(missing) - len(still_missing)}, "
+          f"{len(still_missing)} left to download one by one.")
+    return still_missing
+
+def _champion_downloads(version, workers):
+    """Returns the (filename, url) pairs of the champion icons missing from the cache."""
+    champion_data = data_fetcher.get_champion_data(version)
+    cache = asset_cache.get_cache()
+    missing = {}
+    for champion_id, champion in champion_data.items():
+        icon_filename = champion.get("image", {}).get("full", f"{champion['id']}.png")
+        if not cache.lookup("champion", icon_filename):
+            missing[champion_id] = icon_filename
+    if config.CHAMPION_ICON_SOURCE == "sprites" and missing:
+        missing = _crop_from_sprites(version, missing, workers)
+    downloads = [
+        (icon_filename, f"http://ddragon.leagueoflegends.com/cdn/{version}/img/champion/{icon_filename}")
+        for icon_filename in missing.values()
+    ]
+    return downloads, len(champion_data)
+
+def _item_downloads():
+    """Returns the (filename, url) pairs of the item icons missing from the cache."""
+    item_filenames = icon_manager.get_item_icon_filenames()
+    cache = asset_cache.get_cache()
+    downloads = []
+    for filename in item_filenames:
+        if not cache.lookup("item", filename):
+            downloads.append((filename, f"{icon_manager.ITEM_ICON_BASE_URL}{filename}"))
+    return downloads, len(item_filenames)
+
+def _monster_downloads():
+    """Returns the (filename, url) pairs of the monster icons missing from the cache."""
+    cache = asset_cache.get_cache()
+    missing = [m for m in config.KNOWN_MONSTERS if not cache.lookup("monster", f"{m}.png")]
+    if not missing:
+        return [], len(config.KNOWN_MONSTERS)
+
+    # Download the wiki page once for every monster
+    html_content = data_fetcher.get_monster_wiki_content()
+    downloads = []
+    for monster_name in missing:
+        url = data_fetcher.get_monster_icon_url(monster_name, html_content)
+        if url:
+            downloads.append((f"{monster_name}.png", url))
+    return downloads, len(config.KNOWN_MONSTERS)
+
+def prefetch_all(workers=None):
+    """
+    Downloads every missing champion, item and monster icon in parallel.
+    Returns a dict of asset kind -> (downloaded, failed, total known).
+    """
+    workers = workers or config.PREFETCH_WORKERS
+    for directory in (config.ICON_CACHE_DIR, config.ITEM_ICON_CACHE_DIR, config.MONSTER_ICON_CACHE_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+    print("\n--- PREFETCH ---")
+    version = data_fetcher.get_latest_lol_version()
+    if version is None:
+        print("Could not get LoL version. Champion icons will be skipped.")
+    else:
+        print(f"LoL version: {version}")
+
+    planned = {}
+    if version is not None:
+        planned["champion"] = _champion_downloads(version, workers)
+    planned["item"] = _item_downloads()
+    planned["monster"] = _monster_downloads()
+
+    jobs = [(kind, filename, url) for kind, (downloads, _) in planned.items() for filename, url in downloads]
+    print(f"Downloading {len(jobs)} missing icons with {workers} parallel downloads...")
+
+    cache = asset_cache.get_cache()
+
+    def download(job):
+        kind, filename, url = job
+        return kind, cache.fetch(kind, filename, url) is not None
+
+    summary = {kind: [0, 0, total] for kind, (_, total) in planned.items()}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for kind, ok in executor.map(download, jobs):
+            summary[kind][0 if ok else 1] += 1
+    cache.flush()
+
+    print("\n=== PREFETCH SUMMARY ===")
+    for kind, (downloaded, failed, total) in summary.items():
+        print(f"{kind.capitalize()} icons: {downloaded} downloaded, {failed} failed, {total} known")
+    print("========================")
+    return {kind: tuple(counts) for kind, counts in summary.items()}
@@ -0,0 +1,111 @@
+"""
+This module implements the '--profile' mode. Each pipeline stage (scan, parse, icon resolve,
+render, encode orchestration) gets its own cProfile profiler and its own tracemalloc figures,
+so a slow machine can be compared stage by stage with a fast one.
+
+Stages may be entered many times (once per event); their numbers are accumulated. cProfile
+only sees the thread that enters the stage, so for the encode stage it measures the Python
+orchestration around ffmpeg, not the ffmpeg processes themselves. Only stages entered by the
+main thread are profiled: cProfile cannot run in several threads at once.
+
+Taking a tracemalloc snapshot walks every traced block, so the allocations of a stage are only
+snapshotted around its first entry; later entries only update its peak memory.
+"""
+import os
+import time
+import threading
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from . import config
+
+class _StageStats:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.entries = 0
+        self.wall_seconds = 0.0
+        self.peak_bytes = 0
+        self.allocations = {}  # "file:line" -> bytes allocated and still alive at the exit of the first entry
+
+class StageProfiler:
+    """
+    Profiles pipeline stages. When disabled, stage() does nothing, so it can stay in the code.
+    """
+    def __init__(self, enabled=False, output_dir=None):
+        self.enabled = enabled
+        self.output_dir = output_dir or os.path.join(config.PROFILE_OUTPUT_DIR, time.strftime("%Y%m%d-%H%M%S"))
+        self._stages = {}
+        self._active_stage = None
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+
+    @contextmanager
+    def stage(self, name):
+        # Only one cProfile profiler can run at a time, so nested stages count for the outer one,
+        # and stages entered by other threads are not profiled.
+        if not self.enabled or self._active_stage is not None or threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        stats = self._stages.setdefault(name, _StageStats())
+        self._active_stage = name
+        stats.entries += 1
+        memory_at_entry, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot() if stats.entries == 1 else None
+        start = time.perf_counter()
+        stats.profile.enable()
+        try:
+            yield
+        finally:
+            stats.profile.disable()
+            stats.wall_seconds += time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            stats.peak_bytes = max(stats.peak_bytes, peak - memory_at_entry)
+            if snapshot_before is not None:
+                for stat in tracemalloc.take_snapshot().compare_to(snapshot_before, "lineno"):
+                    if stat.size_diff > 0:
+                        frame = stat.traceback[0]
+                        stats.allocations[f"{frame.filename}:{frame.lineno}"] = stat.size_diff
+            self._active_stage = None
+
+    def _hot_spots(self, stats, limit):
+        """Returns the functions with the most own time in a stage, as (seconds, calls, label)."""
+        profile_stats = pstats.Stats(stats.profile)
+        entries = []
+        for (filename, lineno, function), (_, calls, own_time, _, _) in profile_stats.stats.items():
+            entries.append((own_time, calls, f"{function} ({os.path.basename(filename)}:{lineno})"))
+        return sorted(entries, reverse=True)[:limit]
+
+    def write_reports(self):
+        """Writes a .pstats file and a memory report per stage. Returns the report folder."""
+        if not self.enabled or not self._stages:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name, stats in self._stages.items():
+            file_name = name.replace(" ", "_")
+            stats.profile.dump_stats(os.path.join(self.output_dir, f"{file_name}.pstats"))
+
+            top_allocations = sorted(stats.allocations.items(), key=lambda item: item[1], reverse=True)
+            with open(os.path.join(self.output_dir, f"{file_name}_memory.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Stage: {name}\n")
+                f.write(f"Entries: {stats.entries}\n")
+                f.write(f"Wall time: {stats.wall_seconds:.3f}s\n")
+                f.write(f"Peak traced memory above stage entry: {stats.peak_bytes / 1024 / 1024:.2f} MiB\n\n")
+                f.write("Top allocations still alive at the exit of the first entry:\n")
+                for location, size in top_allocations[:config.PROFILE_TOP_ALLOCATIONS]:
+                    f.write(f"  {size / 1024:10.1f} KiB  {location}\n")
+        return self.output_dir
+
+    def print_summary(self):
+        if not self.enabled or not self._stages:
+            return
+        print("\n=== PROFILE SUMMARY ===")
+        for name, stats in self._stages.items():
+            print(f"{name}: {stats.wall_seconds:.2f}s over {stats.entries} entries, "
+                  f"peak {stats.peak_bytes / 1024 / 1024:.1f} MiB")
+            for own_time, calls, label in self._hot_spots(stats, config.PROFILE_HOT_SPOTS):
+                print(f"    {own_time:8.3f}s  {calls:>7} calls  {label}")
+        print(f"Reports: '{self.output_dir}'")
+        print("=======================")
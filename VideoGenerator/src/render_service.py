@@ -0,0 +1,130 @@
+"""
+This module implements the 'serve' command: a local HTTP/JSON service rendering single events
+on demand. The service process keeps its warm state between requests (translations, fonts,
+the champion, item and skin indexes, the asset cache index), so a request only pays for its
+own image and encode instead of the cold start of main.py.
+
+Endpoints:
+    POST /render    Renders one event. The JSON body is passed to the render function given
+                    to serve() (see render_request in main.py). Replies with the output paths
+                    and the timings of the request.
+    GET  /status    Replies with the worker count and the number of requests running, waiting,
+                    done and failed.
+
+Requests run on a bounded pool of workers. Once every worker is busy and
+config.SERVICE_MAX_PENDING requests are waiting, new requests are refused with 503 instead
+of piling up.
+"""
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import config
+
+class ServiceBusy(Exception):
+    """Raised when every worker is busy and the waiting list is full."""
+
+class RenderService:
+    """Runs render requests on a bounded pool of workers and keeps the request counters."""
+    def __init__(self, render_function, workers, max_pending=None):
+        self.render_function = render_function
+        self.workers = workers
+        max_pending = config.SERVICE_MAX_PENDING if max_pending is None else max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self.counters = {"running": 0, "waiting": 0, "done": 0, "failed": 0}
+
+    def _count(self, **changes):
+        with self._lock:
+            for key, change in changes.items():
+                self.counters[key] += change
+
+    def _run(self, request, received_at):
+        started_at = time.perf_counter()
+        self._count(waiting=-1, running=1)
+        try:
+            result = self.render_function(request)
+        except Exception:
+            self._count(running=-1, failed=1)
+            raise
+        self._count(running=-1, done=1)
+        finished_at = time.perf_counter()
+        result.setdefault("timings", {})
+        result["timings"]["queued"] = round(started_at - received_at, 3)
+        result["timings"]["total"] = round(finished_at - received_at, 3)
+        return result
+
+    def render(self, request):
+        """Renders one request on the pool and waits for it. Raises ServiceBusy when the pool is full."""
+        if not self._slots.acquire(blocking=False):
+            raise ServiceBusy()
+        try:
+            self._count(waiting=1)
+            return self._executor.submit(self._run, request, time.perf_counter()).result()
+        finally:
+            self._slots.release()
+
+    def status(self):
+        with self._lock:
+            return {"workers": self.workers, **self.counters}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+def _make_handler(service):
+    class RenderRequestHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._reply(200, service.status())
+            else:
+                self._reply(404, {"error": f"Unknown path: {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/render":
+                self._reply(404, {"error": f"Unknown path: {self.path}"})
+                return
+            request = None
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(request, dict):
+                    raise ValueError("the request body must be a JSON object")
+                self._reply(200, service.render(request))
+            except ServiceBusy:
+                self._reply(503, {"error": "Every worker is busy, try again later."})
+            except ValueError as e:
+                # Also covers malformed JSON (json.JSONDecodeError is a ValueError)
+                self._reply(400, {"error": str(e)})
+            except Exception as e:
+                print(f"  ✗ ERROR rendering request {request!r}: {e}")
+                self._reply(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            print(f"[service] {self.address_string()} {format % args}")
+
+    return RenderRequestHandler
+
+def serve(render_function, workers, host=None, port=None):
+    """Serves render requests until interrupted (Ctrl+C)."""
+    host = host or config.SERVICE_HOST
+    port = config.SERVICE_PORT if port is None else port
+    service = RenderService(render_function, workers)
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    print(f"Render service listening on http://{host}:{server.server_port} with {workers} workers. Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping render service...")
+    finally:
+        server.server_close()
+        service.shutdown()
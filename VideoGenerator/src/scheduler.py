@@ -0,0 +1,133 @@
+"""
+This module schedules ffmpeg encode jobs over a CPU budget. The budget (in threads) is split
+between the number of concurrent ffmpeg processes and the threads each one uses.
+
+Jobs are started longest-first by known audio duration (LPT ordering), so a long event never
+ends up alone at the tail of the run. ffmpeg cannot change its thread count once started, so
+threads are redistributed at launch time: as the queue drains and fewer jobs are left than
+free slots, the last jobs to start receive the threads freed by the ones that finished.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+
+def get_cpu_budget(cpu_budget=None):
+    """Returns the number of threads the encoders may use in total."""
+    if cpu_budget:
+        return max(1, int(cpu_budget))
+    return config.ENCODE_CPU_BUDGET or os.cpu_count() or 1
+
+def plan_concurrency(cpu_budget, job_count, max_concurrent=None):
+    """
+    Splits the CPU budget between concurrent ffmpeg processes.
+    Returns (concurrent processes, base threads per process).
+    """
+    threads_per_job = max(1, min(config.ENCODE_THREADS_PER_JOB, cpu_budget))
+    concurrent = max(1, cpu_budget // threads_per_job)
+    if max_concurrent:
+        concurrent = min(concurrent, max_concurrent)
+    concurrent = max(1, min(concurrent, job_count))
+    return concurrent, max(1, cpu_budget // concurrent)
+
+def order_longest_first(jobs):
+    """Sorts jobs by duration, longest first. Jobs with an unknown duration go last."""
+    return sorted(jobs, key=lambda job: job.get("duration") or 0.0, reverse=True)
+
+def group_into_batches(jobs, batch_size, max_duration=None):
+    """
+    Groups the short jobs (audio up to max_duration seconds) into batch jobs of up to batch_size
+    events, encoded by one ffmpeg process (see video_generator.create_video_batch). Longer jobs,
+    and short ones with an unknown duration, are left alone. Returns the new job list.
+    """
+    max_duration = config.ENCODE_BATCH_MAX_SECONDS if max_duration is None else max_duration
+    if batch_size <= 1:
+        return jobs
+    short_jobs = [job for job in jobs if job.get("duration") is not None and job["duration"] <= max_duration]
+    if len(short_jobs) < 2:
+        return jobs
+    short_ids = {id(job) for job in short_jobs}
+    grouped = [job for job in jobs if id(job) not in short_ids]
+    for start in range(0, len(short_jobs), batch_size):
+        batch = short_jobs[start:start + batch_size]
+        if len(batch) == 1:
+            grouped.append(batch[0])
+        else:
+            grouped.append({"name": f"batch of {len(batch)} events", "batch": batch,
+                            "duration": sum(job["duration"] for job in batch)})
+    return grouped
+
+def expand_batch_results(results):
+    """Turns the (batch job, success flags) results into one (job, success) pair per event."""
+    expanded = []
+    for job, result in results:
+        if "batch" in job:
+            expanded += list(zip(job["batch"], result or [False] * len(job["batch"])))
+        else:
+            expanded.append((job, result))
+    return expanded
+
+class EncodeScheduler:
+    """
+    Runs encode jobs on a bounded number of workers, giving each job a share of the CPU budget.
+    """
+    def __init__(self, cpu_budget=None, max_concurrent=None):
+        self.cpu_budget = get_cpu_budget(cpu_budget)
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._threads_in_use = 0
+        self._running = 0
+        self._not_started = 0
+
+    def _acquire_threads(self, concurrent):
+        with self._lock:
+            self._not_started -= 1
+            self._running += 1
+            # Jobs that will still run alongside this one: the running ones, plus the waiting ones
+            # that can get a free slot. Free threads are shared between this job and those.
+            free_slots = concurrent - self._running
+            sharing_jobs = 1 + min(self._not_started, free_slots)
+            free_threads = self.cpu_budget - self._threads_in_use
+            threads = max(1, free_threads // sharing_jobs)
+            self._threads_in_use += threads
+            return threads
+
+    def _release_threads(self, threads):
+        with self._lock:
+            self._running -= 1
+            self._threads_in_use -= threads
+
+    def run(self, jobs, run_job):
+        """
+        Runs every job and returns the list of (job, result) pairs in completion order.
+        run_job(job, threads) does the actual encode and returns its result.
+        """
+        if not jobs:
+            return []
+        ordered_jobs = order_longest_first(jobs)
+        concurrent, base_threads = plan_concurrency(self.cpu_budget, len(ordered_jobs), self.max_concurrent)
+        print(f"\n--- ENCODING {len(ordered_jobs)} JOBS: {concurrent} concurrent ffmpeg processes, "
+              f"{self.cpu_budget} threads budget (~{base_threads} per process) ---")
+
+        self._not_started = len(ordered_jobs)
+        results = []
+        results_lock = threading.Lock()
+
+        def worker(job):
+            threads = self._acquire_threads(concurrent)
+            try:
+                result = run_job(job, threads)
+            except Exception as e:
+                print(f"  ✗ CRITICAL ERROR in encode job '{job.get('name', '?')}': {e}")
+                result = None
+            finally:
+                self._release_threads(threads)
+            with results_lock:
+                results.append((job, result))
+
+        # The executor starts jobs in submission order, which is the longest-first order.
+        with ThreadPoolExecutor(max_workers=concurrent) as executor:
+            futures = [executor.submit(worker, job) for job in ordered_jobs]
+            for future in futures:
+                future.result()
+        return results
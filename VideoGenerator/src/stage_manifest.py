@@ -0,0 +1,86 @@
+"""
+This module implements the handoff between split stages (see --stage). The images stage renders
+every image, then writes the encode jobs it would have run into a manifest instead of encoding
+them. The videos stage reads the manifest and runs only the encodes, on the same machine later
+or on another one mounting the same folders.
+
+The manifest holds the settings that decide what the videos look like, so the videos stage
+never asks for them again, and one entry per encode job. Paths under config.BASE_DIR are stored
+relative to it, since the folders may be mounted at another place on the encoding machine.
+"""
+import os
+import json
+import time
+from . import config
+
+MANIFEST_VERSION = 1
+# Encode job keys holding one path, a list of paths or a dict of paths
+_PATH_KEYS = ("text_path",)
+_PATH_LIST_KEYS = ("audio_files",)
+_PATH_DICT_KEYS = ("image_paths", "rendition_outputs")
+# Encode job keys copied as they are
+_VALUE_KEYS = ("name", "display_text", "text_placements")
+
+def _to_manifest_path(path):
+    absolute_path = os.path.abspath(path)
+    try:
+        if os.path.commonpath([absolute_path, config.BASE_DIR]) == config.BASE_DIR:
+            return os.path.relpath(absolute_path, config.BASE_DIR).replace(os.sep, "/")
+    except ValueError:
+        # On Windows, a path on another drive has nothing in common with BASE_DIR
+        pass
+    return absolute_path
+
+def _from_manifest_path(path):
+    if os.path.isabs(path):
+        return path
+    return os.path.join(config.BASE_DIR, *path.split("/"))
+
+def _convert_job(job, convert):
+    converted = {key: job[key] for key in _VALUE_KEYS if key in job}
+    for key in _PATH_KEYS:
+        if job.get(key):
+            converted[key] = convert(job[key])
+    for key in _PATH_LIST_KEYS:
+        converted[key] = [convert(path) for path in job[key]]
+    for key in _PATH_DICT_KEYS:
+        converted[key] = {name: convert(path) for name, path in job[key].items()}
+    return converted
+
+def write_manifest(encode_jobs, settings, manifest_path=None):
+    """Writes the encode jobs and the settings of an images stage. Returns the manifest path."""
+    manifest_path = manifest_path or config.STAGE_MANIFEST_PATH
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": settings,
+        "jobs": [_convert_job(job, _to_manifest_path) for job in encode_jobs],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    temp_path = f"{manifest_path}.{os.getpid()}.part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, manifest_path)
+    return manifest_path
+
+def read_manifest(manifest_path=None):
+    """
+    Reads a manifest written by write_manifest. Returns (settings, encode jobs with local paths),
+    or (None, None) if it is missing or unreadable.
+    """
+    manifest_path = manifest_path or config.STAGE_MANIFEST_PATH
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        print(f"Stage manifest not found: '{manifest_path}'. Run the images stage first (--stage images).")
+        return None, None
+    except ValueError as e:
+        print(f"Error reading stage manifest '{manifest_path}': {e}")
+        return None, None
+    if manifest.get("version") != MANIFEST_VERSION:
+        print(f"Stage manifest '{manifest_path}' has version {manifest.get('version')}, expected {MANIFEST_VERSION}. "
+              "Run the images stage again.")
+        return None, None
+    jobs = [dict(_convert_job(job, _from_manifest_path), duration=None) for job in manifest["jobs"]]
+    return manifest["settings"], jobs
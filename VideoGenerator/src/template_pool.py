@@ -0,0 +1,124 @@
+"""
+This module keeps the decoded backgrounds and icons that images are drawn from, so each one is
+decoded, fitted to its canvas and bordered once instead of once per image.
+
+Within a process, templates are kept in memory by (file, size). For parallel rendering (see
+--render-workers), the main process places every template the run needs in
+multiprocessing.shared_memory blocks once, and the worker processes wrap those blocks as
+read-only images without copying them (see share_templates and attach_shared_templates).
+Workers only copy the background they draw on, so memory stays flat as workers are added.
+
+Templates are read-only: callers copy a background before drawing on it, and only paste icons.
+"""
+import threading
+from contextlib import contextmanager
+
+_backgrounds = {}  # (path, size, fit) -> RGBA image fitted to the canvas
+_icons = {}        # (path, size) -> RGBA icon with its white border, or None if it cannot be loaded
+_lock = threading.Lock()
+# Shared memory blocks attached by a worker process, kept open while their images are in use
+_attached_blocks = []
+
+def _fit_background(background, size, fit):
+    """Resizes the background to the canvas, either stretching it or scaling and center-cropping it."""
+    from PIL import Image
+    if fit != "cover":
+        return background.resize(size)
+    scale = max(size[0] / background.width, size[1] / background.height)
+    scaled_size = (max(size[0], round(background.width * scale)), max(size[1], round(background.height * scale)))
+    scaled = background.resize(scaled_size, Image.Resampling.LANCZOS)
+    left = (scaled.width - size[0]) // 2
+    top = (scaled.height - size[1]) // 2
+    return scaled.crop((left, top, left + size[0], top + size[1]))
+
+def _load_background(path, size, fit):
+    from PIL import Image
+    # Open all images and convert to RGBA for consistency
+    return _fit_background(Image.open(path).convert("RGBA"), size, fit)
+
+def _load_icon(path, size, border_size=2):
+    from PIL import Image
+    final_size = (size, size)
+    icon_original = Image.open(path).convert("RGBA")
+    # Create a white background for the border
+    bordered_icon = Image.new('RGBA', final_size, (255, 255, 255, 255))
+    icon_resized = icon_original.resize(
+        (final_size[0] - border_size * 2, final_size[1] - border_size * 2),
+        Image.Resampling.LANCZOS
+    )
+    bordered_icon.paste(icon_resized, (border_size, border_size), icon_resized)
+    return bordered_icon
+
+def get_background(path, size, fit):
+    """Returns the background fitted to a canvas size (read-only). Raises the error of PIL if it cannot be opened."""
+    key = (path, tuple(size), fit)
+    with _lock:
+        background = _backgrounds.get(key)
+    if background is None:
+        background = _load_background(path, tuple(size), fit)
+        with _lock:
+            background = _backgrounds.setdefault(key, background)
+    return background
+
+def get_icon(path, size):
+    """Returns the icon resized to size with its white border (read-only), or None if it cannot be loaded."""
+    key = (path, size)
+    with _lock:
+        if key in _icons:
+            return _icons[key]
+    try:
+        icon = _load_icon(path, size)
+    except Exception as e:
+        print(f"Error loading or applying border to icon from path '{path}': {e}")
+        icon = None
+    with _lock:
+        return _icons.setdefault(key, icon)
+
+def _share(blocks, descriptors, key, image):
+    from multiprocessing import shared_memory
+    data = image.tobytes()
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    blocks.append(block)
+    descriptors[key] = (block.name, image.size)
+
+@contextmanager
+def share_templates(backgrounds, icons):
+    """
+    Loads the given backgrounds ((path, size, fit) keys) and icons ((path, size) keys) and copies
+    each into a shared memory block. Yields the descriptors to pass to attach_shared_templates
+    in the workers; the blocks are released when the block of the with statement ends.
+    """
+    blocks = []
+    descriptors = {"backgrounds": {}, "icons": {}}
+    try:
+        for path, size, fit in backgrounds:
+            try:
+                _share(blocks, descriptors["backgrounds"], (path, tuple(size), fit), get_background(path, size, fit))
+            except OSError as e:
+                # The worker drawing on it reports the error itself
+                print(f"Could not load background '{path}': {e}")
+        for path, size in icons:
+            icon = get_icon(path, size)
+            if icon is not None:
+                _share(blocks, descriptors["icons"], (path, size), icon)
+        yield descriptors
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def attach_shared_templates(descriptors):
+    """
+    Registers the templates shared by the main process as read-only images wrapping their
+    shared memory blocks, without copying them. Meant as the initializer of worker processes.
+    """
+    from PIL import Image
+    from multiprocessing import shared_memory
+    for cache, kind in ((_backgrounds, "backgrounds"), (_icons, "icons")):
+        for key, (name, size) in descriptors[kind].items():
+            # Workers share the resource tracker of the main process, which unlinks the blocks
+            block = shared_memory.SharedMemory(name=name)
+            _attached_blocks.append(block)
+            length = size[0] * size[1] * 4
+            cache[key] = Image.frombuffer("RGBA", size, block.buf[:length], "raw", "RGBA", 0, 1)
@@ -1,8 +1,30 @@
 import os
 import re
+import json
+import random
+import shutil
+import hashlib
+import threading
 import subprocess
+from contextlib import contextmanager
 from . import config
 
+def choose(options, *key_parts, stable=False):
+    """
+    Picks one of the options. Without a selection seed the pick is random, as before.
+    With config.SELECTION_SEED set, the pick only depends on the seed and the key parts,
+    so the same event always renders the same way, on any machine and in any run.
+    A stable pick only depends on the key parts even without a seed.
+    """
+    options = list(options)
+    if not options:
+        return None
+    if config.SELECTION_SEED is None and not stable:
+        return random.choice(options)
+    seed = "" if config.SELECTION_SEED is None else str(config.SELECTION_SEED)
+    digest = hashlib.sha256(json.dumps([seed, *key_parts], ensure_ascii=False).encode("utf-8")).digest()
+    return options[int.from_bytes(digest[:8], "big") % len(options)]
+
 def detect_audio_directories(base_path):
     """
     Automatically detects all audio folders inside the 'audios' subfolder of the base path.
@@ -37,3 +59,132 @@ def check_ffmpeg_installed():
         return True
     except (FileNotFoundError, subprocess.CalledProcessError):
         return False
+
+def get_settings_path(output_path):
+    """Returns the hidden file next to an output holding the signature of the settings it was made with."""
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f".{name}.settings")
+
+def write_settings_signature(output_paths, signature):
+    """Records the settings signature of freshly written outputs (see is_up_to_date)."""
+    for output_path in output_paths:
+        with open(get_settings_path(output_path), "w", encoding="utf-8") as f:
+            f.write(signature)
+
+def _read_settings_signature(output_path):
+    try:
+        with open(get_settings_path(output_path), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def is_up_to_date(output_paths, input_paths, signature=None):
+    """
+    Tells whether every output exists and is at least as recent as every input. With a settings
+    signature, every output must also have been made with those settings.
+    """
+    output_paths = list(output_paths)
+    try:
+        oldest_output = min(os.path.getmtime(path) for path in output_paths)
+        newest_input = max(os.path.getmtime(path) for path in input_paths)
+    except (OSError, ValueError):
+        return False
+    if signature is not None and any(_read_settings_signature(path) != signature for path in output_paths):
+        return False
+    return oldest_output >= newest_input
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    Holds an exclusive lock on lock_path for the duration of the block. Every holder opens the
+    file itself, so the lock excludes other threads as well as other processes.
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK retries for about 10 seconds before giving up, so keep asking
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_END = b"IEND\xaeB`\x82"
+
+def is_complete_image(data):
+    """Tells whether bytes hold a whole PNG or JPEG file, so a cut-off download is not kept."""
+    if data.startswith(_PNG_SIGNATURE):
+        return data.rstrip(b"\x00").endswith(_PNG_END)
+    if data.startswith(b"\xff\xd8"):
+        return data.rstrip(b"\x00").endswith(b"\xff\xd9")
+    return False
+
+# Linux ioctl that makes a copy-on-write clone of a file (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+def link_or_copy(source_path, target_path):
+    """
+    Makes target_path a copy of source_path as cheaply as possible.
+    Returns the method that was used: "reflink", "hardlink" or "copy".
+    """
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+
+    try:
+        import fcntl
+        with open(source_path, "rb") as source, open(target_path, "wb") as target:
+            fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        if os.path.exists(target_path):
+            os.remove(target_path)
+
+    try:
+        os.link(source_path, target_path)
+        return "hardlink"
+    except OSError:
+        shutil.copy2(source_path, target_path)
+        return "copy"
+
+class ContentHasher:
+    """
+    Computes SHA-256 hashes of files, remembering them as long as the file keeps its size and mtime,
+    so a long-running process (such as 'serve') hashes an edited file again.
+    """
+    def __init__(self):
+        # path -> (size, mtime_ns, hash)
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.files_hashed = 0
+
+    def hash_file(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._hashes.get(path)
+            if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+                return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        file_hash = digest.hexdigest()
+        with self._lock:
+            self._hashes[path] = (stat.st_size, stat.st_mtime_ns, file_hash)
+            self.files_hashed += 1
+        return file_hash
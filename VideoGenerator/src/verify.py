@@ -0,0 +1,164 @@
+"""
+This module implements the 'verify' command, which finds truncated or corrupt videos among
+the existing outputs without starting ffprobe for each of them.
+
+MP4 files are checked by reading their box structure directly: the top-level boxes must
+cover the file exactly (a box running past the end means the file was cut off), 'ftyp',
+'moov' and 'mdat' must all be present, and the duration is read from the 'mvhd' box. Only a
+few headers are read per file, so a thread pool gets through tens of thousands of outputs
+quickly. Other containers (mkv, webm) fall back to ffprobe.
+
+Each duration is compared with the length of the event audio. The events that fail are
+written to config.VERIFY_FAILURES_PATH, in the format read by --approved, so that only they
+are encoded again.
+"""
+import os
+import json
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+from . import metrics
+from . import video_generator
+
+_MP4_EXTENSIONS = (".mp4", ".m4v", ".mov")
+_REQUIRED_BOXES = ("ftyp", "moov", "mdat")
+
+def _read_box_header(f, offset, end):
+    """Returns (box type, box size, header size) of the box at offset. Raises ValueError if it is cut off."""
+    f.seek(offset)
+    header = f.read(8)
+    if len(header) < 8:
+        raise ValueError(f"box header at byte {offset} is cut off")
+    size, box_type = struct.unpack(">I4s", header)
+    header_size = 8
+    if size == 1:
+        large_size = f.read(8)
+        if len(large_size) < 8:
+            raise ValueError(f"box header at byte {offset} is cut off")
+        size = struct.unpack(">Q", large_size)[0]
+        header_size = 16
+    elif size == 0:
+        # A size of 0 means the box runs to the end of the file
+        size = end - offset
+    if size < header_size:
+        raise ValueError(f"box at byte {offset} has an invalid size ({size})")
+    return box_type.decode("latin-1"), size, header_size
+
+def _read_mvhd_duration(f, moov_offset, moov_size, moov_header_size):
+    """Returns the duration in seconds from the 'mvhd' box of a 'moov' box. Raises ValueError without one."""
+    offset = moov_offset + moov_header_size
+    end = moov_offset + moov_size
+    while offset < end:
+        box_type, size, header_size = _read_box_header(f, offset, end)
+        if box_type == "mvhd":
+            f.seek(offset + header_size)
+            version = f.read(4)[:1]
+            if version == b"\x01":
+                _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+            else:
+                _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+            if not timescale:
+                raise ValueError("'mvhd' has a timescale of 0")
+            return duration / timescale
+        offset += size
+    raise ValueError("'moov' has no 'mvhd' box")
+
+def check_mp4(video_path):
+    """
+    Checks the box structure of an MP4 file.
+    Returns (duration in seconds, None) if it is whole, or (None, problem) if it is not.
+    """
+    try:
+        file_size = os.path.getsize(video_path)
+        boxes = {}
+        with open(video_path, "rb") as f:
+            offset = 0
+            while offset < file_size:
+                box_type, size, header_size = _read_box_header(f, offset, file_size)
+                if offset + size > file_size:
+                    return None, f"'{box_type}' box runs {offset + size - file_size} bytes past the end of the file (truncated)"
+                boxes.setdefault(box_type, (offset, size, header_size))
+                offset += size
+
+            missing = [box_type for box_type in _REQUIRED_BOXES if box_type not in boxes]
+            if missing:
+                return None, f"missing box{'es' if len(missing) > 1 else ''}: {', '.join(missing)}"
+            return _read_mvhd_duration(f, *boxes["moov"]), None
+    except (OSError, ValueError, struct.error) as e:
+        return None, str(e)
+
+def probe_duration(video_path):
+    """Returns (duration in seconds, None) of a non-MP4 video from ffprobe, or (None, problem)."""
+    cmd = [config.FFPROBE_EXE, "-v", "error", "-show_entries", "format=duration", "-of", "json", video_path]
+    try:
+        with metrics.get_metrics().timer("ffmpeg_seconds", operation="verify_probe"):
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return float(json.loads(result.stdout)["format"]["duration"]), None
+    except FileNotFoundError:
+        return None, f"'{config.FFPROBE_EXE}' not found"
+    except subprocess.CalledProcessError as e:
+        return None, e.stderr.strip() or "ffprobe failed"
+    except (ValueError, KeyError) as e:
+        return None, f"no duration: {e}"
+
+def check_video(check, silence_duration=0.0, tolerance=None):
+    """
+    Verifies one video against its event audio. check is a dict with the 'event_id',
+    'video_path' and 'audio_files' of the video. Returns the problem found, or None.
+    """
+    tolerance = config.VERIFY_DURATION_TOLERANCE if tolerance is None else tolerance
+    video_path = check["video_path"]
+    if not os.path.exists(video_path):
+        return "missing"
+    if video_path.lower().endswith(_MP4_EXTENSIONS):
+        duration, problem = check_mp4(video_path)
+    else:
+        duration, problem = probe_duration(video_path)
+    if problem:
+        return problem
+
+    expected = video_generator.get_total_audio_duration(check["audio_files"], silence_duration)
+    if expected is None:
+        return "audio length unknown (a clip could not be probed)"
+    if abs(duration - expected) > tolerance:
+        return f"lasts {duration:.2f}s, its audio lasts {expected:.2f}s"
+    return None
+
+def verify_videos(checks, silence_duration=0.0, workers=None):
+    """
+    Verifies every video in parallel and prints the failures.
+    Returns the sorted event ids of the events with at least one failed video.
+    """
+    workers = workers or config.VERIFY_WORKERS or 4 * (os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        problems = list(executor.map(lambda check: check_video(check, silence_duration), checks))
+
+    failed_events = set()
+    missing = 0
+    for check, problem in zip(checks, problems):
+        if problem is None:
+            continue
+        failed_events.add(check["event_id"])
+        if problem == "missing":
+            missing += 1
+        else:
+            print(f"  ✗ {os.path.relpath(check['video_path'], config.BASE_DIR)}: {problem}")
+
+    print("\n=== VERIFY SUMMARY ===")
+    print(f"Videos checked: {len(checks)}")
+    print(f"Videos OK: {problems.count(None)}")
+    print(f"Videos missing: {missing}")
+    print(f"Videos truncated, corrupt or of the wrong length: {len(checks) - problems.count(None) - missing}")
+    print(f"Events to encode again: {len(failed_events)}")
+    print("======================")
+    return sorted(failed_events)
+
+def write_failures(failed_events, output_path=None):
+    """Writes the failed events in the format read by --approved. Returns the file path."""
+    output_path = output_path or config.VERIFY_FAILURES_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("# Events whose videos failed 'verify'\n")
+        f.writelines(f"{event_id}\n" for event_id in failed_events)
+    return output_path
@@ -1,44 +1,182 @@
 import os
+import json
+import hashlib
 import subprocess
+import tempfile
+import threading
 from . import config
+from . import audio_metadata
+from . import loudness
+from . import metrics
+from . import utils
+
+# Base image hashes are remembered for the run, since many events share each base image
+_hasher = utils.ContentHasher()
+# One lock per base track, so parallel events encode a shared base track only once
+_base_track_locks = {}
+_base_track_locks_lock = threading.Lock()
+
+def get_output_profile(output_profile=None):
+    """Returns the settings of an output profile (see config.OUTPUT_PROFILES)."""
+    return config.OUTPUT_PROFILES[output_profile or config.DEFAULT_OUTPUT_PROFILE]
+
+def get_encoder_profile(encoder_profile=None):
+    """Returns the settings of an encoder profile (see config.ENCODER_PROFILES)."""
+    return config.ENCODER_PROFILES[encoder_profile or config.DEFAULT_ENCODER_PROFILE]
+
+def get_video_args(output_profile=None, encoder_profile=None):
+    """Returns the ffmpeg video encoder arguments of an output profile under an encoder profile."""
+    profile = get_output_profile(output_profile)
+    encoder = get_encoder_profile(encoder_profile)
+    video_codec = profile["video_codec"]
+    args = ["-c:v", video_codec] + encoder[video_codec] + ["-pix_fmt", "yuv420p"]
+    if encoder["gop_seconds"]:
+        args += ["-g", str(int(encoder["fps"] * encoder["gop_seconds"]))]
+    return args
+
+def get_encoder_signature(output_profile=None, encoder_profile=None):
+    """Returns the encoder settings that decide what an output looks like, for content-addressed reuse."""
+    return {"output": get_output_profile(output_profile), "encoder": get_encoder_profile(encoder_profile)}
+
+def _make_temp_path(suffix):
+    """Creates a unique temporary file in the cache folder, so parallel runs never share temp files."""
+    os.makedirs(config.CACHE_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=config.CACHE_DIR)
+    os.close(fd)
+    return path
 
 def get_audio_duration(audio_path):
-    try:
-        cmd = [config.FFPROBE_EXE, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", audio_path]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return float(result.stdout.strip())
-    except FileNotFoundError:
-        print(f"Error: '{config.FFPROBE_EXE}' not found. Make sure the file is in the 'bin' folder.")
-        return None
-    except (subprocess.CalledProcessError, ValueError) as e:
-        print(f"Error getting duration for {audio_path}: {e}")
+    """Returns the duration of a clip in seconds, from the audio metadata store."""
+    metadata = audio_metadata.get_store().get(audio_path)
+    return metadata["duration"] if metadata else None
+
+def get_audio_stream_info(audio_path):
+    """
+    Returns the codec, sample rate, channel count and codec extradata hash of the first
+    audio stream of a file, or None if it cannot be probed.
+    """
+    metadata = audio_metadata.get_store().get(audio_path)
+    if metadata is None:
         return None
+    return {key: value for key, value in metadata.items() if key != "duration"}
+
+def _clip_format(audio_path):
+    """Returns the (sample rate, channel layout) of a clip."""
+    stream_info = get_audio_stream_info(audio_path) or {}
+    sample_rate = stream_info.get("sample_rate") or 48000
+    channels = stream_info.get("channels") or 1
+    return sample_rate, {1: "mono", 2: "stereo"}.get(channels, f"{channels}c")
+
+def _silence_source(audio_path):
+    """Returns the anullsrc filter making silence in the sample rate and channels of a clip."""
+    sample_rate, channel_layout = _clip_format(audio_path)
+    return f"anullsrc=r={sample_rate}:cl={channel_layout}"
 
-def create_video(image_path, audio_file_paths, output_video_path, silence_duration=0.0):
-    if os.path.exists(image_path) is False:
-        print(f"Error: Image not found: {image_path}")
+def _build_audio_join_filter(audio_file_paths, first_input, silence_duration, loudnorm=False, prefix=""):
+    """
+    Returns the filter joining the clips (inputs first_input onwards) with their silences,
+    ending in the [<prefix>aout] label. With loudnorm, every clip is first normalized with its
+    cached loudness measurement (see loudness.py). Every part is brought to the format of the
+    first clip, since loudnorm resamples its output and concat needs matching formats.
+    """
+    sample_rate, channel_layout = _clip_format(audio_file_paths[0])
+    audio_format = f"aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts={channel_layout}"
+    filters = []
+    labels = []
+    for i, audio_path in enumerate(audio_file_paths):
+        normalize = f"{loudness.get_filter(loudness.get_store().get(audio_path))}," if loudnorm else ""
+        filters.append(f"[{first_input + i}:a]{normalize}{audio_format}[{prefix}n{i}]")
+        labels.append(f"[{prefix}n{i}]")
+        if silence_duration > 0 and i < len(audio_file_paths) - 1:
+            filters.append(f"anullsrc=r={sample_rate}:cl={channel_layout}:d={silence_duration},{audio_format}[{prefix}s{i}]")
+            labels.append(f"[{prefix}s{i}]")
+    if len(labels) == 1:
+        filters[0] = filters[0][:-len(labels[0])] + f"[{prefix}aout]"
+    else:
+        filters.append(f"{''.join(labels)}concat=n={len(labels)}:v=0:a=1[{prefix}aout]")
+    return ";".join(filters)
+
+def can_copy_audio(audio_file_paths, profile, silence_duration=0.0):
+    """
+    Tells whether the source audio can be muxed by stream copy. Several clips can only be joined
+    without re-encoding when they share the codec, its parameters and its headers (extradata),
+    and when no silence has to be inserted between them.
+    """
+    if profile["audio"] != "copy":
         return False
-    if not audio_file_paths:
-        print(f"Error: No audio files provided.")
+    if len(audio_file_paths) > 1 and silence_duration > 0:
         return False
 
-    temp_audio_path = None
-    final_audio_input = None
-    concat_list_path = None
-    silent_audio_path = None
+    stream_infos = [get_audio_stream_info(path) for path in audio_file_paths]
+    if any(info is None for info in stream_infos):
+        return False
+    allowed_codecs = profile.get("copy_codecs")
+    if allowed_codecs and stream_infos[0].get("codec_name") not in allowed_codecs:
+        return False
+    return all(info == stream_infos[0] for info in stream_infos)
 
-    try:
+def _escape_filter_value(value):
+    """Escapes a value for a filter option, then for the filter graph around it."""
+    for character in "\\:'":
+        value = value.replace(character, "\\" + character)
+    for character in "\\',;[]":
+        value = value.replace(character, "\\" + character)
+    return value
+
+def get_drawtext_filter(text_path, placement):
+    """
+    Returns the drawtext filter writing the text of text_path like create_image does: centered,
+    with the line centered on the anchor of the layout. The text is read from a file and never
+    expanded, so any character of the text is drawn as is.
+    """
+    # ffmpeg accepts forward slashes on every platform, and they need no escaping
+    font_path = _escape_filter_value(config.FONT_PATH.replace("\\", "/"))
+    text_path = _escape_filter_value(text_path.replace("\\", "/"))
+    return (f"drawtext=fontfile={font_path}:textfile={text_path}:expansion=none:fontcolor=white:"
+            f"fontsize={placement['font_size']}:x=(w-text_w)/2:y={placement['anchor_y']}-(ascent-descent)/2")
+
+def _prepare_audio(audio_file_paths, profile, silence_duration, loudnorm, first_input, temp_paths):
+    """
+    Prepares the audio inputs of an event whose first audio input is first_input. Returns a dict
+    with the ffmpeg "input_args", the "filter" joining them (or None), whether the audio is
+    stream "copy"-ed and the "duration" of the audio. Temporary files are added to temp_paths.
+    """
+    copy_audio = not loudnorm and can_copy_audio(audio_file_paths, profile, silence_duration)
+    audio_filter = None
+    if loudnorm:
+        # Every clip is its own input, normalized and joined with the silences by the filter graph
+        audio_input_args = [arg for audio_path in audio_file_paths for arg in ("-i", audio_path)]
+        audio_filter = _build_audio_join_filter(audio_file_paths, first_input, silence_duration, loudnorm=True)
+        audio_duration = get_total_audio_duration(audio_file_paths, silence_duration)
+    elif copy_audio:
+        # Mux the original audio as is. Several clips go through the concat demuxer by stream copy.
+        if len(audio_file_paths) > 1:
+            concat_list_path = _make_temp_path(".txt")
+            temp_paths.append(concat_list_path)
+            with open(concat_list_path, "w", encoding="utf-8") as f:
+                for audio_path in audio_file_paths:
+                    f.write(f"file '{audio_path}'\n")
+            audio_input_args = ["-f", "concat", "-safe", "0", "-i", concat_list_path]
+        else:
+            audio_input_args = ["-i", audio_file_paths[0]]
+        audio_duration = get_total_audio_duration(audio_file_paths)
+    else:
         if len(audio_file_paths) > 1:
-            # Create a silent audio file if needed
+            # Create a silent audio file if needed, in the format of the clips so that
+            # concatenating them does not resample anything
+            silent_audio_path = None
             if silence_duration > 0:
-                silent_audio_path = os.path.join(config.CACHE_DIR, "silent_audio.wav")
+                silent_audio_path = _make_temp_path(".wav")
+                temp_paths.append(silent_audio_path)
                 silence_cmd = [
-                    config.FFMPEG_EXE, "-f", "lavfi", "-i", f"anullsrc=r=48000:cl=mono",
+                    config.FFMPEG_EXE, "-f", "lavfi", "-i", _silence_source(audio_file_paths[0]),
                     "-t", str(silence_duration), "-c:a", "pcm_s16le", "-y", silent_audio_path
                 ]
-                subprocess.run(silence_cmd, capture_output=True, check=True, text=True)
+                with metrics.get_metrics().timer("ffmpeg_seconds", operation="silence"):
+                    subprocess.run(silence_cmd, capture_output=True, check=True, text=True)
 
-            concat_list_path = os.path.join(config.CACHE_DIR, "concat_list.txt")
+            concat_list_path = _make_temp_path(".txt")
+            temp_paths.append(concat_list_path)
             with open(concat_list_path, "w", encoding="utf-8") as f:
                 for i, audio_path in enumerate(audio_file_paths):
                     f.write(f"file '{audio_path}'\n")
@@ -46,31 +184,328 @@ def create_video(image_path, audio_file_paths, output_video_path, silence_durati
                     if silent_audio_path and i < len(audio_file_paths) - 1:
                         f.write(f"file '{silent_audio_path}'\n")
 
-            temp_audio_path = os.path.join(config.CACHE_DIR, "temp_audio.wav")
+            temp_audio_path = _make_temp_path(".wav")
+            temp_paths.append(temp_audio_path)
             concat_cmd = [
                 config.FFMPEG_EXE, "-f", "concat", "-safe", "0", "-i", concat_list_path,
                 "-c:a", "pcm_s16le", "-y", temp_audio_path
             ]
-            subprocess.run(concat_cmd, capture_output=True, check=True, text=True)
+            with metrics.get_metrics().timer("ffmpeg_seconds", operation="concat"):
+                subprocess.run(concat_cmd, capture_output=True, check=True, text=True)
             final_audio_input = temp_audio_path
         else:
             final_audio_input = audio_file_paths[0]
+        audio_input_args = ["-i", final_audio_input]
+        audio_duration = get_total_audio_duration(audio_file_paths, silence_duration)
+    return {"input_args": audio_input_args, "filter": audio_filter, "copy": copy_audio, "duration": audio_duration}
 
-        audio_duration = get_audio_duration(final_audio_input)
-        if audio_duration is None:
+def _remove_temp_files(temp_paths):
+    for temp_path in temp_paths:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _remove_outputs(rendition_outputs):
+    """
+    Removes previous outputs before encoding: they may be hard links shared with other events
+    (see dedup.py), and ffmpeg would otherwise overwrite the shared file in place.
+    """
+    for output_path in rendition_outputs.values():
+        if os.path.lexists(output_path):
+            os.remove(output_path)
+
+def _audio_maps(audio_index, audio_filter, output_count, prefix=""):
+    """
+    Returns the (filters, audio map of each output) of an event. With an audio_filter, the audio
+    is its [<prefix>aout] label, split between the outputs since a filter output can only be
+    mapped once.
+    """
+    if not audio_filter:
+        return [], [f"{audio_index}:a"] * output_count
+    if output_count == 1:
+        return [audio_filter], [f"[{prefix}aout]"]
+    audio_maps = [f"[{prefix}aout{j}]" for j in range(output_count)]
+    return [audio_filter, f"[{prefix}aout]asplit={output_count}{''.join(audio_maps)}"], audio_maps
+
+def _rendition_command_parts(image_paths, audio_input_args, rendition_outputs, audio_duration, threads,
+                             profile, encoder, video_args, copy_audio=False, audio_filter=None, first_input=0, prefix="",
+                             video_filters=None):
+    """
+    Returns the (input arguments, filters, output arguments) writing every rendition of an event.
+    Each layout image is decoded once and split between the renditions using it, and the audio
+    input is decoded once for all outputs (or not decoded at all when it is copied). The image
+    is read at the frame rate of the encoder profile, so low frame rate profiles also scale and
+    encode fewer frames. With an audio_filter, the audio of the outputs is its [<prefix>aout]
+    label instead of the audio input. first_input and prefix place the event among others in
+    one command (see create_video_batch). video_filters maps layout names to a filter applied to
+    their image before it is split and scaled (see get_drawtext_filter).
+    """
+    input_args = []
+    layout_inputs = {}
+    for layout_name, image_path in image_paths.items():
+        layout_inputs[layout_name] = first_input + len(layout_inputs)
+        input_args += ["-framerate", str(encoder["fps"]), "-loop", "1", "-i", image_path]
+    audio_index = first_input + len(layout_inputs)
+    input_args += audio_input_args
+
+    # Group the renditions by the layout image they are made from
+    renditions_by_layout = {}
+    for rendition_name in rendition_outputs:
+        layout_name = config.RENDITIONS[rendition_name]["layout"]
+        renditions_by_layout.setdefault(layout_name, []).append(rendition_name)
+
+    filters = []
+    video_maps = {}
+    for layout_name, rendition_names in renditions_by_layout.items():
+        input_index = layout_inputs[layout_name]
+        layout_size = config.LAYOUT_PRESETS[layout_name]["size"]
+        needs_scaling = [tuple(config.RENDITIONS[r]["size"]) != tuple(layout_size) for r in rendition_names]
+        source_label = f"[{input_index}:v]"
+        if video_filters and layout_name in video_filters:
+            filters.append(f"{source_label}{video_filters[layout_name]}[{prefix}t{input_index}]")
+            source_label = f"[{prefix}t{input_index}]"
+
+        if len(rendition_names) == 1 and not needs_scaling[0]:
+            video_maps[rendition_names[0]] = source_label if video_filters else f"{input_index}:v"
+            continue
+
+        if len(rendition_names) > 1:
+            split_labels = [f"[s{input_index}_{j}]" for j in range(len(rendition_names))]
+            filters.append(f"{source_label}split={len(rendition_names)}{''.join(split_labels)}")
+        else:
+            split_labels = [source_label]
+
+        for rendition_name, split_label, scale in zip(rendition_names, split_labels, needs_scaling):
+            if scale:
+                width, height = config.RENDITIONS[rendition_name]["size"]
+                filters.append(f"{split_label}scale={width}:{height}:flags=lanczos[{prefix}v_{rendition_name}]")
+                video_maps[rendition_name] = f"[{prefix}v_{rendition_name}]"
+            else:
+                video_maps[rendition_name] = split_label
+
+    audio_filters, audio_maps = _audio_maps(audio_index, audio_filter, len(rendition_outputs), prefix)
+    filters += audio_filters
+
+    output_args = []
+    for (rendition_name, output_path), audio_map in zip(rendition_outputs.items(), audio_maps):
+        output_args += ["-map", video_maps[rendition_name], "-map", audio_map]
+        output_args += video_args + ["-threads", str(threads)]
+        output_args += ["-c:a", "copy"] if copy_audio else profile["audio_args"]
+        output_args += ["-t", str(audio_duration), "-shortest", "-y", output_path]
+    return input_args, filters, output_args
+
+def _build_rendition_command(image_paths, audio_input_args, rendition_outputs, audio_duration, threads,
+                             profile, encoder, video_args, copy_audio=False, audio_filter=None, video_filters=None):
+    """Builds one ffmpeg command writing every rendition of an event (see _rendition_command_parts)."""
+    input_args, filters, output_args = _rendition_command_parts(
+        image_paths, audio_input_args, rendition_outputs, audio_duration, threads,
+        profile, encoder, video_args, copy_audio, audio_filter, video_filters=video_filters
+    )
+    cmd = [config.FFMPEG_EXE] + input_args
+    if filters:
+        cmd += ["-filter_complex", ";".join(filters)]
+    return cmd + output_args
+
+def get_total_audio_duration(audio_file_paths, silence_duration=0.0):
+    """Returns the length of the concatenated audio of an event, or None if a clip cannot be probed."""
+    total = 0.0
+    for audio_path in audio_file_paths:
+        duration = get_audio_duration(audio_path)
+        if duration is None:
+            return None
+        total += duration
+    return total + silence_duration * (len(audio_file_paths) - 1)
+
+def create_video(image_path, audio_file_paths, output_video_path, silence_duration=0.0, threads=None,
+                 output_profile=None, encoder_profile=None, loudnorm=False):
+    """Creates a single landscape 1080p video."""
+    return create_video_renditions({"landscape": image_path}, audio_file_paths, {"1080p": output_video_path},
+                                   silence_duration, threads, output_profile, encoder_profile, loudnorm)
+
+def create_video_renditions(image_paths, audio_file_paths, rendition_outputs, silence_duration=0.0, threads=None,
+                            output_profile=None, encoder_profile=None, loudnorm=False, text_overlay=None):
+    """
+    Creates every requested rendition of an event in a single ffmpeg process.
+
+    :param image_paths: Dict of layout name -> image path, for every layout the renditions use.
+    :param audio_file_paths: The audio clips of the event, concatenated in order.
+    :param rendition_outputs: Dict of rendition name (see config.RENDITIONS) -> output video path.
+    :param silence_duration: Silence in seconds inserted between the clips.
+    :param threads: Threads given to the encoder (see scheduler.py). Defaults to config.ENCODE_THREADS_PER_JOB.
+    :param output_profile: Name of the output profile (see config.OUTPUT_PROFILES). Defaults to MP4/AAC.
+    :param encoder_profile: Name of the encoder profile (see config.ENCODER_PROFILES).
+    :param loudnorm: Normalize every clip to config.LOUDNORM_TARGET (EBU R128) in the same ffmpeg pass.
+    :param text_overlay: Dict with the "text_path" of the event text and its "placements" by layout
+                         (see image_generator.get_text_placement). The text is drawn by ffmpeg on
+                         images without text (see --text-mode drawtext).
+    """
+    for layout_name in {config.RENDITIONS[r]["layout"] for r in rendition_outputs}:
+        image_path = image_paths.get(layout_name)
+        if image_path is None or os.path.exists(image_path) is False:
+            print(f"Error: Image not found for layout '{layout_name}': {image_path}")
+            return False
+    if not audio_file_paths:
+        print(f"Error: No audio files provided.")
+        return False
+
+    profile = get_output_profile(output_profile)
+    encoder = get_encoder_profile(encoder_profile)
+    video_args = get_video_args(output_profile, encoder_profile)
+
+    # Only pass the layouts that a requested rendition actually uses
+    used_layouts = {config.RENDITIONS[r]["layout"] for r in rendition_outputs}
+    used_image_paths = {name: path for name, path in image_paths.items() if name in used_layouts}
+    video_filters = None
+    if text_overlay:
+        video_filters = {layout_name: get_drawtext_filter(text_overlay["text_path"], text_overlay["placements"][layout_name])
+                         for layout_name in used_image_paths}
+    temp_paths = []
+
+    try:
+        audio = _prepare_audio(audio_file_paths, profile, silence_duration, loudnorm, len(used_image_paths), temp_paths)
+        if audio["duration"] is None:
             print(f"Error: Could not get audio duration. Please check the audio file.")
             return False
 
+        cmd = _build_rendition_command(used_image_paths, audio["input_args"], rendition_outputs, audio["duration"],
+                                       threads or config.ENCODE_THREADS_PER_JOB, profile, encoder, video_args,
+                                       audio["copy"], audio["filter"], video_filters)
+
+        _remove_outputs(rendition_outputs)
+        output_names = ", ".join(os.path.basename(p) for p in rendition_outputs.values())
+        print(f"Creating video: {output_names}" + (" (audio stream copy)" if audio["copy"] else "")
+              + (" (loudness normalized)" if loudnorm else "") + (" (text drawn by ffmpeg)" if text_overlay else ""))
+        with metrics.get_metrics().timer("ffmpeg_seconds", operation="encode"):
+            subprocess.run(cmd, capture_output=True, check=True, text=True)
+        for output_path in rendition_outputs.values():
+            print(f"Video saved: {output_path}")
+        return True
+
+    except subprocess.CalledProcessError as e:
+        print(f"Error creating video with FFmpeg. Exit code: {e.returncode}\nStdout: {e.stdout}\nStderr: {e.stderr}")
+        return False
+    except Exception as e:
+        print(f"An unexpected error occurred during video creation: {e}")
+        return False
+    finally:
+        _remove_temp_files(temp_paths)
+
+def _format_srt_time(seconds):
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+def _write_subtitle_file(display_text, duration):
+    """Writes a temporary SRT file showing the text for the whole event. Returns its path."""
+    subtitle_path = _make_temp_path(".srt")
+    with open(subtitle_path, "w", encoding="utf-8") as f:
+        f.write(f"1\n{_format_srt_time(0)} --> {_format_srt_time(duration)}\n{display_text}\n")
+    return subtitle_path
+
+def get_base_track(image_path, rendition_name, output_profile=None, encoder_profile=None):
+    """
+    Returns a short video of an image without text for a rendition, encoded once and kept in
+    config.BASE_TRACK_CACHE_DIR under the hash of the image and the encoder settings (see
+    --text-mode subtitles). Returns None if it cannot be encoded.
+    """
+    profile = get_output_profile(output_profile)
+    encoder = get_encoder_profile(encoder_profile)
+    try:
+        track_inputs = {
+            "image": _hasher.hash_file(image_path),
+            "size": config.RENDITIONS[rendition_name]["size"],
+            "encoder": get_encoder_signature(output_profile, encoder_profile),
+            "seconds": config.BASE_TRACK_SECONDS,
+        }
+    except OSError as e:
+        print(f"Error reading base image {image_path}: {e}")
+        return None
+    track_key = hashlib.sha256(json.dumps(track_inputs, sort_keys=True).encode("utf-8")).hexdigest()
+    track_path = os.path.join(config.BASE_TRACK_CACHE_DIR, f"{track_key}{profile['extension']}")
+
+    with _base_track_locks_lock:
+        track_lock = _base_track_locks.setdefault(track_key, threading.Lock())
+    # Events sharing a base track wait for the first one to encode it
+    with track_lock:
+        if os.path.exists(track_path):
+            return track_path
+        os.makedirs(config.BASE_TRACK_CACHE_DIR, exist_ok=True)
+        width, height = config.RENDITIONS[rendition_name]["size"]
+        temp_path = os.path.join(config.BASE_TRACK_CACHE_DIR, f"{track_key}.{os.getpid()}.part{profile['extension']}")
         cmd = [
-            config.FFMPEG_EXE, "-loop", "1", "-i", image_path, "-i", final_audio_input,
-            "-c:v", "libx264", "-tune", "stillimage", "-preset", "superfast",
-            "-threads", "2", "-crf", "25", "-c:a", "aac", "-t", str(audio_duration),
-            "-b:a", "128k", "-pix_fmt", "yuv420p", "-shortest", "-y", output_video_path
+            config.FFMPEG_EXE, "-framerate", str(encoder["fps"]), "-loop", "1", "-i", image_path,
+            "-vf", f"scale={width}:{height}:flags=lanczos", *get_video_args(output_profile, encoder_profile),
+            "-t", str(config.BASE_TRACK_SECONDS), "-an", "-y", temp_path
         ]
+        print(f"Creating base track: {rendition_name} of {os.path.basename(image_path)}")
+        try:
+            with metrics.get_metrics().timer("ffmpeg_seconds", operation="base_track"):
+                subprocess.run(cmd, capture_output=True, check=True, text=True)
+            os.replace(temp_path, track_path)
+        except subprocess.CalledProcessError as e:
+            print(f"Error creating base track with FFmpeg. Exit code: {e.returncode}\nStderr: {e.stderr}")
+            return None
+        except OSError as e:
+            print(f"Error creating base track: {e}")
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return track_path
 
-        print(f"Creating video: {os.path.basename(output_video_path)}")
-        subprocess.run(cmd, capture_output=True, check=True, text=True)
-        print(f"Video saved: {output_video_path}")
+def create_video_subtitled(image_paths, audio_file_paths, rendition_outputs, display_text, silence_duration=0.0,
+                           threads=None, output_profile=None, encoder_profile=None, loudnorm=False):
+    """
+    Creates every requested rendition of an event from the base tracks of its images without
+    text, carrying display_text as a subtitle track (see --text-mode subtitles). The base
+    tracks are looped by stream copy, so only the audio of the event is encoded.
+    Takes the same arguments as create_video_renditions, plus the text of the event.
+    """
+    if not audio_file_paths:
+        print(f"Error: No audio files provided.")
+        return False
+    base_tracks = {}
+    for rendition_name in rendition_outputs:
+        image_path = image_paths.get(config.RENDITIONS[rendition_name]["layout"])
+        if image_path is None or not os.path.exists(image_path):
+            print(f"Error: Base image not found for rendition '{rendition_name}': {image_path}")
+            return False
+        base_tracks[rendition_name] = get_base_track(image_path, rendition_name, output_profile, encoder_profile)
+        if base_tracks[rendition_name] is None:
+            return False
+
+    profile = get_output_profile(output_profile)
+    temp_paths = []
+    try:
+        audio = _prepare_audio(audio_file_paths, profile, silence_duration, loudnorm, len(base_tracks), temp_paths)
+        if audio["duration"] is None:
+            print(f"Error: Could not get audio duration. Please check the audio file.")
+            return False
+        subtitle_path = _write_subtitle_file(display_text, audio["duration"])
+        temp_paths.append(subtitle_path)
+
+        cmd = [config.FFMPEG_EXE]
+        for base_track in base_tracks.values():
+            cmd += ["-stream_loop", "-1", "-i", base_track]
+        cmd += audio["input_args"]
+        subtitle_index = len(base_tracks) + audio["input_args"].count("-i")
+        cmd += ["-i", subtitle_path]
+        audio_filters, audio_maps = _audio_maps(len(base_tracks), audio["filter"], len(rendition_outputs))
+        if audio_filters:
+            cmd += ["-filter_complex", ";".join(audio_filters)]
+        for j, ((rendition_name, output_path), audio_map) in enumerate(zip(rendition_outputs.items(), audio_maps)):
+            cmd += ["-map", f"{j}:v", "-map", audio_map, "-map", f"{subtitle_index}:s", "-c:v", "copy"]
+            cmd += ["-c:a", "copy"] if audio["copy"] else profile["audio_args"]
+            cmd += ["-c:s", profile["subtitle_codec"], "-disposition:s:0", "default"]
+            cmd += ["-threads", str(threads or config.ENCODE_THREADS_PER_JOB), "-t", str(audio["duration"]), "-y", output_path]
+
+        _remove_outputs(rendition_outputs)
+        print(f"Creating video: {', '.join(os.path.basename(p) for p in rendition_outputs.values())} (text as subtitles)")
+        with metrics.get_metrics().timer("ffmpeg_seconds", operation="encode"):
+            subprocess.run(cmd, capture_output=True, check=True, text=True)
+        for output_path in rendition_outputs.values():
+            print(f"Video saved: {output_path}")
         return True
 
     except subprocess.CalledProcessError as e:
@@ -80,9 +515,100 @@ def create_video(image_path, audio_file_paths, output_video_path, silence_durati
         print(f"An unexpected error occurred during video creation: {e}")
         return False
     finally:
-        if concat_list_path and os.path.exists(concat_list_path):
-            os.remove(concat_list_path)
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-        if silent_audio_path and os.path.exists(silent_audio_path):
-            os.remove(silent_audio_path)
+        _remove_temp_files(temp_paths)
+
+def create_video_batch(events, silence_duration=0.0, threads=None, output_profile=None, encoder_profile=None,
+                       loudnorm=False):
+    """
+    Creates the renditions of several events in a single ffmpeg process, for packs of short clips
+    where starting ffmpeg costs more than the encode itself. Each event is a dict with the 'name',
+    'image_paths', 'audio_files' and 'rendition_outputs' of an encode job. The clips of an event
+    are joined in the filter graph, so no temporary files are needed.
+
+    Returns one success flag per event, in order. If the batch fails, its events are encoded
+    again one by one (see create_video_renditions), so a bad input only fails its own event.
+    A batch never runs more outputs at once than it has threads.
+    """
+    job_threads = threads or config.ENCODE_THREADS_PER_JOB
+    output_count = sum(len(event["rendition_outputs"]) for event in events)
+    if output_count > job_threads and len(events) > 1:
+        # Every output gets at least one encoder thread, so a batch with more outputs than the
+        # threads of its job is encoded as several smaller batches, one after the other
+        results, chunk, chunk_outputs = [], [], 0
+        for event in events:
+            if chunk and chunk_outputs + len(event["rendition_outputs"]) > job_threads:
+                results += create_video_batch(chunk, silence_duration, threads, output_profile, encoder_profile, loudnorm)
+                chunk, chunk_outputs = [], 0
+            chunk.append(event)
+            chunk_outputs += len(event["rendition_outputs"])
+        return results + create_video_batch(chunk, silence_duration, threads, output_profile, encoder_profile, loudnorm)
+
+    profile = get_output_profile(output_profile)
+    encoder = get_encoder_profile(encoder_profile)
+    video_args = get_video_args(output_profile, encoder_profile)
+    # The outputs of the batch encode side by side, so they share the threads of the job
+    output_threads = max(1, job_threads // max(1, output_count))
+
+    results = [False] * len(events)
+    batched = []
+    input_args, filters, output_args = [], [], []
+    for i, event in enumerate(events):
+        audio_file_paths = event["audio_files"]
+        used_layouts = {config.RENDITIONS[r]["layout"] for r in event["rendition_outputs"]}
+        used_image_paths = {name: path for name, path in event["image_paths"].items() if name in used_layouts}
+        if len(used_image_paths) < len(used_layouts) or not all(os.path.exists(p) for p in used_image_paths.values()):
+            print(f"Error: Image not found for '{event['name']}'.")
+            continue
+        audio_duration = get_total_audio_duration(audio_file_paths, silence_duration) if audio_file_paths else None
+        if audio_duration is None:
+            print(f"Error: Could not get audio duration for '{event['name']}'. Please check the audio files.")
+            continue
+
+        first_input = input_args.count("-i")
+        prefix = f"e{i}_"
+        copy_audio = not loudnorm and len(audio_file_paths) == 1 and can_copy_audio(audio_file_paths, profile)
+        audio_filter = None
+        if loudnorm or len(audio_file_paths) > 1:
+            audio_filter = _build_audio_join_filter(audio_file_paths, first_input + len(used_image_paths),
+                                                    silence_duration, loudnorm, prefix)
+        event_inputs, event_filters, event_outputs = _rendition_command_parts(
+            used_image_paths, [arg for audio_path in audio_file_paths for arg in ("-i", audio_path)],
+            event["rendition_outputs"], audio_duration, output_threads, profile, encoder, video_args,
+            copy_audio, audio_filter, first_input, prefix
+        )
+        input_args += event_inputs
+        filters += event_filters
+        output_args += event_outputs
+        batched.append(i)
+
+    if not batched:
+        return results
+
+    for i in batched:
+        _remove_outputs(events[i]["rendition_outputs"])
+
+    cmd = [config.FFMPEG_EXE] + input_args
+    if filters:
+        cmd += ["-filter_complex", ";".join(filters)]
+    cmd += output_args
+
+    print(f"Creating {len(batched)} videos in one batch: {', '.join(events[i]['name'] for i in batched)}")
+    try:
+        with metrics.get_metrics().timer("ffmpeg_seconds", operation="encode_batch"):
+            subprocess.run(cmd, capture_output=True, check=True, text=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        details = f"Exit code: {e.returncode}\nStderr: {e.stderr}" if isinstance(e, subprocess.CalledProcessError) else str(e)
+        print(f"Error creating a batch of {len(batched)} videos with FFmpeg. {details}")
+        print("Encoding the events of the batch one by one...")
+        for i in batched:
+            event = events[i]
+            results[i] = create_video_renditions(event["image_paths"], event["audio_files"], event["rendition_outputs"],
+                                                 silence_duration, threads, output_profile, encoder_profile, loudnorm)
+        return results
+
+    for i in batched:
+        output_paths = events[i]["rendition_outputs"].values()
+        results[i] = all(os.path.exists(p) and os.path.getsize(p) > 0 for p in output_paths)
+        for output_path in output_paths:
+            print(f"Video saved: {output_path}" if results[i] else f"Error: Video missing after the batch: {output_path}")
+    return results
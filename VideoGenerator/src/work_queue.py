@@ -0,0 +1,345 @@
+"""
+This module implements a work queue that lives entirely on a shared filesystem.
+Several render nodes point at the same queue directory and claim event jobs from it
+using lease files, so no central service is needed to split the work between them.
+
+Layout of the queue directory:
+    jobs/<job_id>.json       One file per event job, created exclusively (enqueue is idempotent).
+    leases/<job_id>.lease    Present while a node works on the job. Its mtime is the heartbeat.
+    done/<job_id>.json       Written when a job finishes, successfully or not.
+    attempts/<job_id>        One line per failed attempt, used to give up on broken jobs.
+    settings.json            Run settings written by the first node. Every other node must use the same.
+
+A queue keeps its settings and done records across runs. Jobs whose clips changed since they
+were done are reopened when enqueued again (see reopen_if_changed); reset starts the queue over,
+for example to run it with other settings.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import config
+
+def make_job_id(audio_folder_name, folder):
+    """Builds a stable, filesystem-safe job id for an event folder."""
+    raw_id = f"{audio_folder_name}--{folder}"
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in raw_id)
+
+def default_node_id():
+    """Returns a node id that is unique per process, even on the same machine."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def _write_exclusive(path, data):
+    """
+    Creates a JSON file only if it does not exist yet. Returns True if this call created it.
+    The file is written under a unique temporary name, then hard linked to its final name, so
+    other nodes either see the whole file or none at all.
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    try:
+        os.link(temp_path, path)
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(temp_path)
+    return True
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+class WorkQueue:
+    """
+    A directory-based job queue with leases, heartbeats and reclaiming of expired leases.
+    """
+    def __init__(self, queue_dir, node_id=None, lease_seconds=None, max_attempts=None):
+        self.queue_dir = queue_dir
+        self.node_id = node_id or default_node_id()
+        self.lease_seconds = lease_seconds or config.QUEUE_LEASE_SECONDS
+        self.max_attempts = max_attempts or config.QUEUE_MAX_ATTEMPTS
+        self.jobs_dir = os.path.join(queue_dir, "jobs")
+        self.leases_dir = os.path.join(queue_dir, "leases")
+        self.done_dir = os.path.join(queue_dir, "done")
+        self.attempts_dir = os.path.join(queue_dir, "attempts")
+        for directory in (self.jobs_dir, self.leases_dir, self.done_dir, self.attempts_dir):
+            os.makedirs(directory, exist_ok=True)
+
+        # job_id -> lease token of the leases currently held by this node
+        self._held_leases = {}
+        self._lock = threading.Lock()
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread = None
+
+    # --- Paths ---
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _lease_path(self, job_id):
+        return os.path.join(self.leases_dir, f"{job_id}.lease")
+
+    def _done_path(self, job_id):
+        return os.path.join(self.done_dir, f"{job_id}.json")
+
+    def _attempts_path(self, job_id):
+        return os.path.join(self.attempts_dir, job_id)
+
+    # --- Settings ---
+
+    def share_settings(self, settings):
+        """
+        Stores the run settings if no node has done so yet, and returns the settings
+        every node must use, so all outputs are rendered the same way. Returns None if the
+        settings of the queue cannot be read.
+        """
+        settings_path = os.path.join(self.queue_dir, "settings.json")
+        _write_exclusive(settings_path, settings)
+        return _read_json(settings_path)
+
+    def active_leases(self):
+        """Returns the ids of the jobs whose lease has not expired yet, i.e. that a node is working on."""
+        active = []
+        for lease_name in os.listdir(self.leases_dir):
+            if not lease_name.endswith(".lease"):
+                continue
+            try:
+                lease_age = time.time() - os.path.getmtime(os.path.join(self.leases_dir, lease_name))
+            except FileNotFoundError:
+                continue
+            if lease_age < self.lease_seconds:
+                active.append(lease_name[:-6])
+        return active
+
+    def reset(self):
+        """
+        Removes the settings, jobs, done records and attempts of the queue, so the next node
+        starts it over. Refused (returns False) while a node still holds an unexpired lease.
+        """
+        if self.active_leases():
+            return False
+        for directory in (self.jobs_dir, self.leases_dir, self.done_dir, self.attempts_dir):
+            for name in os.listdir(directory):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+        try:
+            os.remove(os.path.join(self.queue_dir, "settings.json"))
+        except FileNotFoundError:
+            pass
+        return True
+
+    # --- Producer side ---
+
+    def enqueue(self, job_id, payload):
+        """Adds a job. Enqueueing a job that already exists does nothing, so every node can enqueue."""
+        return _write_exclusive(self._job_path(job_id), payload)
+
+    def list_jobs(self):
+        return sorted(f[:-5] for f in os.listdir(self.jobs_dir) if f.endswith(".json"))
+
+    def is_done(self, job_id):
+        return os.path.exists(self._done_path(job_id))
+
+    def reopen_if_changed(self, job_id, inputs_mtime):
+        """
+        Makes a done job claimable again when its inputs were modified after it finished,
+        forgetting its failed attempts. Returns True if the job was reopened.
+        """
+        record = _read_json(self._done_path(job_id))
+        if record is None or record.get("finished_at", 0) >= inputs_mtime:
+            return False
+        for path in (self._done_path(job_id), self._attempts_path(job_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def pending_count(self):
+        """Number of jobs that are not finished yet, including the ones leased by other nodes."""
+        return sum(1 for job_id in self.list_jobs() if not self.is_done(job_id))
+
+    # --- Consumer side ---
+
+    def _try_acquire(self, job_id):
+        token = uuid.uuid4().hex
+        lease = {"node": self.node_id, "token": token, "claimed_at": time.time()}
+        if not _write_exclusive(self._lease_path(job_id), lease):
+            return None
+        # Another node may have finished the job between our done check and the lease creation.
+        if self.is_done(job_id):
+            self._remove_lease(job_id, token)
+            return None
+        return token
+
+    def _reclaim_if_expired(self, job_id):
+        """
+        Removes a lease whose holder stopped sending heartbeats. The lease is first renamed to
+        a name unique to this node, so only one of the nodes racing for it wins the reclaim.
+        """
+        lease_path = self._lease_path(job_id)
+        try:
+            lease_age = time.time() - os.path.getmtime(lease_path)
+        except FileNotFoundError:
+            return True
+        if lease_age < self.lease_seconds:
+            return False
+
+        stale_path = f"{lease_path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return False  # Another node reclaimed it first
+
+        # The holder may have sent a heartbeat right before the rename. In that case, put it back.
+        try:
+            if time.time() - os.path.getmtime(stale_path) < self.lease_seconds:
+                try:
+                    os.link(stale_path, lease_path)
+                except (FileExistsError, OSError):
+                    pass
+                return False
+            previous = _read_json(stale_path) or {}
+            print(f"  Reclaimed expired lease of '{job_id}' from node '{previous.get('node', 'unknown')}'")
+            return True
+        finally:
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
+
+    def claim(self):
+        """
+        Claims the next available job. Returns a (job_id, payload) tuple, or None when
+        no job can be claimed right now.
+        """
+        for job_id in self.list_jobs():
+            if self.is_done(job_id):
+                continue
+            if os.path.exists(self._lease_path(job_id)) and not self._reclaim_if_expired(job_id):
+                continue
+            token = self._try_acquire(job_id)
+            if token is None:
+                continue
+            payload = _read_json(self._job_path(job_id))
+            if payload is None:
+                self._remove_lease(job_id, token)
+                continue
+            with self._lock:
+                self._held_leases[job_id] = token
+            return job_id, payload
+        return None
+
+    def _owns_lease(self, job_id, token):
+        lease = _read_json(self._lease_path(job_id))
+        return lease is not None and lease.get("token") == token
+
+    def _remove_lease(self, job_id, token):
+        if self._owns_lease(job_id, token):
+            try:
+                os.remove(self._lease_path(job_id))
+            except FileNotFoundError:
+                pass
+
+    def complete(self, job_id, result):
+        """Marks a job as finished and releases its lease."""
+        with self._lock:
+            token = self._held_leases.pop(job_id, None)
+        record = {"node": self.node_id, "finished_at": time.time(), "result": result}
+        _write_exclusive(self._done_path(job_id), record)
+        if token:
+            self._remove_lease(job_id, token)
+
+    def fail(self, job_id, error):
+        """
+        Records a failed attempt and releases the lease so another node can retry.
+        After too many attempts the job is marked as done with the error.
+        """
+        with self._lock:
+            token = self._held_leases.pop(job_id, None)
+        with open(self._attempts_path(job_id), "a", encoding="utf-8") as f:
+            f.write(f"{self.node_id}\t{time.time()}\t{error}\n")
+        with open(self._attempts_path(job_id), "r", encoding="utf-8") as f:
+            attempts = sum(1 for _ in f)
+        if attempts >= self.max_attempts:
+            print(f"  Giving up on '{job_id}' after {attempts} failed attempts.")
+            record = {"node": self.node_id, "finished_at": time.time(), "result": {"error": str(error)}}
+            _write_exclusive(self._done_path(job_id), record)
+        if token:
+            self._remove_lease(job_id, token)
+
+    # --- Heartbeats ---
+
+    def _heartbeat_loop(self, interval):
+        while not self._heartbeat_stop.wait(interval):
+            with self._lock:
+                held = list(self._held_leases.items())
+            for job_id, token in held:
+                if self._owns_lease(job_id, token):
+                    try:
+                        os.utime(self._lease_path(job_id), None)
+                    except FileNotFoundError:
+                        pass
+                else:
+                    print(f"  WARNING: Lease on '{job_id}' was lost to another node.")
+                    with self._lock:
+                        self._held_leases.pop(job_id, None)
+
+    def start_heartbeat(self, interval=None):
+        """Starts a background thread that keeps the leases of this node alive."""
+        # Beat several times per lease period, so one late heartbeat never loses a lease.
+        interval = interval or min(config.QUEUE_HEARTBEAT_SECONDS, self.lease_seconds / 3)
+        self._heartbeat_stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, args=(interval,), daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        self._heartbeat_stop.set()
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+
+    def _worker_loop(self, process_job, poll_interval):
+        processed = 0
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                if self.pending_count() == 0:
+                    break
+                # Remaining jobs are leased by other workers; wait in case a lease expires.
+                time.sleep(poll_interval)
+                continue
+            job_id, payload = claimed
+            try:
+                result = process_job(job_id, payload)
+            except Exception as e:
+                print(f"  ✗ Job '{job_id}' failed on node '{self.node_id}': {e}")
+                self.fail(job_id, e)
+                continue
+            self.complete(job_id, result)
+            processed += 1
+        return processed
+
+    def run_worker(self, process_job, poll_interval=None, workers=1):
+        """
+        Claims and processes jobs until the whole queue is finished, using several worker threads.
+        process_job(job_id, payload) returns a JSON-serializable result or raises on failure.
+        Returns the number of jobs processed by this node.
+        """
+        poll_interval = poll_interval or config.QUEUE_POLL_SECONDS
+        self.start_heartbeat()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                futures = [executor.submit(self._worker_loop, process_job, poll_interval) for _ in range(max(1, workers))]
+                return sum(future.result() for future in futures)
+        finally:
+            self.stop_heartbeat()
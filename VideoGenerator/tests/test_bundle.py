@@ -0,0 +1,53 @@
+import os
+import json
+import hashlib
+import zipfile
+import pytest
+from src import bundle, config
+
+def _write_bundle(bundle_path, files):
+    """Writes a bundle whose manifest matches its files, like a well-formed but crafted export."""
+    manifest = {"format_version": config.BUNDLE_FORMAT_VERSION, "files": {}}
+    with zipfile.ZipFile(bundle_path, "w") as archive:
+        for name, data in files.items():
+            manifest["files"][name] = {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+            archive.writestr(name, data)
+        archive.writestr(config.BUNDLE_MANIFEST_NAME, json.dumps(manifest))
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    monkeypatch.setattr(config, "CACHE_DIR", str(directory))
+    return directory
+
+@pytest.mark.parametrize("name", [
+    "../escaped.png",
+    "icon_cache/../../escaped.png",
+    "..\\escaped.png",
+    "icon_cache\\..\\..\\escaped.png",
+    "C:/escaped.png",
+    "C:escaped.png",
+    "/tmp/escaped.png",
+    "link/escaped.png",
+])
+def test_crafted_bundle_is_refused(tmp_path, cache_dir, name):
+    outside_dir = tmp_path / "outside"
+    outside_dir.mkdir()
+    if name.startswith("link/"):
+        # A symlink already in the cache must not let a bundle write through it
+        try:
+            os.symlink(outside_dir, cache_dir / "link")
+        except OSError:
+            pytest.skip("creating symlinks is not allowed here")
+    bundle_path = tmp_path / "crafted.zip"
+    _write_bundle(bundle_path, {"lol_version.json": b"{}", name: b"not an icon"})
+
+    before = sorted(str(p) for p in tmp_path.rglob("*"))
+    assert bundle.import_bundle(str(bundle_path)) is None
+    # Refused as a whole: nothing is written, inside or outside the cache
+    assert sorted(str(p) for p in tmp_path.rglob("*")) == before
+
+def test_cache_names_are_accepted(cache_dir):
+    assert bundle._safe_target("icon_cache/Ahri.png") == os.path.join(str(cache_dir), "icon_cache", "Ahri.png")
+    assert bundle._safe_target("lol_version.json") == os.path.join(str(cache_dir), "lol_version.json")
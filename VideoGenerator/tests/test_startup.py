@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generous for slow CI machines: a lazy start takes well under half a second
+STARTUP_BUDGET_SECONDS = 3.0
+# Runs main.py like 'python main.py ARGS', then writes the names of the imported modules to a file
+RUN_MAIN = """
+import sys, json, runpy
+modules_path = sys.argv.pop(1)
+try:
+    runpy.run_path("main.py", run_name="__main__")
+finally:
+    with open(modules_path, "w") as f:
+        json.dump(sorted(sys.modules), f)
+"""
+
+@pytest.fixture
+def fresh_tree(tmp_path):
+    """A copy of the program without caches or outputs, with one audio folder holding one event."""
+    shutil.copy(os.path.join(REPO_DIR, "main.py"), tmp_path)
+    shutil.copytree(os.path.join(REPO_DIR, "src"), tmp_path / "src", ignore=shutil.ignore_patterns("__pycache__"))
+    event_dir = tmp_path / "audios" / "champion_vo_audio_en" / "Attack_Ahri"
+    event_dir.mkdir(parents=True)
+    (event_dir / "clip.ogg").write_bytes(b"")
+    return tmp_path
+
+def run_main(tree, *args):
+    modules_path = tree / "modules.json"
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", RUN_MAIN, str(modules_path), *args], cwd=tree,
+                               capture_output=True, text=True, stdin=subprocess.DEVNULL, timeout=60)
+    elapsed = time.perf_counter() - start
+    assert completed.returncode == 0, completed.stderr
+    with open(modules_path) as f:
+        return completed.stdout, set(json.load(f)), elapsed
+
+@pytest.mark.parametrize("args", [("--help",), ("--plan-only",)])
+def test_start_is_lazy(fresh_tree, args):
+    output, modules, elapsed = run_main(fresh_tree, *args)
+    assert "requests" not in modules
+    assert "PIL" not in modules
+    # Only loaded by the commands that use them: the audio stores, 'serve' and --render-workers
+    assert "sqlite3" not in modules
+    assert "http.server" not in modules
+    assert "multiprocessing" not in modules
+    assert elapsed < STARTUP_BUDGET_SECONDS
+
+def test_plan_only_touches_nothing(fresh_tree):
+    output, _, _ = run_main(fresh_tree, "--plan-only")
+    assert "Events to encode: 1" in output
+    # Nothing was downloaded, rendered or written
+    assert not (fresh_tree / "output").exists()
+    assert not (fresh_tree / "utils").exists()
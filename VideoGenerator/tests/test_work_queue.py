@@ -0,0 +1,100 @@
+import os
+import time
+import multiprocessing
+from src import work_queue
+
+LEASE_SECONDS = 2
+POLL_SECONDS = 0.2
+
+def _run_node(queue_dir, node_id, results_dir, job_seconds):
+    """Processes queue jobs like a render node, writing one line per processed job."""
+    def process_job(job_id, payload):
+        with open(os.path.join(results_dir, job_id), "a", encoding="utf-8") as f:
+            f.write(f"{node_id}\n")
+        time.sleep(job_seconds)
+        return {"node": node_id}
+    queue = work_queue.WorkQueue(queue_dir, node_id=node_id, lease_seconds=LEASE_SECONDS)
+    queue.run_worker(process_job, poll_interval=POLL_SECONDS, workers=2)
+
+def _start_node(queue_dir, node_id, results_dir, job_seconds=0.05):
+    process = multiprocessing.Process(target=_run_node, args=(queue_dir, node_id, results_dir, job_seconds))
+    process.start()
+    return process
+
+def _processed_by(results_dir, job_id):
+    try:
+        with open(os.path.join(results_dir, job_id), encoding="utf-8") as f:
+            return f.read().split()
+    except FileNotFoundError:
+        return []
+
+def test_every_job_completes_exactly_once(tmp_path):
+    queue_dir, results_dir = str(tmp_path / "queue"), str(tmp_path / "results")
+    os.makedirs(results_dir)
+    queue = work_queue.WorkQueue(queue_dir, lease_seconds=LEASE_SECONDS)
+    job_ids = [work_queue.make_job_id("champion_vo_audio_en", f"Event_{i}") for i in range(24)]
+    for job_id in job_ids:
+        assert queue.enqueue(job_id, {"folder": job_id})
+
+    nodes = [_start_node(queue_dir, f"node-{i}", results_dir) for i in range(4)]
+    for node in nodes:
+        node.join(timeout=60)
+        assert node.exitcode == 0
+
+    assert queue.pending_count() == 0
+    for job_id in job_ids:
+        assert len(_processed_by(results_dir, job_id)) == 1
+    # More than one node took part, so the jobs were really split between processes
+    assert len({node for job_id in job_ids for node in _processed_by(results_dir, job_id)}) > 1
+
+def test_lease_of_killed_node_is_reclaimed(tmp_path):
+    queue_dir, results_dir = str(tmp_path / "queue"), str(tmp_path / "results")
+    os.makedirs(results_dir)
+    queue = work_queue.WorkQueue(queue_dir, lease_seconds=LEASE_SECONDS)
+    job_id = work_queue.make_job_id("champion_vo_audio_en", "Event_0")
+    queue.enqueue(job_id, {"folder": "Event_0"})
+
+    # This node claims the job and never finishes it
+    stuck_node = _start_node(queue_dir, "stuck", results_dir, job_seconds=3600)
+    deadline = time.time() + 30
+    while not _processed_by(results_dir, job_id):
+        assert time.time() < deadline, "the first node never claimed the job"
+        time.sleep(0.05)
+    stuck_node.kill()
+    stuck_node.join()
+    assert not queue.is_done(job_id)
+    assert queue.active_leases() == [job_id]
+
+    rescue_node = _start_node(queue_dir, "rescue", results_dir)
+    rescue_node.join(timeout=60)
+    assert rescue_node.exitcode == 0
+    assert queue.is_done(job_id)
+    assert _processed_by(results_dir, job_id) == ["stuck", "rescue"]
+    assert queue.active_leases() == []
+
+def test_reopen_if_changed_and_reset(tmp_path):
+    queue = work_queue.WorkQueue(str(tmp_path / "queue"), lease_seconds=LEASE_SECONDS)
+    queue.enqueue("job", {})
+    assert queue.share_settings({"silence_duration": 0.0}) == {"silence_duration": 0.0}
+    assert queue.share_settings({"silence_duration": 1.0}) == {"silence_duration": 0.0}
+    queue.complete("job", {})
+
+    assert not queue.reopen_if_changed("job", time.time() - 60)
+    assert queue.reopen_if_changed("job", time.time() + 60)
+    assert not queue.is_done("job")
+
+    assert queue.claim() == ("job", {})
+    assert not queue.reset()  # A node still holds a lease
+    queue.complete("job", {})
+    assert queue.reset()
+    assert queue.list_jobs() == []
+    assert queue.share_settings({"silence_duration": 1.0}) == {"silence_duration": 1.0}
+
+def test_unreadable_settings_are_not_replaced(tmp_path):
+    queue = work_queue.WorkQueue(str(tmp_path / "queue"), lease_seconds=LEASE_SECONDS)
+    (tmp_path / "queue" / "settings.json").write_text("")
+    assert queue.share_settings({"silence_duration": 1.0}) is None
+    # Files are published whole, and no temporary file is left behind
+    assert queue.enqueue("job", {"folder": "Event_0"})
+    assert not queue.enqueue("job", {"folder": "Other"})
+    assert sorted(os.listdir(tmp_path / "queue" / "jobs")) == ["job.json"]